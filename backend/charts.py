@@ -4,11 +4,29 @@
 import os
 import sqlite3
 import time
-import sys
-from itertools import zip_longest
+import gzip
+import shutil
+import tempfile
+import threading
+import copy
+from collections import deque
+from contextlib import contextmanager
 import numpy
 from cleep.core import CleepModule
 from cleep.exception import CommandError, MissingParameter, InvalidParameter
+from cleep.libs.internals.task import Task
+from .chartsmetrics import ChartsMetrics
+from .chartsprocessing import (
+    average_data,
+    compute_state_durations,
+    compute_stats,
+    compute_time_weights,
+    fill_grid,
+    lttb_data,
+    split_buckets,
+    to_array,
+    transform_data,
+)
 
 __all__ = ["Charts"]
 
@@ -34,12 +52,41 @@ class Charts(CleepModule):
     MODULE_URLSITE = None
     MODULE_URLBUGS = "https://github.com/CleepDevice/cleepapp-charts/issues"
     MODULE_CONFIG_FILE = "charts.conf"
+    DEFAULT_CONFIG = {
+        "metrics_log_interval": 0,
+        "slow_query_threshold": 500,
+        "ingestion_policies": {},
+        "rate_limits": {},
+    }
 
     DATABASE_PATH = "/etc/cleep/charts"
     DATABASE_NAME = "charts.db"
     # for tests only set to False, to avoid exception during session closing
     CHECK_SAME_THREAD = True
-    MAX_DATA_SIZE = 1000000  # in bytes
+    MAX_POINTS = 5000  # default max number of rows returned by get_data
+    VALUE_SIZE = 18  # estimated size of a serialized value (in bytes)
+    POINTS_PER_PIXEL = 2  # max number of rows returned by pixel of chart width
+    # number of sqlite virtual machine instructions between request timeout checks
+    TIMEOUT_CHECK_STEPS = 1000
+    # data is averaged in sql if estimated rows count is greater than max points times this factor
+    SQL_AVERAGE_FACTOR = 4
+    IMPORT_CHUNK_SIZE = 10000  # in rows
+    IMPORT_CHUNK_BYTES = 1048576  # in bytes
+    BACKUP_STEP_PAGES = 256  # number of pages copied between each backup step
+    BACKUP_STEP_SLEEP = 0.05  # in seconds
+    BACKUP_STOP_TIMEOUT = 5.0  # seconds module stop waits for cancelled backup
+    SLOW_QUERIES_SIZE = 50  # number of slow queries kept
+    RATE_LIMIT_AGGREGATIONS = ["last", "mean", "min", "max"]
+    # interval of aggregated values flush, so values of quiet devices are stored too (in seconds)
+    FLUSH_TASK_INTERVAL = 10
+    FLUSH_DATABASE_TIMEOUT = (
+        1.0  # seconds flush task waits for database locked by module
+    )
+    DATA_AGGREGATIONS = ["sum", "avg", "min", "max", "last", "duration"]
+    ALIGNED_DATA_FILLS = ["none", "previous", "linear"]
+    # estimated size of a data row excluding uuid and values (record header, id,
+    # timestamp and index entries)
+    ROW_OVERHEAD_SIZE = 40  # in bytes
 
     def __init__(self, bootstrap, debug_enabled):
         """
@@ -53,8 +100,32 @@ class Charts(CleepModule):
         CleepModule.__init__(self, bootstrap, debug_enabled)
 
         # member
+        self._database_path = None
         self._cnx = None
         self._cur = None
+        self._backup_thread = None
+        self._backup_cancel = threading.Event()
+        self._metrics = ChartsMetrics()
+        self._metrics_task = None
+        self._flush_task = None
+        self._slow_queries = deque(maxlen=Charts.SLOW_QUERIES_SIZE)
+        # last values received by device (used by ingestion policies)
+        self._last_values = {}
+        # values aggregated by device until rate limit interval is elapsed
+        self._aggregated_values = {}
+        # protect values storage from events and from flush task
+        self._events_lock = threading.RLock()
+        # config copies (config field getter deep copies config on each call)
+        self._ingestion_policies = {}
+        self._rate_limits = {}
+        self._slow_query_threshold = 0
+        self._backup_status = {
+            "running": False,
+            "path": None,
+            "progress": 0,
+            "error": None,
+            "timestamp": None,
+        }
 
         # make sure database path exists
         if not os.path.exists(Charts.DATABASE_PATH):  # pragma: no cover
@@ -71,15 +142,40 @@ class Charts(CleepModule):
             self._init_database()
 
         self.logger.debug('Connect to database "%s"', database_path)
+        self._database_path = database_path
         self._cnx = sqlite3.connect(
             database_path, check_same_thread=Charts.CHECK_SAME_THREAD
         )
         self._cur = self._cnx.cursor()
+        self.__migrate_database()
+
+        self._ingestion_policies = self._get_config_field("ingestion_policies")
+        self._rate_limits = self._get_config_field("rate_limits")
+        self._slow_query_threshold = self._get_config_field("slow_query_threshold")
+
+    def _on_start(self):
+        """
+        Start module
+        """
+        self.__start_metrics_task()
+        self._flush_task = Task(
+            Charts.FLUSH_TASK_INTERVAL, self._flush_aggregated_values_task, self.logger
+        )
+        self._flush_task.start()
 
     def _on_stop(self):
         """
         Stop module
         """
+        if self._metrics_task:
+            self._metrics_task.stop()
+        if self._flush_task:
+            self._flush_task.stop()
+        if self._cnx:
+            self._flush_aggregated_values()
+        if self._backup_thread:
+            self._backup_cancel.set()
+            self._backup_thread.join(Charts.BACKUP_STOP_TIMEOUT)
         if self._cnx:
             self._cnx.close()
 
@@ -125,8 +221,7 @@ class Charts(CleepModule):
         cur.execute(
             "CREATE TABLE data1(id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE, timestamp INTEGER, uuid TEXT, value1 NUMBER);"
         )
-        cur.execute("CREATE INDEX data1_device_index ON data1(uuid);")
-        cur.execute("CREATE INDEX data1_timestamp_index ON data1(timestamp);")
+        self.__create_data_indexes(cur, "data1")
 
         # create data2 table (contains 2 fields to store values, typically gps positions, temperature (C° and F°))
         cur.execute(
@@ -139,8 +234,7 @@ class Charts(CleepModule):
                 "value2 NUMBER);"
             )
         )
-        cur.execute("CREATE INDEX data2_device_index ON data2(uuid);")
-        cur.execute("CREATE INDEX data2_timestamp_index ON data2(timestamp);")
+        self.__create_data_indexes(cur, "data2")
 
         # create data3 table (contains 3 fields to store values)
         cur.execute(
@@ -154,8 +248,7 @@ class Charts(CleepModule):
                 "value3 NUMBER);"
             )
         )
-        cur.execute("CREATE INDEX data3_device_index ON data3(uuid);")
-        cur.execute("CREATE INDEX data3_timestamp_index ON data3(timestamp);")
+        self.__create_data_indexes(cur, "data3")
 
         # create data4 table (contains 4 fields to store values)
         cur.execute(
@@ -170,12 +263,121 @@ class Charts(CleepModule):
                 "value4 NUMBER);"
             )
         )
-        cur.execute("CREATE INDEX data4_device_index ON data4(uuid);")
-        cur.execute("CREATE INDEX data4_timestamp_index ON data4(timestamp);")
+        self.__create_data_indexes(cur, "data4")
+
+        # create storage tables
+        self.__create_storage_table(cur)
+        self.__create_hourly_counts_table(cur)
 
         cnx.commit()
         cnx.close()
 
+    def __create_storage_table(self, cursor):
+        """
+        Create storage table (device storage infos maintained at each data change)
+        format:
+         - uuid: device uuid (primary key)
+         - rowscount: number of rows stored for the device
+         - firsttimestamp: timestamp of first stored row
+         - lasttimestamp: timestamp of last stored row
+
+        Args:
+            cursor (Cursor): database cursor
+        """
+        cursor.execute(
+            (
+                "CREATE TABLE storage("
+                "uuid TEXT PRIMARY KEY UNIQUE, "
+                "rowscount INTEGER, "
+                "firsttimestamp INTEGER, "
+                "lasttimestamp INTEGER);"
+            )
+        )
+
+    def __create_hourly_counts_table(self, cursor):
+        """
+        Create hourly counts table (number of rows of each device per hour, maintained at
+        each data change)
+        format:
+         - uuid: device uuid
+         - hour: hour number (timestamp // 3600)
+         - rowscount: number of rows stored for the device during hour
+
+        Args:
+            cursor (Cursor): database cursor
+        """
+        cursor.execute(
+            (
+                "CREATE TABLE hourlycounts("
+                "uuid TEXT, "
+                "hour INTEGER, "
+                "rowscount INTEGER, "
+                "PRIMARY KEY(uuid, hour));"
+            )
+        )
+
+    def __migrate_database(self):
+        """
+        Migrate database created by older module versions
+        """
+        self._cur.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='storage'"
+        )
+        if self._cur.fetchone() is None:
+            # one-time migration: fill storage table from existing data
+            self.logger.info("Migrate database: create storage table")
+            self.__create_storage_table(self._cur)
+            for values_count in range(1, 5):
+                self._cur.execute(
+                    (
+                        "INSERT INTO storage(uuid, rowscount, firsttimestamp, lasttimestamp) "
+                        f"SELECT uuid, COUNT(*), MIN(timestamp), MAX(timestamp) FROM data{values_count} GROUP BY uuid"
+                    )
+                )
+            self._cnx.commit()
+
+        self._cur.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='hourlycounts'"
+        )
+        if self._cur.fetchone() is None:
+            # one-time migration: fill hourly counts table from existing data
+            self.logger.info("Migrate database: create hourly counts table")
+            self.__create_hourly_counts_table(self._cur)
+            for values_count in range(1, 5):
+                self._cur.execute(
+                    (
+                        "INSERT INTO hourlycounts(uuid, hour, rowscount) "
+                        f"SELECT uuid, timestamp/3600, COUNT(*) FROM data{values_count} GROUP BY uuid, timestamp/3600"
+                    )
+                )
+            self._cnx.commit()
+
+    def __create_data_indexes(self, cursor, table_name):
+        """
+        Create indexes of specified data table
+
+        Args:
+            cursor (Cursor): database cursor
+            table_name (string): data table name (data1, data2...)
+        """
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table_name}_device_index ON {table_name}(uuid);"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table_name}_timestamp_index ON {table_name}(timestamp);"
+        )
+
+    def __drop_data_indexes(self, cursor, table_name):
+        """
+        Drop indexes of specified data table
+
+        Args:
+            cursor (Cursor): database cursor
+            table_name (string): data table name (data1, data2...)
+        """
+        cursor.execute(f"DROP INDEX IF EXISTS {table_name}_device_index;")
+        cursor.execute(f"DROP INDEX IF EXISTS {table_name}_timestamp_index;")
+
     def __restore_field_name(self, current_field, fields):
         """
         Restore field name as stored in database
@@ -196,7 +398,7 @@ class Charts(CleepModule):
             # field name not found
             return current_field
 
-    def _save_data(self, device_uuid, event, values):
+    def _save_data(self, device_uuid, event, values, timestamp=None, cnx=None):
         """
         Save data into database
 
@@ -204,6 +406,9 @@ class Charts(CleepModule):
             device_uuid (string): device uuid
             event (string): event name
             values (list): values to save (must be an list of dict(<field>,<value>))
+            timestamp (int): values timestamp. Current time if not specified
+            cnx (Connection): connection to save data with, caller commits changes. Module
+                              connection is used and changes are committed if not specified
 
         Raises:
             InvalidParameter: if invalid parameter is specified
@@ -237,18 +442,21 @@ class Charts(CleepModule):
                 return value
             return 1 if value is True else 0
 
+        cursor = self._cur if cnx is None else cnx.cursor()
+
         # save device_uuid infos at first insert
-        self._cur.execute("SELECT * FROM devices WHERE uuid=?", (device_uuid,))
-        row = self._cur.fetchone()
+        with self._metrics.timer("save_data.lookup"):
+            cursor.execute("SELECT * FROM devices WHERE uuid=?", (device_uuid,))
+            row = cursor.fetchone()
         if row is None:
             # no infos yet, insert new entry for this device
             if len(values) == 1:
-                self._cur.execute(
+                cursor.execute(
                     "INSERT INTO devices(uuid, event, valuescount, value1) VALUES(?,?,?,?)",
                     (device_uuid, event, len(values), values[0]["field"]),
                 )
             elif len(values) == 2:
-                self._cur.execute(
+                cursor.execute(
                     "INSERT INTO devices(uuid, event, valuescount, value1, value2) VALUES(?,?,?,?,?)",
                     (
                         device_uuid,
@@ -259,7 +467,7 @@ class Charts(CleepModule):
                     ),
                 )
             elif len(values) == 3:
-                self._cur.execute(
+                cursor.execute(
                     "INSERT INTO devices(uuid, event, valuescount, value1, value2, value3) VALUES(?,?,?,?,?,?)",
                     (
                         device_uuid,
@@ -271,7 +479,7 @@ class Charts(CleepModule):
                     ),
                 )
             elif len(values) == 4:
-                self._cur.execute(
+                cursor.execute(
                     "INSERT INTO devices(uuid, event, valuescount, value1, value2, value3, value4) VALUES(?,?,?,?,?,?,?)",
                     (
                         device_uuid,
@@ -286,7 +494,7 @@ class Charts(CleepModule):
         else:
             # entry exists, check it
             infos = dict(
-                (self._cur.description[i][0], value) for i, value in enumerate(row)
+                (cursor.description[i][0], value) for i, value in enumerate(row)
             )
             if infos["event"] != event:
                 raise CommandError(
@@ -298,47 +506,76 @@ class Charts(CleepModule):
                 )
 
         # save values
-        if len(values) == 1:
-            self._cur.execute(
-                "INSERT INTO data1(timestamp, uuid, value1) values(?,?,?)",
-                (int(time.time()), device_uuid, get_value(values[0]["value"])),
-            )
-        elif len(values) == 2:
-            self._cur.execute(
-                "INSERT INTO data2(timestamp, uuid, value1, value2) values(?,?,?,?)",
-                (
-                    int(time.time()),
-                    device_uuid,
-                    get_value(values[0]["value"]),
-                    get_value(values[1]["value"]),
-                ),
-            )
-        elif len(values) == 3:
-            self._cur.execute(
-                "INSERT INTO data3(timestamp, uuid, value1, value2, value3) values(?,?,?,?,?)",
-                (
-                    int(time.time()),
-                    device_uuid,
-                    get_value(values[0]["value"]),
-                    get_value(values[1]["value"]),
-                    get_value(values[2]["value"]),
-                ),
+        if timestamp is None:
+            timestamp = int(time.time())
+        with self._metrics.timer("save_data.insert"):
+            if len(values) == 1:
+                cursor.execute(
+                    "INSERT INTO data1(timestamp, uuid, value1) values(?,?,?)",
+                    (timestamp, device_uuid, get_value(values[0]["value"])),
+                )
+            elif len(values) == 2:
+                cursor.execute(
+                    "INSERT INTO data2(timestamp, uuid, value1, value2) values(?,?,?,?)",
+                    (
+                        timestamp,
+                        device_uuid,
+                        get_value(values[0]["value"]),
+                        get_value(values[1]["value"]),
+                    ),
+                )
+            elif len(values) == 3:
+                cursor.execute(
+                    "INSERT INTO data3(timestamp, uuid, value1, value2, value3) values(?,?,?,?,?)",
+                    (
+                        timestamp,
+                        device_uuid,
+                        get_value(values[0]["value"]),
+                        get_value(values[1]["value"]),
+                        get_value(values[2]["value"]),
+                    ),
+                )
+            elif len(values) == 4:
+                cursor.execute(
+                    "INSERT INTO data4(timestamp, uuid, value1, value2, value3, value4) values(?,?,?,?,?,?)",
+                    (
+                        timestamp,
+                        device_uuid,
+                        get_value(values[0]["value"]),
+                        get_value(values[1]["value"]),
+                        get_value(values[2]["value"]),
+                        get_value(values[3]["value"]),
+                    ),
+                )
+
+            # update device storage infos
+            cursor.execute(
+                # first timestamp is null after all device rows were purged
+                "UPDATE storage SET rowscount=rowscount+1, "
+                "firsttimestamp=COALESCE(MIN(firsttimestamp, ?), ?), "
+                "lasttimestamp=COALESCE(MAX(lasttimestamp, ?), ?) WHERE uuid=?",
+                (timestamp, timestamp, timestamp, timestamp, device_uuid),
             )
-        elif len(values) == 4:
-            self._cur.execute(
-                "INSERT INTO data4(timestamp, uuid, value1, value2, value3, value4) values(?,?,?,?,?,?)",
-                (
-                    int(time.time()),
-                    device_uuid,
-                    get_value(values[0]["value"]),
-                    get_value(values[1]["value"]),
-                    get_value(values[2]["value"]),
-                    get_value(values[3]["value"]),
-                ),
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO storage(uuid, rowscount, firsttimestamp, lasttimestamp) VALUES(?,?,?,?)",
+                    (device_uuid, 1, timestamp, timestamp),
+                )
+            cursor.execute(
+                "UPDATE hourlycounts SET rowscount=rowscount+1 WHERE uuid=? AND hour=?",
+                (device_uuid, timestamp // 3600),
             )
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO hourlycounts(uuid, hour, rowscount) VALUES(?,?,?)",
+                    (device_uuid, timestamp // 3600, 1),
+                )
 
         # commit changes
-        self._cnx.commit()
+        if cnx is None:
+            with self._metrics.timer("save_data.commit"):
+                self._cnx.commit()
+        self._metrics.increment("rows.inserted")
 
         return True
 
@@ -371,32 +608,41 @@ class Charts(CleepModule):
             raise CommandError(f"Device {device_uuid} not found!")
         return dict((self._cur.description[i][0], value) for i, value in enumerate(row))
 
-    def _average_data(self, data, column_size):
+    def __get_device_columns(self, infos, fields):
         """
-        Average data
+        Return device data columns according to requested fields
 
         Args:
-            data (list): list of values
-            column_size (int): number of columns
-        """
-        self.logger.debug('Before average: %s', len(data))
-        # compute reduce factor according to variable memory size
-        factor = int(round(sys.getsizeof(data) / self.MAX_DATA_SIZE))
-        if factor <= 0:
-            # no average needed, return specified data
-            self.logger.debug("No data average computation needed")
-            return data
+            infos (dict): device infos (see __get_device_infos)
+            fields (list): list of field names. All device fields if empty
 
-        # group and average data
-        args = [iter(data)] * factor
-        # cast to int ? return [numpy.nanmean(v, axis=0).astype(int).tolist() for v in ...
-        new_data = [
-            numpy.nanmean(v, axis=0).tolist()
-            for v in list(zip_longest(*args, fillvalue=[numpy.nan] * column_size))
-        ]
-        self.logger.debug('After average: %s', len(new_data))
+        Returns:
+            tuple: list of data table columns and list of names (first one is always "timestamp")
+        """
+        columns = []
+        names = ["timestamp"]
+        if len(fields) == 0:
+            # no field filtered, add all existing fields
+            columns.append("value1")
+            names.append(infos["value1"])
+            if infos["value2"] is not None:
+                columns.append("value2")
+                names.append(infos["value2"])
+            if infos["value3"] is not None:
+                columns.append("value3")
+                names.append(infos["value3"])
+            if infos["value4"] is not None:
+                columns.append("value4")
+                names.append(infos["value4"])
+        else:
+            # get column associated to field name
+            for field in fields:
+                for (key, value) in infos.items():
+                    if key.startswith("value") and value == field:
+                        columns.append(key)
+                        names.append(field)
 
-        return new_data
+        return columns, names
 
     def get_data(self, device_uuid, timestamp_start, timestamp_end, options=None):
         """
@@ -415,6 +661,35 @@ class Charts(CleepModule):
                     limit (int): limit number
                     average (bool): return average data instead of all ones (default True).
                                     Can't work if data other than numbers are stored.
+                    max_points (int): max number of rows returned when average is enabled
+                                      (default MAX_POINTS). Consecutive rows are averaged to
+                                      reduce data (by time groups directly in database for
+                                      ranges much larger than max_points).
+                    max_bytes (int): max estimated size of returned data when average is enabled.
+                                     Number of rows is reduced further if needed.
+                    width (int): chart width in pixels. Number of rows is reduced further to
+                                 POINTS_PER_PIXEL points per pixel if needed.
+                    pixel_ratio (float): device pixel ratio of chart display (default 1)
+                    reduction (string): 'average' to average consecutive rows (default), 'lttb' to
+                                        select rows keeping chart shape (largest triangle three
+                                        buckets). Used when rows must be reduced.
+                    transform (string): return values derived from counter values ('delta'|'rate').
+                                        Delta is value increase since previous value, rate is
+                                        delta per second. Counter resets are handled.
+                    bucket (int): aggregate data per time bucket of specified seconds. Values are
+                                  averaged, deltas are summed and rates are computed over bucket.
+                                  Average option is ignored when bucket is specified.
+                    average_mode (string): 'sample' to average values with same weight (default),
+                                           'time' to weight each value by the time it was valid
+                                           (for sensors reporting on change).
+                    timeout (float): seconds the client waits for response. Request is abandoned
+                                     (query interrupted) once elapsed.
+                    aggregate (string): return a single value per field computed over range
+                                        ('sum'|'avg'|'min'|'max'|'last'|'duration'). Duration is
+                                        the number of seconds the value was not 0 (time in state
+                                        of boolean devices, computed like get_state_durations,
+                                        from last value before range). Data is then a dict
+                                        {field: {name, value}} whatever output option.
                 }
 
         Returns:
@@ -425,11 +700,13 @@ class Charts(CleepModule):
                     event (string): event name
                     names (list): list of column names
                     data (list|dict): content can be a list or a dict according to options.output value
+                    averaged (bool): True if rows were reduced (averaged or selected) to respect max_points
                 }
 
         Raises:
             InvalidParameter: if invalid parameter is specified
             MissingParameter: if parameter is missing
+            CommandError: if request timed out
         """
         # check parameters
         if device_uuid is None or len(device_uuid) == 0:
@@ -443,273 +720,2149 @@ class Charts(CleepModule):
         if timestamp_end < 0:
             raise InvalidParameter("Timestamp_end value must be positive")
 
+        self.__flush_before_read()
+
         # prepare options
-        options_fields = []
-        options_output = "dict"
-        options_sort = "asc"
-        options_limit = ""
-        options_average = True
-        if options is not None:
-            if "fields" in options:
-                options_fields = options["fields"]
-            if "output" in options and options["output"] in ("list", "dict"):
-                options_output = options["output"]
-            if "sort" in options and options["sort"] in ("asc", "desc"):
-                options_sort = options["sort"]
-            if "limit" in options and isinstance(options["limit"], int):
-                options_limit = f"LIMIT {options['limit']}"
-            if "average" in options and isinstance(options["average"], bool):
-                options_average = options["average"]
-        self.logger.trace(
-            "options: fields=%s output=%s sort=%s limit=%s average=%s",
-            options_fields,
-            options_output,
-            options_sort,
-            options_limit,
-            options_average,
-        )
+        data_options = self.__get_data_options(options)
+        self.logger.trace("options: %s", data_options)
 
         # get device infos
         infos = self.__get_device_infos(device_uuid)
         self.logger.trace("infos=%s", infos)
-
-        # prepare query options
-        columns = []
-        names = ["timestamp"]
-        if len(options_fields) == 0:
-            # no field filtered, add all existing fields
-            columns.append("value1")
-            names.append(infos["value1"])
-            if infos["value2"] is not None:
-                columns.append("value2")
-                names.append(infos["value2"])
-            if infos["value3"] is not None:
-                columns.append("value3")
-                names.append(infos["value3"])
-            if infos["value4"] is not None:
-                columns.append("value4")
-                names.append(infos["value4"])
-        else:
-            # get column associated to field name
-            for options_field in options_fields:
-                for (key, value) in infos.items():
-                    if key.startswith("value") and value == options_field:
-                        columns.append(key)
-                        names.append(options_field)
+        columns, names = self.__get_device_columns(infos, data_options["fields"])
+
+        if data_options["aggregate"]:
+            return {
+                "uuid": device_uuid,
+                "event": infos["event"],
+                "names": names,
+                "data": self.__aggregate_range(
+                    device_uuid,
+                    infos,
+                    columns,
+                    timestamp_start,
+                    timestamp_end,
+                    data_options["aggregate"],
+                    data_options["deadline"],
+                ),
+                "averaged": True,
+            }
 
         # get device data for each request columns
-        data = None
-        if options_output == "dict":
-            # output as dict
-            columns_str = ",".join(["timestamp"] + columns)
-            table_str = f"data{infos['valuescount']}"
-            query = f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? ORDER BY timestamp {options_sort} {options_limit}"
-            self.logger.debug("Select query: %s", query)
-            self._cur.execute(query, (device_uuid, timestamp_start, timestamp_end))
-            # @see http://stackoverflow.com/a/3287775
-            results = self._cur.fetchall()
-            values = (
-                self._average_data(results, len(columns))
-                if options_average
-                else results
-            )
-            data = [
-                dict(
-                    (
-                        self.__restore_field_name(self._cur.description[i][0], infos),
-                        value,
-                    )
-                    for i, value in enumerate(row)
-                )
-                for row in values
-            ]
-
-        else:
-            # output as list
-            data = {}
-            columns_str = ",".join(["timestamp"] + columns)
-            table_str = f"data{infos['valuescount']}"
-            query = f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? ORDER BY timestamp {options_sort} {options_limit}"
-            self.logger.debug("Select query: %s", query)
-            self._cur.execute(query, (device_uuid, timestamp_start, timestamp_end))
-            values = self._average_data(self._cur.fetchall(), len(columns)) if options_average else self._cur.fetchall()
-            for index, column in enumerate(columns):
-                data[infos[column]] = {
-                    "name": infos[column],
-                    "values": [(val[0], val[index+1]) for val in values],
-                }
+        data_options["max_points"] = self.__get_max_points(names, data_options)
+        fields, values, sql_averaged = self.__query_data(
+            device_uuid, infos, columns, timestamp_start, timestamp_end, data_options
+        )
+        with self._metrics.timer("get_data.average"):
+            values, reduced = self.__reduce_data(
+                values, len(columns), timestamp_start, timestamp_end, data_options
+            )
+        with self._metrics.timer("get_data.format"):
+            data = self.__format_data(
+                values, fields, columns, infos, data_options["output"]
+            )
 
         return {
             "uuid": device_uuid,
             "event": infos["event"],
             "names": names,
             "data": data,
+            "averaged": sql_averaged or reduced,
         }
 
-    def purge_data(self, device_uuid, timestamp_until):
+    def __get_data_options(self, options):
         """
-        Purge device data until specified time
+        Return get_data options, default values are used for missing and invalid options
 
         Args:
-            device_uuid (string): device uuid (string)
-            timestamp_until (int): timestamp to delete data before (int)
+            options (dict): get_data options (see get_data). Can be None
 
         Returns:
-            bool: always True
-
-        Raises:
-            MissingParameter: if parameter is missing
-            InvalidParameter: if invalid parameter is specified
+            dict: all get_data options, plus deadline (time.monotonic value request is abandoned
+                  at, None if no timeout)
         """
-        # check parameters
-        if device_uuid is None or len(device_uuid) == 0:
-            raise MissingParameter('Parameter "device_uuid" is missing')
-        if timestamp_until is None:
-            raise MissingParameter('Parameter "timestamp_until" is missing')
-        if timestamp_until < 0:
-            raise InvalidParameter("Timestamp_until value must be positive")
 
-        # get device infos
-        infos = self.__get_device_infos(device_uuid)
-        self.logger.debug("infos=%s", infos)
+        def is_positive_int(value):
+            return isinstance(value, int) and not isinstance(value, bool) and value > 0
 
-        # prepare query parameters
-        tablename = ""
-        if infos["valuescount"] == 1:
-            tablename = "data1"
-        if infos["valuescount"] == 2:
-            tablename = "data2"
-        if infos["valuescount"] == 3:
-            tablename = "data3"
-        if infos["valuescount"] == 4:
-            tablename = "data4"
+        def is_positive_number(value):
+            return (
+                isinstance(value, (int, float))
+                and not isinstance(value, bool)
+                and value > 0
+            )
 
-        # prepare sql query
-        query = f"DELETE FROM {tablename} WHERE uuid=? AND timestamp<?"
-        self.logger.debug(
-            "Purge query: %s with device_uuid=%s, timestamp=%s",
-            query,
-            device_uuid,
-            timestamp_until,
+        # option name: (default value, validator of specified value)
+        specs = {
+            "fields": ([], lambda value: isinstance(value, list)),
+            "output": ("dict", lambda value: value in ("list", "dict")),
+            "sort": ("asc", lambda value: value in ("asc", "desc")),
+            "limit": (None, lambda value: isinstance(value, int)),
+            "average": (True, lambda value: isinstance(value, bool)),
+            "transform": (None, lambda value: value in ("delta", "rate")),
+            "bucket": (None, is_positive_int),
+            "average_mode": ("sample", lambda value: value in ("sample", "time")),
+            "max_points": (self.MAX_POINTS, is_positive_int),
+            "max_bytes": (None, is_positive_int),
+            "width": (None, is_positive_int),
+            "pixel_ratio": (1, is_positive_number),
+            "reduction": ("average", lambda value: value in ("average", "lttb")),
+            "timeout": (None, is_positive_number),
+            "aggregate": (None, lambda value: value in Charts.DATA_AGGREGATIONS),
+        }
+        data_options = {name: default for name, (default, _) in specs.items()}
+        for name, value in (options or {}).items():
+            if name in specs and specs[name][1](value):
+                data_options[name] = value
+        data_options["deadline"] = (
+            None
+            if data_options["timeout"] is None
+            else time.monotonic() + data_options["timeout"]
         )
 
-        # execute query
-        self._cur.execute(query, (device_uuid, timestamp_until))
-        self._cnx.commit()
+        return data_options
 
-        return True
+    def __get_max_points(self, names, data_options):
+        """
+        Return max number of rows returned by get_data: max_points option, reduced according to
+        max_bytes and width options
 
-    def _delete_device(self, device_uuid):
+        Args:
+            names (list): column names (timestamp first)
+            data_options (dict): get_data options (see __get_data_options)
+
+        Returns:
+            int: max number of rows
         """
-        Delete device from database
+        max_points = data_options["max_points"]
+        if data_options["max_bytes"] is not None:
+            row_size = self.__estimate_row_size(names, data_options["output"])
+            max_points = max(1, min(max_points, data_options["max_bytes"] // row_size))
+        if data_options["width"] is not None:
+            pixels = data_options["width"] * data_options["pixel_ratio"]
+            max_points = min(max_points, max(1, int(pixels * Charts.POINTS_PER_PIXEL)))
+
+        return max_points
+
+    def __query_data(
+        self, device_uuid, infos, columns, timestamp_start, timestamp_end, data_options
+    ):
+        """
+        Query device data of specified range
 
         Args:
             device_uuid (string): device uuid
+            infos (dict): device infos (see __get_device_infos)
+            columns (list): data table columns
+            timestamp_start (int): range start timestamp
+            timestamp_end (int): range end timestamp
+            data_options (dict): get_data options (see __get_data_options)
 
         Returns:
-            bool: always True
+            tuple: list of field names, list of rows and True if rows were averaged in database
 
         Raises:
-            MissingParameter: if parameter is missing
+            CommandError: if request timed out
         """
-        # check parameters
-        if device_uuid is None or len(device_uuid) == 0:
-            raise MissingParameter('Parameter "device_uuid" is missing')
+        groups = self.__get_average_groups(
+            device_uuid, timestamp_start, timestamp_end, data_options
+        )
+        table_str = f"data{infos['valuescount']}"
+        params = (device_uuid, timestamp_start, timestamp_end)
+        if groups:
+            # average rows by time groups
+            columns_str = ",".join(
+                f"AVG({column}) AS {column}" for column in ["timestamp"] + columns
+            )
+            query = (
+                f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? "
+                f"GROUP BY (timestamp-?)/? ORDER BY MIN(timestamp) {data_options['sort']}"
+            )
+            params += groups
+            self._metrics.increment("queries.sql_averaged")
+        else:
+            columns_str = ",".join(["timestamp"] + columns)
+            query = (
+                f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? "
+                f"ORDER BY timestamp {data_options['sort']}"
+            )
+            if data_options["limit"] is not None:
+                query += " LIMIT ?"
+                params += (data_options["limit"],)
+        self.logger.debug("Select query: %s", query)
+
+        query_start = time.perf_counter()
+        with self.__interrupt_after(data_options["deadline"]):
+            with self._metrics.timer("get_data.query"):
+                self._cur.execute(query, params)
+            # @see http://stackoverflow.com/a/3287775
+            fields = [
+                self.__restore_field_name(description[0], infos)
+                for description in self._cur.description
+            ]
+            with self._metrics.timer("get_data.fetch"):
+                values = self._cur.fetchall()
+        self._metrics.increment("rows.fetched", len(values))
+        self.__log_slow_query(query, params, query_start, len(values))
+        if (
+            data_options["deadline"] is not None
+            and time.monotonic() > data_options["deadline"]
+        ):
+            # client stopped waiting, don't process data for nothing
+            self._metrics.increment("queries.interrupted")
+            raise CommandError("Request timed out")
 
-        # get device infos
-        infos = self.__get_device_infos(device_uuid)
-        self.logger.debug("infos=%s", infos)
+        return fields, values, groups is not None
 
-        # prepare query parameters
-        tablename = ""
-        if infos["valuescount"] == 1:
-            tablename = "data1"
-        if infos["valuescount"] == 2:
-            tablename = "data2"
-        if infos["valuescount"] == 3:
-            tablename = "data3"
-        if infos["valuescount"] == 4:
-            tablename = "data4"
+    def __get_average_groups(
+        self, device_uuid, timestamp_start, timestamp_end, data_options
+    ):
+        """
+        Return time groups to average rows by in database. Huge ranges that would be averaged
+        anyway are averaged in database, decision is taken on estimated number of rows.
 
-        # delete device data
-        query = f"DELETE FROM {tablename} WHERE uuid=?"
-        self.logger.debug("Data query: %s", query)
-        self._cur.execute(query, (device_uuid,))
-        self._cnx.commit()
+        Args:
+            device_uuid (string): device uuid
+            timestamp_start (int): range start timestamp
+            timestamp_end (int): range end timestamp
+            data_options (dict): get_data options (see __get_data_options)
 
-        # delete device entry
-        query = "DELETE FROM devices WHERE uuid=?"
-        self.logger.debug("Devices query: %s", query)
-        self._cur.execute(query, (device_uuid,))
-        self._cnx.commit()
+        Returns:
+            tuple: first group start timestamp and group duration (less groups than max points).
+                   None if rows must not be averaged in database
+        """
+        sql_average = (
+            data_options["average"]
+            and data_options["average_mode"] == "sample"
+            and data_options["reduction"] == "average"
+        )
+        if not sql_average or any(
+            data_options[name] is not None for name in ("bucket", "transform", "limit")
+        ):
+            return None
 
-        return True
+        rows_count, first_timestamp, last_timestamp = self._estimate_range(
+            device_uuid, timestamp_start, timestamp_end
+        )
+        if rows_count <= Charts.SQL_AVERAGE_FACTOR * data_options["max_points"]:
+            return None
+        return (
+            first_timestamp,
+            (last_timestamp - first_timestamp) // data_options["max_points"] + 1,
+        )
 
-    def on_event(self, event):
+    def __reduce_data(
+        self, values, column_size, timestamp_start, timestamp_end, data_options
+    ):
         """
-        Event received, stored sensor data if possible
+        Transform data (counter derivation and time buckets) and reduce rows to max points
+        (averaged or selected with lttb)
 
         Args:
-            event (MessageRequest): event
-        """
-        self.logger.debug("Event received %s", event)
-        if event["device_id"] is None:  # pragma: no cover
-            # no device associated
-            return
+            values (list): list of rows sorted according to sort option
+            column_size (int): number of columns (timestamp excluded)
+            timestamp_start (int): range start timestamp
+            timestamp_end (int): range end timestamp
+            data_options (dict): get_data options (see __get_data_options)
 
-        # split event
-        (event_module, event_type, event_action) = event["event"].split(".")
+        Returns:
+            tuple: list of rows and True if rows were reduced
+        """
+        time_weighted = data_options["average_mode"] == "time"
+        descending = data_options["sort"] == "desc"
+        # last value is valid until end of range, but not in the future
+        values_end = min(timestamp_end, int(time.time()))
+        if data_options["transform"] or data_options["bucket"]:
+            values = transform_data(
+                values,
+                column_size,
+                descending,
+                data_options["transform"],
+                timestamp_start,
+                values_end,
+                data_options["bucket"],
+                time_weighted,
+            )
+        if not data_options["average"] or data_options["bucket"]:
+            return values, False
+
+        max_points = data_options["max_points"]
+        if data_options["reduction"] == "lttb":
+            if len(values) <= max_points:
+                return values, False
+            if descending:
+                return lttb_data(values[::-1], column_size, max_points)[::-1], True
+            return lttb_data(values, column_size, max_points), True
+
+        factor = -(-len(values) // max_points)
+        if time_weighted and descending:
+            values = average_data(values[::-1], column_size, factor, True, values_end)[
+                ::-1
+            ]
+        else:
+            values = average_data(
+                values, column_size, factor, time_weighted, values_end
+            )
+        return values, factor > 1
+
+    def __format_data(self, values, fields, columns, infos, output):
+        """
+        Format get_data rows according to output option
+
+        Args:
+            values (list): list of rows
+            fields (list): field name of each row column
+            columns (list): data table columns
+            infos (dict): device infos (see __get_device_infos)
+            output (string): output format ('list'|'dict')
+
+        Returns:
+            list|dict: list of rows as dict for 'dict' output, values by field for 'list' output
+        """
+        if output == "dict":
+            return [dict(zip(fields, row)) for row in values]
+
+        return {
+            infos[column]: {
+                "name": infos[column],
+                "values": [(val[0], val[index + 1]) for val in values],
+            }
+            for index, column in enumerate(columns)
+        }
+
+    def __aggregate_range(
+        self,
+        device_uuid,
+        infos,
+        columns,
+        timestamp_start,
+        timestamp_end,
+        aggregate,
+        deadline,
+    ):
+        """
+        Compute in database one value per column over specified range
+
+        Args:
+            device_uuid (string): device uuid
+            infos (dict): device infos (see __get_device_infos)
+            columns (list): data table columns
+            timestamp_start (int): range start timestamp
+            timestamp_end (int): range end timestamp
+            aggregate (string): aggregation (see DATA_AGGREGATIONS)
+            deadline (float): time.monotonic value to interrupt query. None to never interrupt it
+
+        Returns:
+            dict: values by field name::
+
+                {
+                    field (dict): {
+                        name (string): field name
+                        value (number): aggregated value (None if there is no data in range)
+                    }
+                }
+
+        """
+        if aggregate == "duration":
+            # computed like get_state_durations: state at range start is last value before range,
+            # each value lasts until next one, last one until end of range (but not in the future)
+            with self.__interrupt_after(deadline):
+                with self._metrics.timer("get_data.aggregate"):
+                    data = self.__get_states(
+                        device_uuid, infos, columns, timestamp_start, timestamp_end
+                    )
+            self._metrics.increment("queries.aggregated")
+            values_end = min(timestamp_end, int(time.time()))
+            aggregated = {}
+            for index, column in enumerate(columns):
+                states = compute_state_durations(
+                    data[:, 0], data[:, index + 1], values_end
+                )
+                value = sum(
+                    state["duration"] for state in states if state["state"] != 0
+                )
+                aggregated[infos[column]] = {
+                    "name": infos[column],
+                    "value": value if states else None,
+                }
+            return aggregated
+
+        table_str = f"data{infos['valuescount']}"
+        where_str = "uuid=? AND timestamp>=? AND timestamp<=?"
+        params = (device_uuid, timestamp_start, timestamp_end)
+        if aggregate == "last":
+            columns_str = ",".join(columns)
+            query = f"SELECT {columns_str} FROM {table_str} WHERE {where_str} ORDER BY timestamp DESC LIMIT 1"
+        else:
+            columns_str = ",".join(
+                f"{aggregate.upper()}({column})" for column in columns
+            )
+            query = f"SELECT {columns_str} FROM {table_str} WHERE {where_str}"
+        self.logger.debug("Aggregate query: %s", query)
+
+        query_start = time.perf_counter()
+        with self.__interrupt_after(deadline):
+            with self._metrics.timer("get_data.aggregate"):
+                row = self._cur.execute(query, params).fetchone()
+        self._metrics.increment("queries.aggregated")
+        self.__log_slow_query(query, params, query_start, 1)
+
+        row = row or (None,) * len(columns)
+        return {
+            infos[column]: {"name": infos[column], "value": value}
+            for column, value in zip(columns, row)
+        }
+
+    @contextmanager
+    def __interrupt_after(self, deadline):
+        """
+        Interrupt queries executed in context once deadline is reached
+
+        Args:
+            deadline (float): time.monotonic value. None to never interrupt queries
+
+        Raises:
+            CommandError: if query was interrupted
+        """
+        if deadline is None:
+            yield
+            return
+
+        self._cnx.set_progress_handler(
+            lambda: time.monotonic() > deadline, Charts.TIMEOUT_CHECK_STEPS
+        )
+        try:
+            yield
+        except sqlite3.OperationalError as error:
+            if time.monotonic() <= deadline:
+                raise
+            self._metrics.increment("queries.interrupted")
+            raise CommandError("Request timed out") from error
+        finally:
+            self._cnx.set_progress_handler(None, 0)
+
+    def _estimate_range(self, device_uuid, timestamp_start, timestamp_end):
+        """
+        Estimate number of rows of device in specified range from hourly counts, without
+        scanning data table. Rows of hours partially in range are counted proportionally.
+
+        Args:
+            device_uuid (string): device uuid
+            timestamp_start (int): start of range
+            timestamp_end (int): end of range (included)
+
+        Returns:
+            tuple: estimated number of rows, timestamps of first and last stored rows
+                   clipped to range (None if device has no data)
+        """
+        self._cur.execute(
+            "SELECT firsttimestamp, lasttimestamp FROM storage WHERE uuid=?",
+            (device_uuid,),
+        )
+        row = self._cur.fetchone()
+        if row is None or row[0] is None:
+            return 0, None, None
+        first_timestamp = max(timestamp_start, row[0])
+        last_timestamp = min(timestamp_end, row[1])
+        if first_timestamp > last_timestamp:
+            return 0, None, None
+
+        self._cur.execute(
+            "SELECT hour, rowscount FROM hourlycounts WHERE uuid=? AND hour>=? AND hour<=?",
+            (device_uuid, first_timestamp // 3600, last_timestamp // 3600),
+        )
+        rows_count = 0.0
+        for hour, hour_rows_count in self._cur.fetchall():
+            # overlap of stored data of the hour with range
+            hour_start = max(hour * 3600, row[0])
+            hour_end = min((hour + 1) * 3600 - 1, row[1])
+            overlap = min(hour_end, last_timestamp) - max(hour_start, first_timestamp)
+            rows_count += hour_rows_count * (overlap + 1) / (hour_end - hour_start + 1)
+
+        return int(round(rows_count)), first_timestamp, last_timestamp
+
+    def __estimate_row_size(self, names, output):
+        """
+        Estimate size of a serialized row returned by get_data
+
+        Args:
+            names (list): column names (timestamp first)
+            output (string): get_data output format ('list'|'dict')
+
+        Returns:
+            int: estimated row size (in bytes)
+        """
+        if output == "dict":
+            # {"ts": value, "name": value, ...} (timestamp key is shortened in output)
+            keys = ["ts"] + names[1:]
+            return sum(len(key) + 4 + Charts.VALUE_SIZE for key in keys) + 2
+
+        # timestamp is repeated for each field: [timestamp, value],
+        return (len(names) - 1) * (2 * Charts.VALUE_SIZE + 4)
+
+    def get_stats(self, device_uuid, timestamp_start, timestamp_end, options=None):
+        """
+        Return statistics of device data over specified range
+
+        Args:
+            device_uuid (string): device uuid
+            timestamp_start (int): start of range
+            timestamp_end (int): end of range
+            options (dict): command options::
+
+                {
+                    fields (list): list of fields to compute statistics for (default all fields)
+                    percentiles (list): list of percentiles to compute (0-100) (default [50])
+                    bucket (int): compute statistics per time bucket of specified seconds (default None)
+                    average_mode (string): 'sample' to compute mean with same weight for all values
+                                           (default), 'time' to weight each value by the time it
+                                           was valid
+                }
+
+        Returns:
+            dict: statistics::
+
+                {
+                    uuid (string): device uuid
+                    event (string): event name
+                    stats (dict): statistics by field name::
+
+                        {
+                            <field> (dict|list): field statistics, list of statistics with bucket start
+                                                 timestamp ("ts") if bucket option specified::
+
+                                {
+                                    count (int): number of values
+                                    min (float): min value (None if no value)
+                                    max (float): max value (None if no value)
+                                    mean (float): mean value (None if no value)
+                                    stddev (float): standard deviation (None if no value)
+                                    percentiles (dict): percentile values by percentile ({"50": 12.3})
+                                }
+
+                        }
+
+                }
+
+        Raises:
+            InvalidParameter: if invalid parameter is specified
+            MissingParameter: if parameter is missing
+        """
+        # check parameters
+        if device_uuid is None or len(device_uuid) == 0:
+            raise MissingParameter('Parameter "device_uuid" is missing')
+        if timestamp_start is None:
+            raise MissingParameter('Parameter "timestamp_start" is missing')
+        if timestamp_start < 0:
+            raise InvalidParameter("Timestamp_start value must be positive")
+        if timestamp_end is None:
+            raise MissingParameter('Parameter "timestamp_end" is missing')
+        if timestamp_end < 0:
+            raise InvalidParameter("Timestamp_end value must be positive")
+
+        # prepare options
+        options_fields = []
+        options_percentiles = [50]
+        options_bucket = None
+        options_average_mode = "sample"
+        if options is not None:
+            if "fields" in options:
+                options_fields = options["fields"]
+            if "percentiles" in options:
+                options_percentiles = options["percentiles"]
+                if not isinstance(options_percentiles, list) or not all(
+                    isinstance(percentile, (int, float)) and 0 <= percentile <= 100
+                    for percentile in options_percentiles
+                ):
+                    raise InvalidParameter(
+                        'Option "percentiles" must be a list of values between 0 and 100'
+                    )
+            if options.get("bucket") is not None:
+                options_bucket = options["bucket"]
+                if not isinstance(options_bucket, int) or options_bucket <= 0:
+                    raise InvalidParameter('Option "bucket" must be a positive integer')
+            if "average_mode" in options:
+                options_average_mode = options["average_mode"]
+                if options_average_mode not in ("sample", "time"):
+                    raise InvalidParameter(
+                        'Option "average_mode" must be "sample" or "time"'
+                    )
+
+        self.__flush_before_read()
+
+        # get device data
+        infos = self.__get_device_infos(device_uuid)
+        columns, names = self.__get_device_columns(infos, options_fields)
+        columns_str = ",".join(["timestamp"] + columns)
+        table_str = f"data{infos['valuescount']}"
+        query = f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? ORDER BY timestamp ASC"
+        self.logger.debug("Stats query: %s", query)
+        params = (device_uuid, timestamp_start, timestamp_end)
+        query_start = time.perf_counter()
+        self._cur.execute(query, params)
+        data = to_array(self._cur.fetchall(), len(columns))
+        self.__log_slow_query(query, params, query_start, len(data))
+
+        # compute stats
+        stats = {}
+        weights = None
+        if options_average_mode == "time":
+            # weights are appended as last data column to be split with data
+            values_end = min(timestamp_end, int(time.time()))
+            bucket_ends = None
+            if options_bucket is not None:
+                bucket_ends = (
+                    timestamp_start
+                    + ((data[:, 0] - timestamp_start) // options_bucket + 1)
+                    * options_bucket
+                )
+            weights = compute_time_weights(data[:, 0], values_end, bucket_ends)
+            data = numpy.column_stack((data, weights))
+
+        if options_bucket is None:
+            for index, name in enumerate(names[1:]):
+                stats[name] = compute_stats(
+                    data[:, index + 1], options_percentiles, weights
+                )
+        else:
+            bucket_starts, groups = split_buckets(data, timestamp_start, options_bucket)
+            for index, name in enumerate(names[1:]):
+                stats[name] = [
+                    {
+                        "ts": bucket_start,
+                        **compute_stats(
+                            group[:, index + 1],
+                            options_percentiles,
+                            None if weights is None else group[:, -1],
+                        ),
+                    }
+                    for bucket_start, group in zip(bucket_starts, groups)
+                ]
+
+        return {
+            "uuid": device_uuid,
+            "event": infos["event"],
+            "stats": stats,
+        }
+
+    def get_state_durations(
+        self, device_uuid, timestamp_start, timestamp_end, options=None
+    ):
+        """
+        Return time spent in each state (value) of device fields over specified range, typically
+        for boolean devices (how long a door was open) or enum values
+
+        State at range start is the last value stored before range. A value is valid until next
+        one, the last one until range end (but not in the future).
+
+        Args:
+            device_uuid (string): device uuid
+            timestamp_start (int): start of range
+            timestamp_end (int): end of range
+            options (dict): command options::
+
+                {
+                    fields (list): list of fields to compute durations for (default all fields)
+                    bucket (int): compute durations per time bucket of specified seconds (default None).
+                                  It is increased if range would have more than MAX_POINTS buckets.
+                }
+
+        Returns:
+            dict: durations::
+
+                {
+                    uuid (string): device uuid
+                    event (string): event name
+                    durations (dict): states by field name::
+
+                        {
+                            <field> (list): field states, list of {ts, states} with bucket start
+                                            timestamp ("ts") if bucket option specified::
+
+                                [
+                                    {
+                                        state (number): field value
+                                        duration (number): seconds spent in state
+                                        transitions (int): number of times state was entered
+                                    },
+                                    ...
+                                ]
+
+                        }
+
+                }
+
+        Raises:
+            InvalidParameter: if invalid parameter is specified
+            MissingParameter: if parameter is missing
+        """
+        # check parameters
+        if device_uuid is None or len(device_uuid) == 0:
+            raise MissingParameter('Parameter "device_uuid" is missing')
+        if timestamp_start is None:
+            raise MissingParameter('Parameter "timestamp_start" is missing')
+        if timestamp_start < 0:
+            raise InvalidParameter("Timestamp_start value must be positive")
+        if timestamp_end is None:
+            raise MissingParameter('Parameter "timestamp_end" is missing')
+        if timestamp_end < 0:
+            raise InvalidParameter("Timestamp_end value must be positive")
+
+        # there is no state in the future
+        values_end = min(timestamp_end, int(time.time()))
+
+        # prepare options (range has at most MAX_POINTS buckets)
+        options_fields = []
+        options_bucket = None
+        if options is not None:
+            if "fields" in options:
+                options_fields = options["fields"]
+            if options.get("bucket") is not None:
+                options_bucket = options["bucket"]
+                if not isinstance(options_bucket, int) or options_bucket <= 0:
+                    raise InvalidParameter('Option "bucket" must be a positive integer')
+                options_bucket = max(
+                    options_bucket,
+                    -(-(values_end - timestamp_start + 1) // self.MAX_POINTS),
+                )
+
+        self.__flush_before_read()
+
+        # get device data
+        infos = self.__get_device_infos(device_uuid)
+        columns, names = self.__get_device_columns(infos, options_fields)
+        data = self.__get_states(
+            device_uuid, infos, columns, timestamp_start, timestamp_end
+        )
+
+        durations = {
+            name: compute_state_durations(
+                data[:, 0],
+                data[:, index + 1],
+                values_end,
+                timestamp_start,
+                options_bucket,
+            )
+            for index, name in enumerate(names[1:])
+        }
+
+        return {
+            "uuid": device_uuid,
+            "event": infos["event"],
+            "durations": durations,
+        }
+
+    def __get_states(self, device_uuid, infos, columns, timestamp_start, timestamp_end):
+        """
+        Return device rows of specified range, with last row stored before range as state at
+        range start (its timestamp is set to range start)
+
+        Args:
+            device_uuid (string): device uuid
+            infos (dict): device infos (see __get_device_infos)
+            columns (list): data table columns
+            timestamp_start (int): range start timestamp
+            timestamp_end (int): range end timestamp
+
+        Returns:
+            numpy.array: 2-D array of rows sorted by timestamp (first column)
+        """
+        columns_str = ",".join(["timestamp"] + columns)
+        table_str = f"data{infos['valuescount']}"
+        query = f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp>=? AND timestamp<=? ORDER BY timestamp ASC"
+        self.logger.debug("States query: %s", query)
+        params = (device_uuid, timestamp_start, timestamp_end)
+        query_start = time.perf_counter()
+        self._cur.execute(
+            f"SELECT {columns_str} FROM {table_str} WHERE uuid=? AND timestamp<? ORDER BY timestamp DESC LIMIT 1",
+            (device_uuid, timestamp_start),
+        )
+        rows = [(timestamp_start,) + row[1:] for row in self._cur.fetchall()]
+        self._cur.execute(query, params)
+        rows.extend(self._cur.fetchall())
+        self.__log_slow_query(query, params, query_start, len(rows))
+
+        return to_array(rows, len(columns))
+
+    def get_aligned_data(self, devices, timestamp_start, timestamp_end, options=None):
+        """
+        Return fields of several devices resampled on the same time grid (values of each
+        bucket are averaged), to compare or correlate them
+
+        Args:
+            devices (list): list of devices::
+
+                [
+                    {
+                        device_uuid (string): device uuid
+                        fields (list): list of fields to return (default all fields)
+                    },
+                    ...
+                ]
+
+            timestamp_start (int): start of range
+            timestamp_end (int): end of range (clipped to current time)
+            options (dict): command options::
+
+                {
+                    bucket (int): grid step in seconds (default range divided in MAX_POINTS buckets).
+                                  It is increased if grid would have more than MAX_POINTS buckets.
+                    fill (string): how empty buckets are filled: 'none' (default) to keep them
+                                   empty, 'previous' to repeat previous value, 'linear' to
+                                   interpolate surrounding values
+                }
+
+        Returns:
+            dict: columnar data::
+
+                {
+                    ts (list): bucket start timestamps
+                    series (list): list of series::
+
+                        [
+                            {
+                                uuid (string): device uuid
+                                event (string): event name
+                                name (string): field name
+                                values (list): value of each bucket (None if empty)
+                            },
+                            ...
+                        ]
+
+                }
+
+        Raises:
+            InvalidParameter: if invalid parameter is specified
+            MissingParameter: if parameter is missing
+        """
+        # check parameters
+        if devices is None or len(devices) == 0:
+            raise MissingParameter('Parameter "devices" is missing')
+        if not isinstance(devices, list) or not all(
+            isinstance(device, dict) and device.get("device_uuid") for device in devices
+        ):
+            raise InvalidParameter(
+                'Parameter "devices" must be a list of devices with "device_uuid"'
+            )
+        if timestamp_start is None:
+            raise MissingParameter('Parameter "timestamp_start" is missing')
+        if timestamp_start < 0:
+            raise InvalidParameter("Timestamp_start value must be positive")
+        if timestamp_end is None:
+            raise MissingParameter('Parameter "timestamp_end" is missing')
+        if timestamp_end < timestamp_start:
+            raise InvalidParameter("Timestamp_end value must be greater than start")
+
+        # there is no data in the future
+        timestamp_end = max(timestamp_start, min(timestamp_end, int(time.time())))
+
+        # prepare options (grid has at most MAX_POINTS buckets)
+        min_bucket = -(-(timestamp_end - timestamp_start + 1) // self.MAX_POINTS)
+        options_bucket = min_bucket
+        options_fill = "none"
+        if options is not None:
+            if options.get("bucket") is not None:
+                options_bucket = options["bucket"]
+                if not isinstance(options_bucket, int) or options_bucket <= 0:
+                    raise InvalidParameter('Option "bucket" must be a positive integer')
+                options_bucket = max(options_bucket, min_bucket)
+            if "fill" in options:
+                options_fill = options["fill"]
+                if options_fill not in Charts.ALIGNED_DATA_FILLS:
+                    raise InvalidParameter(
+                        f'Option "fill" must be one of {Charts.ALIGNED_DATA_FILLS}'
+                    )
+
+        self.__flush_before_read()
+
+        # group requested devices by data table
+        series = []
+        uuids_by_values_count = {}
+        for device in devices:
+            infos = self.__get_device_infos(device["device_uuid"])
+            columns, _ = self.__get_device_columns(infos, device.get("fields") or [])
+            uuids_by_values_count.setdefault(infos["valuescount"], set()).add(
+                device["device_uuid"]
+            )
+            series.extend(
+                {
+                    "uuid": device["device_uuid"],
+                    "event": infos["event"],
+                    "name": infos[column],
+                    "column": column,
+                    "valuescount": infos["valuescount"],
+                }
+                for column in columns
+            )
+
+        # average values per bucket in a single query by table
+        buckets_count = (timestamp_end - timestamp_start) // options_bucket + 1
+        grid = numpy.full((len(series), buckets_count), numpy.nan)
+        for values_count, uuids in uuids_by_values_count.items():
+            table_str = f"data{values_count}"
+            table_columns = [f"value{index + 1}" for index in range(values_count)]
+            columns_str = ",".join(f"AVG({column})" for column in table_columns)
+            uuids_str = ",".join("?" * len(uuids))
+            query = (
+                f"SELECT uuid, (timestamp-?)/? AS bucket, {columns_str} FROM {table_str} "
+                f"WHERE uuid IN ({uuids_str}) AND timestamp>=? AND timestamp<=? GROUP BY uuid, bucket"
+            )
+            params = (
+                timestamp_start,
+                options_bucket,
+                *sorted(uuids),
+                timestamp_start,
+                timestamp_end,
+            )
+            self.logger.debug("Aligned data query: %s", query)
+            query_start = time.perf_counter()
+            self._cur.execute(query, params)
+            rows = self._cur.fetchall()
+            self.__log_slow_query(query, params, query_start, len(rows))
+
+            uuids_rows = {}
+            for row in rows:
+                uuids_rows.setdefault(row[0], []).append(row[1:])
+            for index, serie in enumerate(series):
+                if (
+                    serie["valuescount"] != values_count
+                    or serie["uuid"] not in uuids_rows
+                ):
+                    continue
+                data = to_array(uuids_rows[serie["uuid"]], len(table_columns))
+                column_index = table_columns.index(serie["column"]) + 1
+                grid[index, data[:, 0].astype(int)] = data[:, column_index]
+
+        if options_fill != "none":
+            grid = fill_grid(grid, options_fill)
+
+        values = grid.astype(object)
+        values[numpy.isnan(grid)] = None
+        return {
+            "ts": (
+                timestamp_start + numpy.arange(buckets_count) * options_bucket
+            ).tolist(),
+            "series": [
+                {
+                    "uuid": serie["uuid"],
+                    "event": serie["event"],
+                    "name": serie["name"],
+                    "values": serie_values,
+                }
+                for serie, serie_values in zip(series, values.tolist())
+            ],
+        }
+
+    def get_storage_report(self):
+        """
+        Return storage used by each device. Report is built from storage infos maintained
+        at each data change, so no data table is scanned.
+
+        Returns:
+            dict: storage report::
+
+                {
+                    database_size (int): database size in bytes
+                    devices (list): devices storage sorted by estimated size (biggest first)::
+
+                        [
+                            {
+                                uuid (string): device uuid
+                                event (string): event name
+                                rows (int): number of stored rows
+                                first_timestamp (int): timestamp of first stored row
+                                last_timestamp (int): timestamp of last stored row
+                                span (int): time span of stored rows (in seconds)
+                                estimated_bytes (int): estimated storage size
+                                ingest_rate (float): average number of rows stored per hour
+                            },
+                            ...
+                        ]
+
+                }
+
+        """
+        self._cur.execute(
+            (
+                "SELECT s.uuid, d.event, d.valuescount, s.rowscount, s.firsttimestamp, s.lasttimestamp "
+                "FROM storage AS s INNER JOIN devices AS d ON s.uuid=d.uuid"
+            )
+        )
+        devices = []
+        for (
+            uuid,
+            event,
+            values_count,
+            rows_count,
+            first_timestamp,
+            last_timestamp,
+        ) in self._cur.fetchall():
+            span = (
+                last_timestamp - first_timestamp
+                if rows_count > 0 and first_timestamp is not None
+                else 0
+            )
+            devices.append(
+                {
+                    "uuid": uuid,
+                    "event": event,
+                    "rows": rows_count,
+                    "first_timestamp": first_timestamp,
+                    "last_timestamp": last_timestamp,
+                    "span": span,
+                    "estimated_bytes": rows_count
+                    * (Charts.ROW_OVERHEAD_SIZE + 2 * len(uuid) + 8 * values_count),
+                    "ingest_rate": (
+                        round(rows_count * 3600 / span, 3) if span > 0 else None
+                    ),
+                }
+            )
+        devices.sort(key=lambda device: device["estimated_bytes"], reverse=True)
+
+        return {
+            "database_size": self.__get_database_size(),
+            "devices": devices,
+        }
+
+    def __get_database_size(self):
+        """
+        Return database size
+
+        Returns:
+            int: database size in bytes
+        """
+        self._cur.execute("PRAGMA page_count")
+        page_count = self._cur.fetchone()[0]
+        self._cur.execute("PRAGMA page_size")
+        return page_count * self._cur.fetchone()[0]
+
+    def purge_data(self, device_uuid, timestamp_until):
+        """
+        Purge device data until specified time
+
+        Args:
+            device_uuid (string): device uuid (string)
+            timestamp_until (int): timestamp to delete data before (int)
+
+        Returns:
+            bool: always True
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+        """
+        # check parameters
+        if device_uuid is None or len(device_uuid) == 0:
+            raise MissingParameter('Parameter "device_uuid" is missing')
+        if timestamp_until is None:
+            raise MissingParameter('Parameter "timestamp_until" is missing')
+        if timestamp_until < 0:
+            raise InvalidParameter("Timestamp_until value must be positive")
+
+        # get device infos
+        infos = self.__get_device_infos(device_uuid)
+        self.logger.debug("infos=%s", infos)
+
+        # prepare query parameters
+        tablename = ""
+        if infos["valuescount"] == 1:
+            tablename = "data1"
+        if infos["valuescount"] == 2:
+            tablename = "data2"
+        if infos["valuescount"] == 3:
+            tablename = "data3"
+        if infos["valuescount"] == 4:
+            tablename = "data4"
+
+        # prepare sql query
+        query = f"DELETE FROM {tablename} WHERE uuid=? AND timestamp<?"
+        self.logger.debug(
+            "Purge query: %s with device_uuid=%s, timestamp=%s",
+            query,
+            device_uuid,
+            timestamp_until,
+        )
+
+        # execute query
+        with self._metrics.timer("purge_data"):
+            params = (device_uuid, timestamp_until)
+            query_start = time.perf_counter()
+            self._cur.execute(query, params)
+            rows_count = self._cur.rowcount
+            self._metrics.increment("rows.deleted", rows_count)
+            self.__log_slow_query(query, params, query_start, rows_count)
+            if rows_count > 0:
+                self._cur.execute(
+                    (
+                        "UPDATE storage SET rowscount=rowscount-?, "
+                        f"firsttimestamp=(SELECT MIN(timestamp) FROM {tablename} WHERE uuid=? AND timestamp>=?) "
+                        "WHERE uuid=?"
+                    ),
+                    (rows_count, device_uuid, timestamp_until, device_uuid),
+                )
+                self._cur.execute(
+                    "DELETE FROM hourlycounts WHERE uuid=? AND hour<?",
+                    (device_uuid, timestamp_until // 3600),
+                )
+                # recount hour partially purged
+                hour = timestamp_until // 3600
+                self._cur.execute(
+                    (
+                        "UPDATE hourlycounts SET "
+                        f"rowscount=(SELECT COUNT(*) FROM {tablename} WHERE uuid=? AND timestamp>=? AND timestamp<?) "
+                        "WHERE uuid=? AND hour=?"
+                    ),
+                    (
+                        device_uuid,
+                        timestamp_until,
+                        (hour + 1) * 3600,
+                        device_uuid,
+                        hour,
+                    ),
+                )
+            self._cnx.commit()
+
+        return True
+
+    def _delete_device(self, device_uuid):
+        """
+        Delete device from database
+
+        Args:
+            device_uuid (string): device uuid
+
+        Returns:
+            bool: always True
+
+        Raises:
+            MissingParameter: if parameter is missing
+        """
+        # check parameters
+        if device_uuid is None or len(device_uuid) == 0:
+            raise MissingParameter('Parameter "device_uuid" is missing')
+
+        # get device infos
+        infos = self.__get_device_infos(device_uuid)
+        self.logger.debug("infos=%s", infos)
+
+        # prepare query parameters
+        tablename = ""
+        if infos["valuescount"] == 1:
+            tablename = "data1"
+        if infos["valuescount"] == 2:
+            tablename = "data2"
+        if infos["valuescount"] == 3:
+            tablename = "data3"
+        if infos["valuescount"] == 4:
+            tablename = "data4"
+
+        with self._metrics.timer("delete_device"):
+            # delete device data
+            query = f"DELETE FROM {tablename} WHERE uuid=?"
+            self.logger.debug("Data query: %s", query)
+            self._cur.execute(query, (device_uuid,))
+            self._metrics.increment("rows.deleted", self._cur.rowcount)
+            self._cnx.commit()
+
+            # delete device entry
+            query = "DELETE FROM devices WHERE uuid=?"
+            self.logger.debug("Devices query: %s", query)
+            self._cur.execute(query, (device_uuid,))
+            self._cur.execute("DELETE FROM storage WHERE uuid=?", (device_uuid,))
+            self._cur.execute("DELETE FROM hourlycounts WHERE uuid=?", (device_uuid,))
+            self._cnx.commit()
+        self._last_values.pop(device_uuid, None)
+        self._aggregated_values.pop(device_uuid, None)
+
+        return True
+
+    def import_data(self, archive_path, device_uuids=None):
+        """
+        Import data from an archive. Archive is a charts database file, optionally gzip compressed.
+
+        Rows already stored (same device, timestamp and values) are skipped, so importing
+        the same archive twice does not duplicate data.
+
+        Args:
+            archive_path (string): path to archive file
+            device_uuids (list): list of device uuids to import. Import all devices if not specified
+
+        Returns:
+            dict: import summary::
+
+                {
+                    devices (int): number of imported devices
+                    rows (int): number of imported rows
+                }
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+            CommandError: if archive is invalid or incompatible with stored data
+        """
+        # check parameters
+        if archive_path is None or len(archive_path) == 0:
+            raise MissingParameter('Parameter "archive_path" is missing')
+        if not os.path.exists(archive_path):
+            raise InvalidParameter(f'Archive "{archive_path}" does not exist')
+        if device_uuids is not None and not isinstance(device_uuids, list):
+            raise InvalidParameter('Parameter "device_uuids" must be a list')
+
+        database_path = archive_path
+        with open(archive_path, "rb") as archive:
+            compressed = archive.read(2) == b"\x1f\x8b"
+        if compressed:
+            database_path = self.__uncompress_archive(archive_path)
+
+        src_cnx = None
+        try:
+            try:
+                src_cnx = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+                src_cur = src_cnx.cursor()
+                src_cur.execute(
+                    "SELECT uuid, event, valuescount, value1, value2, value3, value4 FROM devices"
+                )
+                devices = [
+                    row
+                    for row in src_cur.fetchall()
+                    if device_uuids is None or row[0] in device_uuids
+                ]
+            except sqlite3.DatabaseError as error:
+                raise CommandError(f"Invalid archive: {error}") from error
+            return self.__import_database(src_cur, devices)
+        finally:
+            if src_cnx is not None:
+                src_cnx.close()
+            if compressed:
+                os.remove(database_path)
+
+    def __uncompress_archive(self, archive_path):
+        """
+        Uncompress gzip archive to temporary file
+
+        Args:
+            archive_path (string): gzip archive path
+
+        Returns:
+            string: uncompressed file path
+        """
+        fd, path = tempfile.mkstemp(suffix=".db")
+        with os.fdopen(fd, "wb") as output, gzip.open(archive_path, "rb") as archive:
+            shutil.copyfileobj(archive, output, Charts.IMPORT_CHUNK_BYTES)
+        return path
+
+    def __import_database(self, src_cur, devices):
+        """
+        Import devices and data from source database
+
+        Args:
+            src_cur (Cursor): source database cursor
+            devices (list): source devices rows to import
+
+        Returns:
+            dict: import summary (see import_data)
+        """
+        # check devices compatibility before importing anything
+        new_devices = []
+        for device in devices:
+            self._cur.execute(
+                "SELECT event, valuescount FROM devices WHERE uuid=?", (device[0],)
+            )
+            row = self._cur.fetchone()
+            if row is None:
+                new_devices.append(device)
+            elif row[0] != device[1] or row[1] != device[2]:
+                raise CommandError(
+                    f"Device {device[0]} stored for event {row[0]} with {row[1]} values "
+                    f"cannot import event {device[1]} with {device[2]} values"
+                )
+
+        # count rows to import to decide if indexes must be rebuilt (only rows in time range
+        # of already stored rows of device may be duplicates)
+        imports = {}
+        for device in devices:
+            table_name = f"data{device[2]}"
+            self._cur.execute(
+                f"SELECT MIN(timestamp), MAX(timestamp) FROM {table_name} WHERE uuid=?",
+                (device[0],),
+            )
+            stored_range = self._cur.fetchone()
+            src_cur.execute(
+                (
+                    "SELECT COUNT(*), COUNT(CASE WHEN timestamp>=? AND timestamp<=? THEN 1 END) "
+                    f"FROM {table_name} WHERE uuid=?"
+                ),
+                (stored_range[0], stored_range[1], device[0]),
+            )
+            # (device, stored range, rows count, overlapping rows count)
+            imports.setdefault(table_name, []).append(
+                (device, stored_range, *src_cur.fetchone())
+            )
+
+        rows_count = 0
+        try:
+            self._cur.execute("BEGIN")
+            self._cur.executemany(
+                "INSERT INTO devices(uuid, event, valuescount, value1, value2, value3, value4) VALUES(?,?,?,?,?,?,?)",
+                new_devices,
+            )
+
+            for table_name, table_imports in imports.items():
+                import_count = sum(count for (_, _, count, _) in table_imports)
+                if import_count == 0:
+                    continue
+                self._cur.execute(f"SELECT COUNT(*) FROM {table_name}")
+                # indexes are needed to look for duplicates of overlapping rows
+                rebuild_indexes = import_count > self._cur.fetchone()[0] and not any(
+                    overlap_count for (_, _, _, overlap_count) in table_imports
+                )
+                if rebuild_indexes:
+                    # cheaper to build indexes once at end than maintaining them for each row
+                    self.__drop_data_indexes(self._cur, table_name)
+
+                for device, stored_range, _, _ in table_imports:
+                    device_rows_count = self.__import_device_rows(
+                        src_cur, table_name, device[0], stored_range
+                    )
+                    if device_rows_count > 0:
+                        self.__refresh_device_storage(table_name, device[0])
+                    rows_count += device_rows_count
+
+                if rebuild_indexes:
+                    self.__create_data_indexes(self._cur, table_name)
+
+            self._cnx.commit()
+        except Exception:
+            self._cnx.rollback()
+            raise
+
+        self.logger.info("%s rows imported for %s devices", rows_count, len(devices))
+        return {
+            "devices": len(devices),
+            "rows": rows_count,
+        }
+
+    def __import_device_rows(self, src_cur, table_name, device_uuid, stored_range):
+        """
+        Import rows of a device from source database. Rows in time range of already stored
+        rows of device are imported only if no row with same timestamp and values is stored.
+
+        Args:
+            src_cur (Cursor): source database cursor
+            table_name (string): data table name (data1, data2...)
+            device_uuid (string): device uuid
+            stored_range (tuple): timestamps of first and last stored rows of device (None if no row)
+
+        Returns:
+            int: number of imported rows
+        """
+        values_columns = [f"value{i + 1}" for i in range(int(table_name[-1]))]
+        columns_str = ",".join(["timestamp", "uuid"] + values_columns)
+        params_str = ",".join(["?"] * (len(values_columns) + 2))
+        insert_query = f"INSERT INTO {table_name}({columns_str}) VALUES({params_str})"
+        merge_query = (
+            f"INSERT INTO {table_name}({columns_str}) SELECT {params_str} WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {table_name} WHERE timestamp=? AND uuid=? AND "
+            + " AND ".join(f"{column} IS ?" for column in values_columns)
+            + ")"
+        )
+
+        def is_overlapping(row):
+            return (
+                stored_range[0] is not None
+                and stored_range[0] <= row[0] <= stored_range[1]
+            )
+
+        rows_count = 0
+        src_cur.execute(
+            f"SELECT {columns_str} FROM {table_name} WHERE uuid=? ORDER BY timestamp",
+            (device_uuid,),
+        )
+        while True:
+            rows = src_cur.fetchmany(Charts.IMPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            new_rows = [row for row in rows if not is_overlapping(row)]
+            self._cur.executemany(insert_query, new_rows)
+            rows_count += len(new_rows)
+            overlapping_rows = [row + row for row in rows if is_overlapping(row)]
+            if overlapping_rows:
+                self._cur.executemany(merge_query, overlapping_rows)
+                rows_count += self._cur.rowcount
+
+        return rows_count
+
+    def __refresh_device_storage(self, table_name, device_uuid):
+        """
+        Compute again storage infos and hourly counts of device from its data
+
+        Args:
+            table_name (string): data table name (data1, data2...)
+            device_uuid (string): device uuid
+        """
+        self._cur.execute(
+            (
+                "INSERT OR REPLACE INTO storage(uuid, rowscount, firsttimestamp, lasttimestamp) "
+                f"SELECT ?, COUNT(*), MIN(timestamp), MAX(timestamp) FROM {table_name} WHERE uuid=?"
+            ),
+            (device_uuid, device_uuid),
+        )
+        self._cur.execute("DELETE FROM hourlycounts WHERE uuid=?", (device_uuid,))
+        self._cur.execute(
+            (
+                "INSERT INTO hourlycounts(uuid, hour, rowscount) "
+                f"SELECT uuid, timestamp/3600, COUNT(*) FROM {table_name} WHERE uuid=? GROUP BY timestamp/3600"
+            ),
+            (device_uuid,),
+        )
+
+    def backup_database(self, backup_path=None, compress=False):
+        """
+        Backup database while it is running. Backup is performed in background by small
+        page steps so data recording is not paused (backup restarts if data is recorded
+        during it). Use get_backup_status to follow it.
+
+        Args:
+            backup_path (string): backup file path. Default to timestamped file in database directory
+            compress (bool): gzip compress backup file (".gz" suffix is appended)
+
+        Returns:
+            string: backup file path
+
+        Raises:
+            InvalidParameter: if invalid parameter is specified
+            CommandError: if a backup is already running
+        """
+        # check parameters
+        if not isinstance(compress, bool):
+            raise InvalidParameter('Parameter "compress" must be a bool')
+        if self._backup_status["running"]:
+            raise CommandError("A backup is already running")
+
+        if backup_path is None or len(backup_path) == 0:
+            backup_path = os.path.join(
+                Charts.DATABASE_PATH,
+                f"charts_{time.strftime('%Y%m%d_%H%M%S')}.db",
+            )
+        if compress:
+            backup_path = f"{backup_path}.gz"
+        if not os.path.isdir(os.path.dirname(os.path.abspath(backup_path))):
+            raise InvalidParameter(
+                f'Backup directory of "{backup_path}" does not exist'
+            )
 
-        # delete device data
+        self._backup_status = {
+            "running": True,
+            "path": backup_path,
+            "progress": 0,
+            "error": None,
+            "timestamp": int(time.time()),
+        }
+        self._backup_cancel.clear()
+        self._backup_thread = threading.Thread(
+            target=self.__backup_database,
+            args=(backup_path, compress),
+            daemon=True,
+        )
+        self._backup_thread.start()
+
+        return backup_path
+
+    def get_backup_status(self):
+        """
+        Return status of last backup
+
+        Returns:
+            dict: backup status::
+
+                {
+                    running (bool): True if backup is running
+                    path (string): backup file path
+                    progress (int): backup progress percentage
+                    error (string): error message if backup failed
+                    timestamp (int): backup start timestamp
+                }
+
+        """
+        return copy.deepcopy(self._backup_status)
+
+    def __backup_database(self, backup_path, compress):
+        """
+        Backup database (run in backup thread). Backup uses its own connection, module
+        connection can only be used by module thread.
+
+        Args:
+            backup_path (string): backup file path
+            compress (bool): gzip compress backup file
+
+        Raises:
+            CommandError: if backup is cancelled (module is stopped)
+        """
+
+        def check_cancelled():
+            if self._backup_cancel.is_set():
+                raise CommandError("Backup cancelled")
+
+        def progress(_, remaining, total):
+            check_cancelled()
+            if total > 0:
+                self._backup_status["progress"] = int((total - remaining) * 100 / total)
+
+        database_path = f"{backup_path}.tmp" if compress else backup_path
+        try:
+            source_cnx = sqlite3.connect(self._database_path)
+            backup_cnx = sqlite3.connect(database_path)
+            try:
+                source_cnx.backup(
+                    backup_cnx,
+                    pages=Charts.BACKUP_STEP_PAGES,
+                    progress=progress,
+                    sleep=Charts.BACKUP_STEP_SLEEP,
+                )
+            finally:
+                backup_cnx.close()
+                source_cnx.close()
+
+            if compress:
+                with open(database_path, "rb") as database, gzip.open(
+                    backup_path, "wb"
+                ) as archive:
+                    while True:
+                        check_cancelled()
+                        chunk = database.read(Charts.IMPORT_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        archive.write(chunk)
+
+            self._backup_status["progress"] = 100
+            self.logger.info('Database backup "%s" done', backup_path)
+        except Exception as error:
+            if self._backup_cancel.is_set():
+                self.logger.info('Database backup "%s" cancelled', backup_path)
+            else:
+                self.logger.exception('Database backup "%s" failed', backup_path)
+            self._backup_status["error"] = str(error)
+            if os.path.exists(backup_path):
+                os.remove(backup_path)
+        finally:
+            if compress and os.path.exists(database_path):
+                os.remove(database_path)
+            self._backup_status["running"] = False
+
+    def get_metrics(self, reset=False):
+        """
+        Return module metrics (durations of database operations and counters)
+
+        Args:
+            reset (bool): reset metrics after returning them
+
+        Returns:
+            dict: metrics::
+
+                {
+                    since (int): timestamp metrics are collected since
+                    timings (dict): timings by operation name (see ChartsMetrics.get_metrics)
+                    counters (dict): counters by name (rows.inserted, rows.fetched, rows.deleted)
+                    database (dict): database infos::
+
+                        {
+                            size (int): database size in bytes
+                        }
+
+                }
+
+        """
+        metrics = self._metrics.get_metrics(reset)
+        metrics["database"] = {"size": self.__get_database_size()}
+
+        return metrics
+
+    def set_metrics_log_interval(self, interval):
+        """
+        Set interval metrics are periodically logged at
+
+        Args:
+            interval (int): interval in seconds. 0 to disable metrics logging
+
+        Returns:
+            bool: True if interval saved
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+        """
+        if interval is None:
+            raise MissingParameter('Parameter "interval" is missing')
+        if not isinstance(interval, int) or interval < 0:
+            raise InvalidParameter('Parameter "interval" must be a positive integer')
+
+        if not self._set_config_field("metrics_log_interval", interval):
+            return False
+        self.__start_metrics_task()
+        return True
+
+    def __start_metrics_task(self):
+        """
+        (Re)start task that periodically logs metrics
+        """
+        if self._metrics_task:
+            self._metrics_task.stop()
+            self._metrics_task = None
+
+        interval = self._get_config_field("metrics_log_interval")
+        if interval:
+            self._metrics_task = Task(interval, self._log_metrics, self.logger)
+            self._metrics_task.start()
+
+    def _log_metrics(self):
+        """
+        Log metrics
+        """
+        metrics = self._metrics.get_metrics()
+        self.logger.info(
+            "Metrics: %s counters=%s",
+            " ".join(
+                f"{name}[count={timing['count']} mean={timing['mean_ms']}ms max={timing['max_ms']}ms]"
+                for name, timing in metrics["timings"].items()
+            ),
+            metrics["counters"],
+        )
+
+    def get_slow_queries(self):
+        """
+        Return last queries that took longer than slow query threshold
+
+        Returns:
+            list: list of slow queries (older first)::
+
+                [
+                    {
+                        timestamp (int): query timestamp
+                        query (string): sql query
+                        params (list): query parameters
+                        duration_ms (float): query duration (including rows fetching)
+                        rows (int): number of rows returned or deleted
+                        plan (list): query plan (EXPLAIN QUERY PLAN details)
+                    },
+                    ...
+                ]
+
+        """
+        return list(self._slow_queries)
+
+    def set_slow_query_threshold(self, threshold):
+        """
+        Set slow query threshold
+
+        Args:
+            threshold (float): duration above which queries are logged (in milliseconds).
+                               0 to disable slow query log
+
+        Returns:
+            bool: True if threshold saved
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+        """
+        if threshold is None:
+            raise MissingParameter('Parameter "threshold" is missing')
         if (
-            event_module == "system"
-            and event_type == "device"
-            and event_action == "delete"
+            not isinstance(threshold, (int, float))
+            or isinstance(threshold, bool)
+            or threshold < 0
         ):
-            self._delete_device(event["device_id"])
-            return
+            raise InvalidParameter('Parameter "threshold" must be a positive number')
 
-        # get event instance
-        event_instance = self.events_broker.get_event_instance(event["event"])
-        if not event_instance:
-            self.logger.debug('No event instance found for "%s"', event["event"])
+        saved = self._set_config_field("slow_query_threshold", threshold)
+        if saved:
+            self._slow_query_threshold = threshold
+        return saved
+
+    def __log_slow_query(self, query, params, query_start, rows):
+        """
+        Log query with its plan if it took longer than slow query threshold
+
+        Args:
+            query (string): sql query
+            params (tuple): query parameters
+            query_start (float): query start (perf_counter value)
+            rows (int): number of rows returned or deleted
+        """
+        duration = (time.perf_counter() - query_start) * 1000
+        threshold = self._slow_query_threshold
+        if not threshold or duration < threshold:
             return
 
-        # get and check chart values
-        values = event_instance.get_chart_values(event["params"])
-        if values is None:
-            self.logger.trace('No chart values for event "%s"', event["event"])
+        # use dedicated cursor to keep results of current one
+        plan = [
+            row[-1] for row in self._cnx.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        ]
+        self.logger.warning(
+            "Slow query (%.3fms, %s rows): %s %s plan=%s",
+            duration,
+            rows,
+            query,
+            params,
+            plan,
+        )
+        self._slow_queries.append(
+            {
+                "timestamp": int(time.time()),
+                "query": query,
+                "params": list(params),
+                "duration_ms": round(duration, 3),
+                "rows": rows,
+                "plan": plan,
+            }
+        )
+
+    def set_ingestion_policy(self, key, deadband=0, max_interval=0):
+        """
+        Set ingestion policy of a device or of all devices of an event. Values are
+        stored only if one of them changed by more than deadband or if last stored
+        values are older than max interval.
+
+        Args:
+            key (string): device uuid or event name (device policy has precedence)
+            deadband (float): minimum value change to store values (0 stores only changed values)
+            max_interval (int): store values at least every max_interval seconds (0 to disable)
+
+        Returns:
+            bool: True if policy saved
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+        """
+        if key is None or len(key) == 0:
+            raise MissingParameter('Parameter "key" is missing')
+        if (
+            not isinstance(deadband, (int, float))
+            or isinstance(deadband, bool)
+            or deadband < 0
+        ):
+            raise InvalidParameter('Parameter "deadband" must be a positive number')
+        if (
+            not isinstance(max_interval, int)
+            or isinstance(max_interval, bool)
+            or max_interval < 0
+        ):
+            raise InvalidParameter(
+                'Parameter "max_interval" must be a positive integer'
+            )
+
+        policies = self._get_config_field("ingestion_policies")
+        policies[key] = {"deadband": deadband, "max_interval": max_interval}
+        saved = self._set_config_field("ingestion_policies", policies)
+        if saved:
+            self._ingestion_policies = policies
+        return saved
+
+    def delete_ingestion_policy(self, key):
+        """
+        Delete ingestion policy
+
+        Args:
+            key (string): device uuid or event name
+
+        Returns:
+            bool: True if policy deleted
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if policy does not exist
+        """
+        if key is None or len(key) == 0:
+            raise MissingParameter('Parameter "key" is missing')
+        policies = self._get_config_field("ingestion_policies")
+        if key not in policies:
+            raise InvalidParameter(f'No ingestion policy for "{key}"')
+
+        del policies[key]
+        saved = self._set_config_field("ingestion_policies", policies)
+        if saved:
+            self._ingestion_policies = policies
+        return saved
+
+    def _filter_values(self, device_uuid, event_name, values, timestamp):
+        """
+        Apply ingestion policy of device on received values, comparing them to last
+        values received in memory (no database access).
+
+        When values change after some were skipped, last skipped values are returned
+        too to keep step shape of charts.
+
+        Args:
+            device_uuid (string): device uuid
+            event_name (string): event name
+            values (list): received values (list of dict(<field>,<value>))
+            timestamp (int): values timestamp
+
+        Returns:
+            list: list of (timestamp, values) to store (empty if values are skipped)
+        """
+        policies = self._ingestion_policies
+        policy = policies.get(device_uuid) or policies.get(event_name)
+        if policy is None:
+            return [(timestamp, values)]
+
+        last = self._last_values.get(device_uuid)
+        if last is None or len(last["values"]) != len(values):
+            self._last_values[device_uuid] = {
+                "timestamp": timestamp,
+                "values": values,
+                "skipped": None,
+            }
+            return [(timestamp, values)]
+
+        changed = False
+        for last_value, value in zip(last["values"], values):
+            try:
+                changed = abs(value["value"] - last_value["value"]) > policy["deadband"]
+            except TypeError:
+                changed = value["value"] != last_value["value"]
+            if changed:
+                break
+        expired = (
+            policy["max_interval"] > 0
+            and timestamp - last["timestamp"] >= policy["max_interval"]
+        )
+        if not changed and not expired:
+            last["skipped"] = (timestamp, values)
+            self._metrics.increment("rows.skipped")
+            return []
+
+        to_store = []
+        if changed and last["skipped"] is not None:
+            to_store.append(last["skipped"])
+        to_store.append((timestamp, values))
+        self._last_values[device_uuid] = {
+            "timestamp": timestamp,
+            "values": values,
+            "skipped": None,
+        }
+        return to_store
+
+    def set_rate_limit(self, key, min_interval, aggregation="last"):
+        """
+        Set rate limit of a device or of all devices of an event. Values received
+        during min interval are aggregated and stored as a single row.
+
+        Args:
+            key (string): device uuid or event name (device rate limit has precedence)
+            min_interval (int): minimum interval between stored values (in seconds)
+            aggregation (string): aggregation of values received during interval (last, mean, min, max).
+                                  Bool and non numeric values are always aggregated with last
+
+        Returns:
+            bool: True if rate limit saved
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if invalid parameter is specified
+        """
+        if key is None or len(key) == 0:
+            raise MissingParameter('Parameter "key" is missing')
+        if min_interval is None:
+            raise MissingParameter('Parameter "min_interval" is missing')
+        if (
+            not isinstance(min_interval, int)
+            or isinstance(min_interval, bool)
+            or min_interval <= 0
+        ):
+            raise InvalidParameter(
+                'Parameter "min_interval" must be a strictly positive integer'
+            )
+        if aggregation not in Charts.RATE_LIMIT_AGGREGATIONS:
+            raise InvalidParameter(
+                f'Parameter "aggregation" must be one of {Charts.RATE_LIMIT_AGGREGATIONS}'
+            )
+
+        rate_limits = self._get_config_field("rate_limits")
+        rate_limits[key] = {"min_interval": min_interval, "aggregation": aggregation}
+        saved = self._set_config_field("rate_limits", rate_limits)
+        if saved:
+            self._rate_limits = rate_limits
+        return saved
+
+    def delete_rate_limit(self, key):
+        """
+        Delete rate limit
+
+        Args:
+            key (string): device uuid or event name
+
+        Returns:
+            bool: True if rate limit deleted
+
+        Raises:
+            MissingParameter: if parameter is missing
+            InvalidParameter: if rate limit does not exist
+        """
+        if key is None or len(key) == 0:
+            raise MissingParameter('Parameter "key" is missing')
+        rate_limits = self._get_config_field("rate_limits")
+        if key not in rate_limits:
+            raise InvalidParameter(f'No rate limit for "{key}"')
+
+        del rate_limits[key]
+        saved = self._set_config_field("rate_limits", rate_limits)
+        if saved:
+            self._rate_limits = rate_limits
+        return saved
+
+    def _aggregate_values(self, device_uuid, event_name, values, timestamp, rate_limit):
+        """
+        Aggregate values in memory until rate limit interval is elapsed
+
+        Args:
+            device_uuid (string): device uuid
+            event_name (string): event name
+            values (list): received values (list of dict(<field>,<value>))
+            timestamp (int): values timestamp
+            rate_limit (dict): device rate limit (min_interval, aggregation)
+        """
+        aggregated = self._aggregated_values.get(device_uuid)
+        if aggregated is None or len(aggregated["values"]) != len(values):
+            if aggregated is not None:
+                self.__flush_device_values(device_uuid, self._cnx)
+            self._aggregated_values[device_uuid] = {
+                "event": event_name,
+                "start": timestamp,
+                "timestamp": timestamp,
+                "min_interval": rate_limit["min_interval"],
+                "aggregation": rate_limit["aggregation"],
+                "values": [dict(value) for value in values],
+                # sums and counts of numeric values (for mean aggregation)
+                "sums": [
+                    value["value"] if self.__is_number(value["value"]) else 0
+                    for value in values
+                ],
+                "counts": [
+                    1 if self.__is_number(value["value"]) else 0 for value in values
+                ],
+            }
             return
-        if not isinstance(values, list) or len(values) == 0:
-            self.logger.debug(
-                'Invalid chart values for event "%s": %s', event["event"], values
+
+        aggregated["timestamp"] = timestamp
+        self._metrics.increment("rows.aggregated")
+        for index, value in enumerate(values):
+            current = aggregated["values"][index]
+            if aggregated["aggregation"] == "last":
+                current["value"] = value["value"]
+            elif not self.__is_number(value["value"]):
+                # missing values are ignored, other non numeric values are aggregated with last
+                if value["value"] is not None:
+                    current["value"] = value["value"]
+            else:
+                aggregated["sums"][index] += value["value"]
+                aggregated["counts"][index] += 1
+                if aggregated["aggregation"] == "mean":
+                    current["value"] = (
+                        aggregated["sums"][index] / aggregated["counts"][index]
+                    )
+                elif not self.__is_number(current["value"]):
+                    current["value"] = value["value"]
+                elif aggregated["aggregation"] == "min":
+                    current["value"] = min(current["value"], value["value"])
+                elif aggregated["aggregation"] == "max":
+                    current["value"] = max(current["value"], value["value"])
+
+    def __is_number(self, value):
+        """
+        Return True if value is a number (bool is not)
+
+        Args:
+            value (any): value to check
+
+        Returns:
+            bool: True if value is a number
+        """
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _flush_aggregated_values(self, timestamp=None, cnx=None):
+        """
+        Store aggregated values whose rate limit interval is elapsed
+
+        Args:
+            timestamp (int): current timestamp. If not specified all aggregated values are stored
+            cnx (Connection): connection to store values with (module connection if not specified)
+        """
+        with self._events_lock:
+            for device_uuid, aggregated in list(self._aggregated_values.items()):
+                if (
+                    timestamp is None
+                    or timestamp - aggregated["start"] >= aggregated["min_interval"]
+                ):
+                    self.__flush_device_values(device_uuid, cnx or self._cnx)
+
+    def __flush_before_read(self):
+        """
+        Store aggregated values whose rate limit interval is elapsed, before reading data
+        """
+        self._flush_aggregated_values(int(time.time()))
+
+    def _flush_aggregated_values_task(self):
+        """
+        Store aggregated values whose rate limit interval is elapsed (flush task callback).
+        Values are stored with a dedicated connection, module connection can only be used
+        by module thread.
+        """
+        with self._events_lock:
+            if len(self._aggregated_values) == 0:
+                return
+            cnx = sqlite3.connect(
+                self._database_path, timeout=Charts.FLUSH_DATABASE_TIMEOUT
+            )
+            try:
+                self._flush_aggregated_values(int(time.time()), cnx)
+            finally:
+                cnx.close()
+
+    def __flush_device_values(self, device_uuid, cnx):
+        """
+        Store aggregated values of specified device in a single transaction. Values are kept
+        to be stored at next flush if database is not available (locked by another connection).
+
+        Args:
+            device_uuid (string): device uuid
+            cnx (Connection): connection to store values with
+        """
+        aggregated = self._aggregated_values.pop(device_uuid)
+        last_values = self._last_values.get(device_uuid)
+        try:
+            self.__store_values(
+                device_uuid,
+                aggregated["event"],
+                aggregated["values"],
+                aggregated["timestamp"],
+                cnx,
+            )
+            cnx.commit()
+        except sqlite3.Error:
+            cnx.rollback()
+            self.logger.warning(
+                'Unable to store aggregated values of device "%s", retry at next flush',
+                device_uuid,
+                exc_info=True,
+            )
+            self._aggregated_values[device_uuid] = aggregated
+            # values were not stored, ingestion policy must compare next values to previous ones
+            if last_values is None:
+                self._last_values.pop(device_uuid, None)
+            else:
+                self._last_values[device_uuid] = last_values
+        except Exception:
+            cnx.rollback()
+            self.logger.exception(
+                'Unable to store aggregated values of device "%s"', device_uuid
             )
+
+    def __store_values(self, device_uuid, event_name, values, timestamp, cnx=None):
+        """
+        Apply ingestion policy and store values
+
+        Args:
+            device_uuid (string): device uuid
+            event_name (string): event name
+            values (list): values (list of dict(<field>,<value>))
+            timestamp (int): values timestamp
+            cnx (Connection): connection to store values with, caller commits changes. Module
+                              connection is used and changes are committed if not specified
+        """
+        to_store = self._filter_values(device_uuid, event_name, values, timestamp)
+        if len(to_store) == 0:
             return
+        for skipped_timestamp, skipped_values in to_store[:-1]:
+            self._save_data(
+                device_uuid, event_name, skipped_values, skipped_timestamp, cnx
+            )
 
         if len(values) == 1 and isinstance(values[0]["value"], bool):
             # handle differently single bool value to make possible chart generation:
             # we inject opposite value just before current value
             current_value = values[0]["value"]
             self._save_data(
-                event["device_id"],
-                event["event"],
+                device_uuid,
+                event_name,
                 [
                     {
                         "field": values[0]["field"],
                         "value": 1 if current_value is False else 0,
                     }
                 ],
+                timestamp - 1,
+                cnx,
             )
-            time.sleep(1.0)
             self._save_data(
-                event["device_id"],
-                event["event"],
+                device_uuid,
+                event_name,
                 [
                     {
                         "field": values[0]["field"],
                         "value": 1 if current_value is True else 0,
                     }
                 ],
+                timestamp,
+                cnx,
             )
         else:
-            self._save_data(event["device_id"], event["event"], values)
+            self._save_data(device_uuid, event_name, values, timestamp, cnx)
+
+    def on_event(self, event):
+        """
+        Event received, stored sensor data if possible
+
+        Args:
+            event (MessageRequest): event
+        """
+        self.logger.debug("Event received %s", event)
+        if event["device_id"] is None:  # pragma: no cover
+            # no device associated
+            return
+
+        # split event
+        (event_module, event_type, event_action) = event["event"].split(".")
+
+        # delete device data
+        if (
+            event_module == "system"
+            and event_type == "device"
+            and event_action == "delete"
+        ):
+            self._delete_device(event["device_id"])
+            return
+
+        # get event instance
+        event_instance = self.events_broker.get_event_instance(event["event"])
+        if not event_instance:
+            self.logger.debug('No event instance found for "%s"', event["event"])
+            return
+
+        # get and check chart values
+        values = event_instance.get_chart_values(event["params"])
+        if values is None:
+            self.logger.trace('No chart values for event "%s"', event["event"])
+            return
+        if not isinstance(values, list) or len(values) == 0:
+            self.logger.debug(
+                'Invalid chart values for event "%s": %s', event["event"], values
+            )
+            return
+
+        with self._events_lock:
+            timestamp = int(time.time())
+            self._flush_aggregated_values(timestamp)
+
+            # apply rate limit
+            rate_limit = self._rate_limits.get(
+                event["device_id"]
+            ) or self._rate_limits.get(event["event"])
+            if rate_limit:
+                self._aggregate_values(
+                    event["device_id"], event["event"], values, timestamp, rate_limit
+                )
+                return
+
+            self.__store_values(event["device_id"], event["event"], values, timestamp)
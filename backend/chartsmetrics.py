@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class ChartsMetrics:
+    """
+    Lightweight metrics collector: timing histograms and counters
+    """
+
+    # upper bounds of histogram buckets (in milliseconds)
+    HISTOGRAM_BOUNDS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.__lock = threading.Lock()
+        self.__timings = {}
+        self.__counters = {}
+        self.__since = int(time.time())
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Context manager that records duration of enclosed block
+
+        Args:
+            name (string): timing name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, duration):
+        """
+        Record duration
+
+        Args:
+            name (string): timing name
+            duration (float): duration in milliseconds
+        """
+        with self.__lock:
+            timing = self.__timings.get(name)
+            if timing is None:
+                timing = {
+                    "count": 0,
+                    "total": 0.0,
+                    "min": duration,
+                    "max": duration,
+                    "histogram": [0] * (len(self.HISTOGRAM_BOUNDS) + 1),
+                }
+                self.__timings[name] = timing
+            timing["count"] += 1
+            timing["total"] += duration
+            timing["min"] = min(timing["min"], duration)
+            timing["max"] = max(timing["max"], duration)
+            index = next(
+                (
+                    index
+                    for index, bound in enumerate(self.HISTOGRAM_BOUNDS)
+                    if duration <= bound
+                ),
+                len(self.HISTOGRAM_BOUNDS),
+            )
+            timing["histogram"][index] += 1
+
+    def increment(self, name, value=1):
+        """
+        Increment counter
+
+        Args:
+            name (string): counter name
+            value (int): increment value
+        """
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def get_metrics(self, reset=False):
+        """
+        Return metrics
+
+        Args:
+            reset (bool): reset metrics after returning them
+
+        Returns:
+            dict: metrics::
+
+                {
+                    since (int): timestamp metrics are collected since
+                    timings (dict): timings by name::
+
+                        {
+                            count (int): number of records
+                            total_ms (float): total duration
+                            mean_ms (float): mean duration
+                            min_ms (float): min duration
+                            max_ms (float): max duration
+                            histogram (dict): number of records by duration upper bound ("<=10": 2, ">5000": 0)
+                        }
+
+                    counters (dict): counters by name
+                }
+
+        """
+        labels = [f"<={bound}" for bound in self.HISTOGRAM_BOUNDS] + [
+            f">{self.HISTOGRAM_BOUNDS[-1]}"
+        ]
+        with self.__lock:
+            metrics = {
+                "since": self.__since,
+                "timings": {
+                    name: {
+                        "count": timing["count"],
+                        "total_ms": round(timing["total"], 3),
+                        "mean_ms": round(timing["total"] / timing["count"], 3),
+                        "min_ms": round(timing["min"], 3),
+                        "max_ms": round(timing["max"], 3),
+                        "histogram": dict(zip(labels, timing["histogram"])),
+                    }
+                    for name, timing in self.__timings.items()
+                },
+                "counters": dict(self.__counters),
+            }
+            if reset:
+                self.__timings = {}
+                self.__counters = {}
+                self.__since = int(time.time())
+
+        return metrics
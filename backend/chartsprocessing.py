@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from itertools import chain
+import numpy
+
+
+def average_data(data, column_size, factor, time_weighted=False, timestamp_end=None):
+    """
+    Average data
+
+    Args:
+        data (list): list of values
+        column_size (int): number of columns
+        factor (int): reduce factor (number of rows averaged in a single row)
+        time_weighted (bool): weight each value by the time it was valid instead of averaging
+                              all values with the same weight (data must be sorted by
+                              ascending timestamp)
+        timestamp_end (int): timestamp last value is valid until (for time weighted average)
+
+    Returns:
+        list: averaged rows
+    """
+    if factor <= 1:
+        # no average needed, return specified data
+        return data
+
+    array = to_array(data, column_size)
+    indexes = numpy.arange(0, len(array), factor)
+    if time_weighted:
+        weights = compute_time_weights(array[:, 0], timestamp_end)
+        new_data = numpy.column_stack(
+            (
+                numpy.add.reduceat(array[:, 0], indexes)
+                / numpy.diff(indexes, append=len(array)),
+                weighted_mean(array[:, 1:], weights, indexes),
+            )
+        ).tolist()
+        return new_data
+
+    # average each group of factor rows (nan values are ignored)
+    valid = ~numpy.isnan(array)
+    sums = numpy.add.reduceat(numpy.where(valid, array, 0.0), indexes, axis=0)
+    counts = numpy.add.reduceat(valid, indexes, axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        new_data = (sums / counts).tolist()
+
+    return new_data
+
+
+def lttb_data(data, column_size, max_points):
+    """
+    Reduce data selecting rows with largest triangle three buckets algorithm: first and
+    last rows are kept and one row is selected in each bucket of rows in between, the one
+    forming the largest triangle with previous selected row and next bucket average.
+    It keeps chart shape (peaks) unlike averaging.
+
+    Args:
+        data (list): list of rows sorted by ascending timestamp
+        column_size (int): number of columns (excluding timestamp)
+        max_points (int): number of rows to select
+
+    Returns:
+        list: selected rows
+    """
+    count = len(data)
+    if count <= max_points:
+        return data
+    if max_points < 3:
+        return [data[0], data[-1]][:max_points]
+
+    array = to_array(data, column_size)
+    timestamps = array[:, 0]
+    # missing values don't count in triangle areas
+    values = numpy.nan_to_num(array[:, 1:])
+    # boundaries of max_points-2 buckets between first and last rows
+    edges = numpy.linspace(1, count - 1, max_points - 1).astype(int)
+    selected = [0]
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+            next_timestamp = timestamps[next_start:next_end].mean()
+            next_values = values[next_start:next_end].mean(axis=0)
+        else:
+            next_timestamp = timestamps[-1]
+            next_values = values[-1]
+        previous = selected[-1]
+        areas = numpy.abs(
+            (timestamps[previous] - next_timestamp)
+            * (values[start:end] - values[previous])
+            - (timestamps[previous] - timestamps[start:end])[:, numpy.newaxis]
+            * (next_values - values[previous])
+        ).sum(axis=1)
+        selected.append(start + int(areas.argmax()))
+    selected.append(count - 1)
+
+    return [data[index] for index in selected]
+
+
+def transform_data(
+    data,
+    column_size,
+    descending,
+    transform,
+    timestamp_start,
+    timestamp_end,
+    bucket,
+    time_weighted=False,
+):
+    """
+    Transform data (counter derivation and time bucket aggregation)
+
+    Args:
+        data (list): list of rows (timestamp first)
+        column_size (int): number of columns (timestamp excluded)
+        descending (bool): True if data is sorted by descending timestamp
+        transform (string): counter derivation ('delta'|'rate'). None for no derivation
+        timestamp_start (int): timestamp of first bucket start
+        timestamp_end (int): end of data range
+        bucket (int): bucket duration in seconds. None for no aggregation
+        time_weighted (bool): use time weighted average to aggregate values in buckets
+
+    Returns:
+        list: list of transformed rows sorted like input data
+    """
+    array = to_array(data, column_size)
+    if descending:
+        array = array[::-1]
+
+    if transform:
+        # rate over bucket is computed from bucket deltas
+        array = derive_data(array, transform if bucket is None else "delta")
+    if bucket:
+        aggregation = "time_mean" if time_weighted else "mean"
+        array = bucket_data(
+            array,
+            timestamp_start,
+            bucket,
+            "sum" if transform else aggregation,
+            timestamp_end,
+        )
+        if transform == "rate":
+            array[:, 1:] /= bucket
+
+    if descending:
+        array = array[::-1]
+    return to_rows(array)
+
+
+def derive_data(data, transform):
+    """
+    Derive counter values
+
+    Args:
+        data (numpy.array): 2-D array of data sorted by ascending timestamp (first column)
+        transform (string): 'delta' to return values increase since previous value,
+                            'rate' to return values increase per second
+
+    Returns:
+        numpy.array: derived data (one row less than data)
+    """
+    if len(data) < 2:
+        return numpy.empty((0, data.shape[1]))
+
+    values = data[:, 1:]
+    deltas = numpy.diff(values, axis=0)
+    # counter was reset, it restarted from 0
+    resets = deltas < 0
+    deltas[resets] = values[1:][resets]
+
+    if transform == "rate":
+        durations = numpy.diff(data[:, 0])[:, numpy.newaxis]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            deltas = numpy.where(durations > 0, deltas / durations, numpy.nan)
+
+    return numpy.column_stack((data[1:, 0], deltas))
+
+
+def bucket_data(data, timestamp_start, bucket, aggregation, timestamp_end=None):
+    """
+    Aggregate data per time bucket
+
+    Args:
+        data (numpy.array): 2-D array of data sorted by ascending timestamp (first column)
+        timestamp_start (int): timestamp of first bucket start
+        bucket (int): bucket duration in seconds
+        aggregation (string): bucket values aggregation ('mean'|'time_mean'|'sum')
+        timestamp_end (int): timestamp last value is valid until (for 'time_mean' aggregation)
+
+    Returns:
+        numpy.array: one row per non empty bucket with bucket start timestamp as first column
+    """
+    if len(data) == 0:
+        return data
+
+    bucket_starts, indexes = get_buckets(data[:, 0], timestamp_start, bucket)
+    if aggregation == "time_mean":
+        bucket_ends = (
+            numpy.repeat(bucket_starts, numpy.diff(indexes, append=len(data))) + bucket
+        )
+        weights = compute_time_weights(data[:, 0], timestamp_end, bucket_ends)
+        return numpy.column_stack(
+            (bucket_starts, weighted_mean(data[:, 1:], weights, indexes))
+        )
+
+    values = data[:, 1:]
+    valid = ~numpy.isnan(values)
+    sums = numpy.add.reduceat(numpy.where(valid, values, 0.0), indexes, axis=0)
+    counts = numpy.add.reduceat(valid, indexes, axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        aggregated = sums / counts if aggregation == "mean" else sums
+    aggregated[counts == 0] = numpy.nan
+
+    return numpy.column_stack((bucket_starts, aggregated))
+
+
+def compute_time_weights(timestamps, timestamp_end=None, ends=None):
+    """
+    Compute time weight of values, that is the duration each value was valid:
+    until next value, or until timestamp_end for the last one
+
+    Args:
+        timestamps (numpy.array): sorted timestamps of values
+        timestamp_end (int): timestamp last value is valid until. Last value has no
+                             weight if not specified
+        ends (numpy.array): timestamps each value validity is clipped to (bucket ends)
+
+    Returns:
+        numpy.array: weight of each value (in seconds)
+    """
+    if len(timestamps) == 0:
+        return timestamps
+
+    last_end = timestamps[-1] if timestamp_end is None else timestamp_end
+    next_timestamps = numpy.append(timestamps[1:], max(last_end, timestamps[-1]))
+    if ends is not None:
+        next_timestamps = numpy.minimum(next_timestamps, ends)
+    return next_timestamps - timestamps
+
+
+def weighted_mean(values, weights, indexes):
+    """
+    Compute weighted mean of groups of values. Values of group with no weight at all
+    are averaged with same weight.
+
+    Args:
+        values (numpy.array): 2-D array of values (nan values are ignored)
+        weights (numpy.array): weight of each row of values
+        indexes (numpy.array): index of first row of each group
+
+    Returns:
+        numpy.array: 2-D array with weighted mean of each group
+    """
+    valid = ~numpy.isnan(values)
+    values = numpy.where(valid, values, 0.0)
+    weights = numpy.where(valid, weights[:, numpy.newaxis], 0.0)
+    weighted_sums = numpy.add.reduceat(values * weights, indexes, axis=0)
+    weights_sums = numpy.add.reduceat(weights, indexes, axis=0)
+    sums = numpy.add.reduceat(values, indexes, axis=0)
+    counts = numpy.add.reduceat(valid, indexes, axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(
+            weights_sums > 0, weighted_sums / weights_sums, sums / counts
+        )
+
+
+def get_buckets(timestamps, timestamp_start, bucket):
+    """
+    Compute time buckets of sorted timestamps
+
+    Args:
+        timestamps (numpy.array): sorted timestamps
+        timestamp_start (int): timestamp of first bucket start
+        bucket (int): bucket duration in seconds
+
+    Returns:
+        tuple: array of bucket start timestamps and array of first timestamp index of each bucket
+    """
+    buckets = (timestamps - timestamp_start) // bucket
+    indexes = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(buckets)) + 1))
+    return timestamp_start + buckets[indexes] * bucket, indexes
+
+
+def to_array(data, column_size):
+    """
+    Convert rows to 2-D float array with nan instead of None
+
+    Args:
+        data (list): list of rows (timestamp first)
+        column_size (int): number of columns (excluding timestamp)
+
+    Returns:
+        numpy.array: 2-D array of data
+    """
+    try:
+        # much faster than numpy.array on list of tuples but it can't convert None values
+        array = numpy.fromiter(
+            chain.from_iterable(data), float, len(data) * (column_size + 1)
+        )
+    except TypeError:
+        array = numpy.array(data, dtype=float)
+
+    return array.reshape(-1, column_size + 1)
+
+
+def to_rows(data):
+    """
+    Convert data array to list of rows with integer timestamp and None instead of nan
+
+    Args:
+        data (numpy.array): 2-D array of data (timestamp first)
+
+    Returns:
+        list: list of rows
+    """
+    rows = data.astype(object)
+    rows[numpy.isnan(data)] = None
+    rows[:, 0] = data[:, 0].astype(int).tolist()
+    return rows.tolist()
+
+
+def compute_state_durations(
+    timestamps, values, timestamp_end, timestamp_start=None, bucket=None
+):
+    """
+    Compute time spent in each state and number of transitions to each state
+
+    Args:
+        timestamps (numpy.array): sorted timestamps of values
+        values (numpy.array): values (states). Missing (nan) values keep previous state
+        timestamp_end (int): timestamp last value is valid until
+        timestamp_start (int): timestamp of first bucket start (needed if bucket specified)
+        bucket (int): bucket duration in seconds (None to compute durations over whole range)
+
+    Returns:
+        list: list of states ({state, duration, transitions}), or list of buckets
+              ({ts, states}) if bucket specified (only non empty buckets)
+    """
+    valid = ~numpy.isnan(values)
+    timestamps = timestamps[valid]
+    values = values[valid]
+    if len(timestamps) == 0:
+        return []
+    transitions = numpy.concatenate(([False], values[1:] != values[:-1]))
+
+    buckets = numpy.zeros(len(timestamps))
+    if bucket is not None:
+        # split states at bucket boundaries adding rows with current state
+        boundaries = numpy.arange(timestamp_start + bucket, timestamp_end, bucket)
+        previous = numpy.searchsorted(timestamps, boundaries, side="right") - 1
+        known = previous >= 0
+        boundaries = boundaries[known]
+        timestamps = numpy.concatenate((boundaries, timestamps))
+        values = numpy.concatenate((values[previous[known]], values))
+        transitions = numpy.concatenate(
+            (numpy.zeros(len(boundaries), dtype=bool), transitions)
+        )
+        order = numpy.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+        values = values[order]
+        transitions = transitions[order]
+        buckets = (timestamps - timestamp_start) // bucket
+
+    durations = compute_time_weights(timestamps, timestamp_end)
+    keys, inverse = numpy.unique(
+        numpy.column_stack((buckets, values)), axis=0, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    states_durations = numpy.bincount(inverse, durations, len(keys))
+    states_transitions = numpy.bincount(inverse, transitions, len(keys))
+
+    def to_number(value):
+        return int(value) if float(value).is_integer() else float(value)
+
+    states_by_bucket = {}
+    for (bucket_index, state), duration, count in zip(
+        keys, states_durations, states_transitions
+    ):
+        states_by_bucket.setdefault(int(bucket_index), []).append(
+            {
+                "state": to_number(state),
+                "duration": to_number(duration),
+                "transitions": int(count),
+            }
+        )
+
+    if bucket is None:
+        return states_by_bucket[0]
+    return [
+        {"ts": int(timestamp_start + bucket_index * bucket), "states": states}
+        for bucket_index, states in states_by_bucket.items()
+    ]
+
+
+def fill_grid(grid, fill):
+    """
+    Fill empty (nan) cells of grid rows, cells before first value and after last value
+    (for linear fill) of a row are kept empty
+
+    Args:
+        grid (numpy.array): 2-D array of values, one row per serie
+        fill (string): 'previous' to repeat previous value, 'linear' to interpolate
+                       surrounding values
+
+    Returns:
+        numpy.array: filled grid
+    """
+    filled = grid.copy()
+    positions = numpy.arange(grid.shape[1])
+    for index, row in enumerate(grid):
+        valid = ~numpy.isnan(row)
+        if not valid.any():
+            continue
+        if fill == "previous":
+            previous = numpy.maximum.accumulate(numpy.where(valid, positions, -1))
+            filled[index] = numpy.where(previous >= 0, row[previous], numpy.nan)
+        else:
+            filled[index] = numpy.interp(
+                positions,
+                positions[valid],
+                row[valid],
+                left=numpy.nan,
+                right=numpy.nan,
+            )
+
+    return filled
+
+
+def split_buckets(data, timestamp_start, bucket):
+    """
+    Split data in time buckets
+
+    Args:
+        data (numpy.array): 2-D array of data sorted by timestamp (first column)
+        timestamp_start (int): timestamp of first bucket start
+        bucket (int): bucket duration in seconds
+
+    Returns:
+        tuple: list of bucket start timestamps and list of bucket data (only non empty buckets)
+    """
+    if len(data) == 0:
+        return [], []
+
+    bucket_starts, indexes = get_buckets(data[:, 0], timestamp_start, bucket)
+    return bucket_starts.astype(int).tolist(), numpy.split(data, indexes[1:])
+
+
+def compute_stats(values, percentiles, weights=None):
+    """
+    Compute statistics of values
+
+    Args:
+        values (numpy.array): 1-D array of values (nan values are ignored)
+        percentiles (list): list of percentiles to compute
+        weights (numpy.array): weight of each value to compute mean and stddev. Same weight
+                               for all values if not specified
+
+    Returns:
+        dict: statistics (see get_stats)
+    """
+    valid = ~numpy.isnan(values)
+    values = values[valid]
+    if weights is not None:
+        weights = weights[valid]
+        if weights.sum() <= 0:
+            weights = None
+    if len(values) == 0:
+        return {
+            "count": 0,
+            "min": None,
+            "max": None,
+            "mean": None,
+            "stddev": None,
+            "percentiles": {str(percentile): None for percentile in percentiles},
+        }
+
+    percentile_values = (
+        numpy.percentile(values, percentiles).tolist() if percentiles else []
+    )
+    mean = numpy.average(values, weights=weights)
+    stddev = numpy.sqrt(numpy.average((values - mean) ** 2, weights=weights))
+    return {
+        "count": len(values),
+        "min": values.min().item(),
+        "max": values.max().item(),
+        "mean": mean.item(),
+        "stddev": stddev.item(),
+        "percentiles": {
+            str(percentile): value
+            for percentile, value in zip(percentiles, percentile_values)
+        },
+    }
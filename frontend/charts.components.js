@@ -78,9 +78,12 @@ angular.module('Cleep').component('chart', {
         </div>
 
         <!-- chart -->
-        <div ng-if="!$ctrl.loading">
+        <div ng-if="!$ctrl.loading && $ctrl.renderer!=='canvas'">
             <nvd3 options='$ctrl.chartOptions' data='$ctrl.chartData'></nvd3>
         </div>
+        <div ng-if="!$ctrl.loading && $ctrl.renderer==='canvas'">
+            <chart-canvas options='$ctrl.canvasOptions' data='$ctrl.chartData' on-zoom='$ctrl.__onZoom(start, end)'></chart-canvas>
+        </div>
 
         <!-- controls -->
         <div layout="row" layout-align="center center" ng-if="$ctrl.showControls">
@@ -127,7 +130,7 @@ angular.module('Cleep').component('chart', {
         device: '<',
         options: '<',
     },
-    controller: function(chartsService, $scope) {
+    controller: function(chartsService, chartsWorkerService, $scope, $element, $window, $timeout, $q) {
         const ctrl = this;
         ctrl.device = null;
         ctrl.options = null;
@@ -139,6 +142,22 @@ angular.module('Cleep').component('chart', {
         ctrl.timestampStart = 0;
         ctrl.timestampEnd = 0;
         ctrl.showControls = true;
+        ctrl.renderer = 'svg';
+        ctrl.canvasOptions = {};
+        ctrl.visible = false;
+        ctrl.loaded = false;
+        ctrl.observer = null;
+        // data of whole range (zoomed range data is merged into it) and its timestamps extent
+        ctrl.coarseData = null;
+        ctrl.coarseAveraged = false;
+        ctrl.zoomBoundary = null;
+        ctrl.zoomed = false;
+        // incremented to ignore responses of superseded zoomed range requests
+        ctrl.zoomGeneration = 0;
+        ctrl.zoomCanceller = null;
+        // incremented to ignore responses of superseded data requests
+        ctrl.loadGeneration = 0;
+        ctrl.loadCanceller = null;
 
         // dynamic time format according to zoom
         /*ctrl.customTimeFormat = d3.time.format.multi([
@@ -192,12 +211,18 @@ angular.module('Cleep').component('chart', {
                 },
                 zoom: {
                     enabled: true,
-                    scaleExtent: [1,10],
+                    scaleExtent: [1, 1000],
                     useFixedDomain: false,
                     useNiceScale: false,
                     horizontalOff: false,
                     verticalOff: true,
-                    unzoomEventType: "dblclick.zoom"
+                    unzoomEventType: "dblclick.zoom",
+                    zoomed: function(xDomain, yDomain) {
+                        return ctrl.__onNvd3Zoom(xDomain, yDomain);
+                    },
+                    unzoomed: function(xDomain, yDomain) {
+                        return ctrl.__onNvd3Unzoom(xDomain, yDomain);
+                    }
                 }
             },
             title: {
@@ -284,12 +309,18 @@ angular.module('Cleep').component('chart', {
                 },
                 zoom: {
                     enabled: true,
-                    scaleExtent: [1, 10],
+                    scaleExtent: [1, 1000],
                     useFixedDomain: false,
                     useNiceScale: false,
                     horizontalOff: false,
                     verticalOff: true,
-                    unzoomEventType: 'dblclick.zoom'
+                    unzoomEventType: 'dblclick.zoom',
+                    zoomed: function(xDomain, yDomain) {
+                        return ctrl.__onNvd3Zoom(xDomain, yDomain);
+                    },
+                    unzoomed: function(xDomain, yDomain) {
+                        return ctrl.__onNvd3Unzoom(xDomain, yDomain);
+                    }
                 },
                 showControls: false,
                 showLegend: false
@@ -376,12 +407,43 @@ angular.module('Cleep').component('chart', {
             if( !angular.isUndefined(ctrl.options.showControls) ) {
                 ctrl.showControls = ctrl.options.showControls;
             }
+        };
 
-            // load chart data
-            ctrl.loadChartData();
+        ctrl.$postLink = function () {
+            // request data again with resolution matching new width when chart is resized
+            $window.addEventListener('resize', ctrl.__onResize);
+
+            // load chart data when chart is displayed (lazyLoad option set to false to load it immediately)
+            if (ctrl.options.lazyLoad===false || angular.isUndefined($window.IntersectionObserver)) {
+                ctrl.loadChartData();
+                return;
+            }
+
+            ctrl.observer = new $window.IntersectionObserver(function(entries) {
+                const visible = entries[entries.length - 1].isIntersecting;
+                const firstDisplay = visible && !ctrl.loaded;
+                ctrl.visible = visible;
+                if (firstDisplay) {
+                    ctrl.loaded = true;
+                    $scope.$applyAsync(function() {
+                        ctrl.loadChartData();
+                    });
+                }
+            }, { rootMargin: '200px' });
+            ctrl.observer.observe($element[0]);
         };
 
         ctrl.$onDestroy = function () {
+            if (ctrl.observer) {
+                ctrl.observer.disconnect();
+            }
+            $window.removeEventListener('resize', ctrl.__onResize);
+            $timeout.cancel(ctrl.resizeTimer);
+            $timeout.cancel(ctrl.zoomTimer);
+            $timeout.cancel(ctrl.rangeTimer);
+            ctrl.__cancelRequest(ctrl.loadCanceller);
+            ctrl.__cancelRequest(ctrl.zoomCanceller);
+
             // workaround to remove tooltips when dialog is closed: dialog is closed before 
             // nvd3 has time to remove tooltips elements
             const tooltips = $("div[id^='nvtooltip']");
@@ -424,6 +486,8 @@ angular.module('Cleep').component('chart', {
                             break;
                         case 'pie':
                             ctrl.chartRequestOptions.output = 'dict';
+                            // one value per field computed by backend
+                            ctrl.chartRequestOptions.aggregate = ctrl.options.aggregate || 'sum';
                             break;
                         default:
                             // invalid type specified
@@ -443,6 +507,16 @@ angular.module('Cleep').component('chart', {
                     ctrl.chartRequestOptions.fields = ctrl.options.fields;
                 }
 
+                // data resolution: backend returns rows according to chart width ('average' or 'lttb' reduction)
+                const width = ctrl.__getRequestWidth();
+                if (width && ctrl.options.type!=='pie') {
+                    ctrl.chartRequestOptions.width = width;
+                    ctrl.chartRequestOptions.pixel_ratio = $window.devicePixelRatio || 1;
+                }
+                if (!angular.isUndefined(ctrl.options.reduction) && ctrl.options.reduction!==null) {
+                    ctrl.chartRequestOptions.reduction = ctrl.options.reduction;
+                }
+
                 // force values format
                 /*if (!angular.isUndefined(ctrl.options.format) && ctrl.options.format!==null) {
                     ctrl.defaultFormat = ctrl.options.format;
@@ -468,16 +542,90 @@ angular.module('Cleep').component('chart', {
                         ctrl.chartOptions.chart.color = [ctrl.options.color];
                     }
                 }
+
+                // renderer (canvas renderer is only available for line and bar charts)
+                ctrl.renderer = 'svg';
+                if (ctrl.options.renderer==='canvas' && ['line', 'bar'].includes(ctrl.options.type)) {
+                    ctrl.renderer = 'canvas';
+                    ctrl.canvasOptions = {
+                        type: ctrl.options.type,
+                        height: ctrl.chartOptions.chart.height,
+                        color: ctrl.chartOptions.chart.color,
+                        xFormat: function(d) {
+                            return ctrl.customTimeFormat(moment(d,'X').toDate());
+                        },
+                        yFormat: ctrl.format,
+                    };
+                }
             }
         };
 
         /**
          * Finalize chart options according to directive options
          * @param data: data to parse for charting
+         * @param maxPoints: max number of points of each serie (default 2 points per pixel)
+         */
+        ctrl.__finalizeChartOptions = function(data, maxPoints) {
+            // transform big data in worker to keep UI responsive
+            if (['line', 'bar', 'multibar'].includes(ctrl.options.type) && chartsWorkerService.isAvailable()) {
+                const generation = ctrl.loadGeneration;
+                chartsWorkerService.computeChartValues(ctrl.options.type, data, maxPoints || ctrl.__getMaxPoints())
+                    .then(function(chartData) {
+                        // data was reloaded meanwhile
+                        if (generation===ctrl.loadGeneration) {
+                            ctrl.__setChartData(chartData);
+                        }
+                    })
+                    .catch(function(error) {
+                        console.warn('Chart data computed on main thread:', error);
+                        if (generation===ctrl.loadGeneration) {
+                            ctrl.__setChartData(ctrl.__computeChartValues(data));
+                        }
+                    });
+                return;
+            }
+
+            ctrl.__setChartData(ctrl.__computeChartValues(data));
+        };
+
+        /**
+         * Return max number of points displayed by serie (2 points per pixel)
+         */
+        ctrl.__getMaxPoints = function() {
+            const width = $element[0].clientWidth || 1000;
+            return Math.ceil(width * 2);
+        };
+
+        /**
+         * Return chart width sent in data requests (rounded up to 100 pixels to reuse cached
+         * responses for close widths), 0 if chart is not displayed yet
+         */
+        ctrl.__getRequestWidth = function() {
+            return Math.ceil($element[0].clientWidth / 100) * 100;
+        };
+
+        /**
+         * Window resize callback: request data again (debounced) if chart width changed
+         * more than 10% since last request
+         */
+        ctrl.__onResize = function() {
+            $timeout.cancel(ctrl.resizeTimer);
+            ctrl.resizeTimer = $timeout(function() {
+                const requestedWidth = ctrl.chartRequestOptions.width;
+                const width = ctrl.__getRequestWidth();
+                if (!ctrl.loading && requestedWidth && width && Math.abs(width - requestedWidth) > requestedWidth * 0.1) {
+                    ctrl.loadChartData();
+                }
+            }, 500);
+        };
+
+        /**
+         * Compute chart values according to chart type
+         * @param data: data to parse for charting
          */
-        ctrl.__finalizeChartOptions = function(data) {
+        ctrl.__computeChartValues = function(data) {
             let chartData = [];
-            
+
             switch (ctrl.options.type) {
                 case 'line':
                     chartData = ctrl.__computeLineChartValues(data);
@@ -493,6 +641,14 @@ angular.module('Cleep').component('chart', {
                     break;
             }
 
+            return chartData;
+        };
+
+        /**
+         * Set chart data
+         * @param chartData: computed chart values
+         */
+        ctrl.__setChartData = function(chartData) {
             // display legend only if there are some values (except for pie chart)
             if (chartData.length>1 && ctrl.options.type!=='pie') {
                 ctrl.chartOptions.chart.showLegend = true;
@@ -502,6 +658,117 @@ angular.module('Cleep').component('chart', {
             // set chart data and loading flag
             ctrl.chartData = chartData;
             ctrl.loading = false;
+
+            // whole range data extent, used to detect unzoom
+            if (!ctrl.zoomed) {
+                const values = chartData[0]?.values || [];
+                ctrl.zoomBoundary = values.length ? [values[0][0], values[values.length - 1][0]] : null;
+            }
+        };
+
+        /**
+         * nvd3 zoom callback (line and bar charts)
+         * @return chart domains
+         */
+        ctrl.__onNvd3Zoom = function(xDomain, yDomain) {
+            // time scale domain is made of dates built from timestamps
+            ctrl.__onZoom(Number(xDomain[0]), Number(xDomain[1]));
+            return { x1: xDomain[0], x2: xDomain[1], y1: yDomain[0], y2: yDomain[1] };
+        };
+
+        /**
+         * nvd3 unzoom callback (line and bar charts)
+         * @return whole range chart domains
+         */
+        ctrl.__onNvd3Unzoom = function(xDomain, yDomain) {
+            ctrl.__onZoom(null, null);
+            const boundary = ctrl.zoomBoundary || xDomain;
+            return { x1: boundary[0], x2: boundary[1], y1: yDomain[0], y2: yDomain[1] };
+        };
+
+        /**
+         * Zoom callback: chart displays loaded data of zoomed range immediately, then finer data
+         * of zoomed range is requested (debounced) and merged into whole range data
+         * @param start: zoomed range start timestamp (null if unzoomed)
+         * @param end: zoomed range end timestamp (null if unzoomed)
+         */
+        ctrl.__onZoom = function(start, end) {
+            $timeout.cancel(ctrl.zoomTimer);
+            ctrl.zoomGeneration++;
+            ctrl.__cancelRequest(ctrl.zoomCanceller);
+
+            const boundary = ctrl.zoomBoundary;
+            const unzoomed = start===null || !boundary || (start<=boundary[0] && end>=boundary[1]);
+            if (unzoomed) {
+                if (ctrl.zoomed) {
+                    // restore whole range data
+                    ctrl.zoomed = false;
+                    ctrl.__finalizeChartOptions(ctrl.coarseData);
+                }
+                return;
+            }
+
+            // whole range data is not averaged, there is no finer data
+            if (!ctrl.coarseData || !ctrl.coarseAveraged) {
+                return;
+            }
+
+            ctrl.zoomTimer = $timeout(function() {
+                ctrl.__loadZoomData(Math.max(Math.floor(start), boundary[0]), Math.min(Math.ceil(end), boundary[1]));
+            }, 300);
+        };
+
+        /**
+         * Load data of zoomed range at chart resolution
+         */
+        ctrl.__loadZoomData = function(start, end) {
+            const generation = ctrl.zoomGeneration;
+            ctrl.zoomCanceller = $q.defer();
+            // zoomed range is displayed so it is loaded before other charts
+            chartsService.getDeviceData(ctrl.getDeviceUuid(), start, end, ctrl.chartRequestOptions, 2, ctrl.zoomCanceller.promise)
+                .then(function(resp) {
+                    if (generation!==ctrl.zoomGeneration || resp.error) {
+                        // superseded by another zoom or data reload
+                        return;
+                    }
+                    ctrl.zoomed = true;
+                    const data = ctrl.__mergeZoomData(ctrl.coarseData, resp.data.data, start, end);
+                    // whole range and zoomed range points
+                    ctrl.__finalizeChartOptions(data, ctrl.__getMaxPoints() * 2);
+                })
+                .catch(function(error) {
+                    if (!error?.cancelled) {
+                        console.error(error);
+                    }
+                });
+        };
+
+        /**
+         * Cancel data request (not sent if still queued, response ignored otherwise)
+         * @param canceller: request canceller (deferred)
+         */
+        ctrl.__cancelRequest = function(canceller) {
+            if (canceller) {
+                canceller.resolve();
+            }
+        };
+
+        /**
+         * Replace whole range data of zoomed range by zoomed range data (list output)
+         * @return merged data
+         */
+        ctrl.__mergeZoomData = function(coarseData, zoomData, start, end) {
+            const data = {};
+            for (const name in coarseData) {
+                const values = coarseData[name].values;
+                data[name] = {
+                    name: coarseData[name].name,
+                    values: values.filter((value) => value[0] < start)
+                        .concat(zoomData[name]?.values || [])
+                        .concat(values.filter((value) => value[0] > end)),
+                };
+            }
+            return data;
         };
         
         /**
@@ -585,15 +852,17 @@ angular.module('Cleep').component('chart', {
 
             for (let value of data) {
                 let index = 0;
+                let lastValue = null;
                 for (const serie of series) {
-                    const lastValue = {
+                    const y0 = index===0 ? 0 : lastValue.y + lastValue.y0;
+                    lastValue = {
                         x: value.ts,
                         y: value[serie],
-                        y0: index===0 ? 0 : lastValue.y + lastValue.y0,
+                        y0,
                         series: index,
                         key: serie,
                         size: value[serie],
-                        y1: value[serie] + (index===0 ? 0 : lastValue.y + lastValue.y0),
+                        y1: value[serie] + y0,
                     };
                     values[index].values.push(lastValue);
                     index++;
@@ -631,6 +900,19 @@ angular.module('Cleep').component('chart', {
             // set loading flag
             ctrl.loading = true;
 
+            // drop zoomed range
+            $timeout.cancel(ctrl.zoomTimer);
+            ctrl.zoomGeneration++;
+            ctrl.__cancelRequest(ctrl.zoomCanceller);
+            ctrl.zoomed = false;
+            ctrl.coarseData = null;
+
+            // drop previous request, its response would race with this one
+            ctrl.loadGeneration++;
+            ctrl.__cancelRequest(ctrl.loadCanceller);
+            const generation = ctrl.loadGeneration;
+            const isStale = () => generation!==ctrl.loadGeneration;
+
             // prepare chart options
             ctrl.__prepareChartOptions();
 
@@ -639,24 +921,38 @@ angular.module('Cleep').component('chart', {
                 // load user data
                 ctrl.options.loadData(ctrl.timestampStart, ctrl.timestampEnd)
                     .then(function(resp) {
-                        ctrl.__finalizeChartOptions(resp);
+                        if (!isStale()) {
+                            ctrl.__finalizeChartOptions(resp);
+                        }
                     })
                     .catch(function(error) {
                         // unable to get data, stop loading
-                        console.error(error);
-                        ctrl.loading = false;
+                        if (!isStale()) {
+                            console.error(error);
+                            ctrl.loading = false;
+                        }
                     });
             } else {
                 // load device data
                 const deviceUuid = ctrl.getDeviceUuid();
-                chartsService.getDeviceData(deviceUuid, ctrl.timestampStart, ctrl.timestampEnd, ctrl.chartRequestOptions)
+                // visible charts are loaded first, visibility may change while request is queued
+                const priority = () => (ctrl.visible ? 1 : 0);
+                ctrl.loadCanceller = $q.defer();
+                chartsService.getDeviceData(deviceUuid, ctrl.timestampStart, ctrl.timestampEnd, ctrl.chartRequestOptions, priority, ctrl.loadCanceller.promise)
                     .then(function(resp) {
+                        if (isStale()) {
+                            return;
+                        }
+                        ctrl.coarseData = resp.data.data;
+                        ctrl.coarseAveraged = resp.data.averaged;
                         ctrl.__finalizeChartOptions(resp.data.data);
                     })
                     .catch(function(error) {
                         // unable to get data, stop loading
-                        console.error(error);
-                        ctrl.loading = false;
+                        if (!isStale()) {
+                            console.error(error);
+                            ctrl.loading = false;
+                        }
                     });
             }
         };
@@ -676,9 +972,299 @@ angular.module('Cleep').component('chart', {
             ctrl.timestampEnd = Number(moment().format('X'));
             ctrl.timestampStart = ctrl.timestampEnd - ctrl.rangeSelector;
 
-            // load new chart data
-            ctrl.loadChartData();
+            // load new chart data (debounced to send only last range of quick changes)
+            $timeout.cancel(ctrl.rangeTimer);
+            ctrl.rangeTimer = $timeout(function() {
+                ctrl.loadChartData();
+            }, 300);
         };
     }
 });
 
+
+angular.module('Cleep').component('chartCanvas', {
+    template: `
+    <div style="position:relative;">
+        <canvas></canvas>
+        <div ng-if="$ctrl.tooltip" class="md-whiteframe-1dp" ng-style="$ctrl.tooltip.style" style="position:absolute; pointer-events:none; padding:4px 8px; background:white; font-size:12px;">
+            <div><b>{{ $ctrl.tooltip.title }}</b></div>
+            <div ng-repeat="item in $ctrl.tooltip.items">
+                <span ng-style="{'color': item.color}">&#9632;</span> {{ item.key }}: {{ item.value }}
+            </div>
+        </div>
+    </div>
+    `,
+    bindings: {
+        data: '<',
+        options: '<',
+        onZoom: '&',
+    },
+    controller: function ($element, $window, $scope) {
+        // Canvas renderer for line (stacked areas) and bar charts. It draws the same data
+        // shape as nvd3 charts ([{ key, values: [[timestamp, value], ...] }, ...]) but
+        // without creating DOM elements for each point, so large series stay fast.
+        // Mouse wheel zooms, drag pans and double click unzooms (onZoom is called with
+        // displayed range, or null bounds when unzoomed).
+        const ctrl = this;
+        ctrl.tooltip = null;
+        // displayed timestamps range (null to display whole data)
+        ctrl.domain = null;
+        ctrl.drag = null;
+        ctrl.margin = { top: 20, right: 20, bottom: 30, left: 50 };
+        ctrl.colors = d3.scale.category10().range();
+
+        ctrl.$postLink = function () {
+            ctrl.canvas = $element.find('canvas')[0];
+            ctrl.canvas.addEventListener('mousemove', ctrl.onMouseMove);
+            ctrl.canvas.addEventListener('mouseleave', ctrl.onMouseLeave);
+            ctrl.canvas.addEventListener('wheel', ctrl.onWheel);
+            ctrl.canvas.addEventListener('mousedown', ctrl.onMouseDown);
+            ctrl.canvas.addEventListener('dblclick', ctrl.onDoubleClick);
+            $window.addEventListener('mouseup', ctrl.onMouseUp);
+            $window.addEventListener('resize', ctrl.draw);
+            ctrl.draw();
+        };
+
+        ctrl.$onChanges = function () {
+            if (ctrl.canvas) {
+                ctrl.draw();
+            }
+        };
+
+        ctrl.$onDestroy = function () {
+            $window.removeEventListener('resize', ctrl.draw);
+            $window.removeEventListener('mouseup', ctrl.onMouseUp);
+            if (ctrl.canvas) {
+                ctrl.canvas.removeEventListener('mousemove', ctrl.onMouseMove);
+                ctrl.canvas.removeEventListener('mouseleave', ctrl.onMouseLeave);
+                ctrl.canvas.removeEventListener('wheel', ctrl.onWheel);
+                ctrl.canvas.removeEventListener('mousedown', ctrl.onMouseDown);
+                ctrl.canvas.removeEventListener('dblclick', ctrl.onDoubleClick);
+            }
+        };
+
+        /**
+         * Compute series values to draw (stacked for line chart)
+         */
+        ctrl.__computeSeries = function () {
+            const series = [];
+            let previous = null;
+            (ctrl.data || []).forEach(function (serie, index) {
+                const values = serie.values.map(function (value, valueIndex) {
+                    const base = ctrl.options.type === 'line' && previous ? previous[valueIndex][2] : 0;
+                    return [value[0], base, base + (value[1] || 0)];
+                });
+                series.push({
+                    key: serie.key,
+                    color: ctrl.__getColor(index),
+                    values,
+                });
+                previous = values;
+            });
+            return series;
+        };
+
+        ctrl.__getColor = function (index) {
+            const colors = ctrl.options?.color || ctrl.colors;
+            return colors[index % colors.length];
+        };
+
+        /**
+         * Draw chart
+         */
+        ctrl.draw = function () {
+            const canvas = ctrl.canvas;
+            const ratio = $window.devicePixelRatio || 1;
+            const width = canvas.parentElement.clientWidth;
+            const height = ctrl.options?.height || 400;
+            canvas.width = width * ratio;
+            canvas.height = height * ratio;
+            canvas.style.width = width + 'px';
+            canvas.style.height = height + 'px';
+
+            const context = canvas.getContext('2d');
+            context.setTransform(ratio, 0, 0, ratio, 0, 0);
+            context.clearRect(0, 0, width, height);
+
+            ctrl.series = ctrl.__computeSeries();
+            const timestamps = ctrl.series.length ? ctrl.series[0].values.map((value) => value[0]) : [];
+            if (timestamps.length === 0) {
+                return;
+            }
+
+            // scales
+            let yMin = 0;
+            let yMax = 0;
+            for (const serie of ctrl.series) {
+                for (const value of serie.values) {
+                    yMin = Math.min(yMin, value[2]);
+                    yMax = Math.max(yMax, value[2]);
+                }
+            }
+            const plotWidth = width - ctrl.margin.left - ctrl.margin.right;
+            const plotHeight = height - ctrl.margin.top - ctrl.margin.bottom;
+            ctrl.extent = [timestamps[0], timestamps[timestamps.length - 1]];
+            ctrl.xScale = d3.scale.linear()
+                .domain(ctrl.domain || ctrl.extent)
+                .range([ctrl.margin.left, ctrl.margin.left + plotWidth]);
+            ctrl.yScale = d3.scale.linear()
+                .domain([yMin, yMax === yMin ? yMin + 1 : yMax])
+                .range([ctrl.margin.top + plotHeight, ctrl.margin.top])
+                .nice();
+
+            ctrl.__drawAxes(context, plotWidth, plotHeight);
+            context.save();
+            context.beginPath();
+            context.rect(ctrl.margin.left, ctrl.margin.top, plotWidth, plotHeight);
+            context.clip();
+            if (ctrl.options.type === 'bar') {
+                const domain = ctrl.xScale.domain();
+                const displayed = timestamps.filter((timestamp) => timestamp >= domain[0] && timestamp <= domain[1]).length;
+                ctrl.__drawBars(context, plotWidth, Math.max(1, displayed));
+            } else {
+                ctrl.__drawAreas(context);
+            }
+            context.restore();
+        };
+
+        ctrl.__drawAxes = function (context, plotWidth, plotHeight) {
+            context.strokeStyle = '#e5e5e5';
+            context.fillStyle = '#000';
+            context.font = '12px sans-serif';
+            context.lineWidth = 1;
+
+            context.textAlign = 'right';
+            context.textBaseline = 'middle';
+            for (const tick of ctrl.yScale.ticks(5)) {
+                const y = Math.round(ctrl.yScale(tick)) + 0.5;
+                context.beginPath();
+                context.moveTo(ctrl.margin.left, y);
+                context.lineTo(ctrl.margin.left + plotWidth, y);
+                context.stroke();
+                context.fillText(ctrl.__formatValue(tick), ctrl.margin.left - 5, y);
+            }
+
+            context.textAlign = 'center';
+            context.textBaseline = 'top';
+            for (const tick of ctrl.xScale.ticks(Math.max(2, Math.floor(plotWidth / 150)))) {
+                const label = ctrl.options.xFormat ? ctrl.options.xFormat(tick) : tick;
+                context.fillText(label, ctrl.xScale(tick), ctrl.margin.top + plotHeight + 8);
+            }
+        };
+
+        ctrl.__drawAreas = function (context) {
+            for (const serie of ctrl.series) {
+                context.beginPath();
+                serie.values.forEach(function (value, index) {
+                    const x = ctrl.xScale(value[0]);
+                    const y = ctrl.yScale(value[2]);
+                    index === 0 ? context.moveTo(x, y) : context.lineTo(x, y);
+                });
+                for (let index = serie.values.length - 1; index >= 0; index--) {
+                    context.lineTo(ctrl.xScale(serie.values[index][0]), ctrl.yScale(serie.values[index][1]));
+                }
+                context.closePath();
+                context.globalAlpha = 0.7;
+                context.fillStyle = serie.color;
+                context.fill();
+                context.globalAlpha = 1;
+            }
+        };
+
+        ctrl.__drawBars = function (context, plotWidth, count) {
+            const barWidth = Math.max(1, plotWidth / count - 1);
+            for (const serie of ctrl.series) {
+                context.fillStyle = serie.color;
+                for (const value of serie.values) {
+                    const top = ctrl.yScale(Math.max(value[1], value[2]));
+                    const bottom = ctrl.yScale(Math.min(value[1], value[2]));
+                    context.fillRect(ctrl.xScale(value[0]) - barWidth / 2, top, barWidth, Math.max(1, bottom - top));
+                }
+            }
+        };
+
+        /**
+         * Display tooltip of value nearest to mouse position
+         */
+        ctrl.onMouseMove = function (event) {
+            if (ctrl.drag) {
+                // pan displayed range
+                const ratio = (ctrl.drag.domain[1] - ctrl.drag.domain[0]) / (ctrl.xScale.range()[1] - ctrl.xScale.range()[0]);
+                const shift = (ctrl.drag.x - event.offsetX) * ratio;
+                ctrl.__setDomain(ctrl.drag.domain[0] + shift, ctrl.drag.domain[1] + shift);
+                return;
+            }
+            if (!ctrl.series?.length || !ctrl.series[0].values.length) {
+                return;
+            }
+            const values = ctrl.series[0].values;
+            const timestamp = ctrl.xScale.invert(event.offsetX);
+            const index = Math.min(values.length - 1, d3.bisector((value) => value[0]).left(values, timestamp));
+            const nearest = index > 0 && timestamp - values[index - 1][0] < values[index][0] - timestamp ? index - 1 : index;
+
+            $scope.$evalAsync(function () {
+                ctrl.tooltip = {
+                    title: ctrl.options.xFormat ? ctrl.options.xFormat(values[nearest][0]) : values[nearest][0],
+                    items: ctrl.series.map((serie) => ({
+                        key: serie.key,
+                        color: serie.color,
+                        value: ctrl.__formatValue(ctrl.data[ctrl.series.indexOf(serie)].values[nearest][1]),
+                    })),
+                    style: {
+                        left: Math.min(event.offsetX + 15, ctrl.canvas.parentElement.clientWidth - 150) + 'px',
+                        top: (ctrl.margin.top + 10) + 'px',
+                    },
+                };
+            });
+        };
+
+        ctrl.__formatValue = function (value) {
+            return ctrl.options.yFormat ? ctrl.options.yFormat(value) : value;
+        };
+
+        /**
+         * Set displayed range (kept inside data extent) and notify it
+         */
+        ctrl.__setDomain = function (start, end) {
+            const span = Math.min(end - start, ctrl.extent[1] - ctrl.extent[0]);
+            start = Math.max(ctrl.extent[0], Math.min(start, ctrl.extent[1] - span));
+            end = start + span;
+            ctrl.domain = end - start < ctrl.extent[1] - ctrl.extent[0] ? [start, end] : null;
+            ctrl.draw();
+            ctrl.onZoom({ start: ctrl.domain ? start : null, end: ctrl.domain ? end : null });
+        };
+
+        ctrl.onWheel = function (event) {
+            if (!ctrl.extent) {
+                return;
+            }
+            event.preventDefault();
+            const domain = ctrl.xScale.domain();
+            const timestamp = ctrl.xScale.invert(event.offsetX);
+            const factor = event.deltaY < 0 ? 0.8 : 1.25;
+            ctrl.__setDomain(timestamp - (timestamp - domain[0]) * factor, timestamp + (domain[1] - timestamp) * factor);
+        };
+
+        ctrl.onMouseDown = function (event) {
+            if (ctrl.domain) {
+                ctrl.drag = { x: event.offsetX, domain: ctrl.domain };
+            }
+        };
+
+        ctrl.onMouseUp = function () {
+            ctrl.drag = null;
+        };
+
+        ctrl.onDoubleClick = function () {
+            if (ctrl.domain) {
+                ctrl.__setDomain(ctrl.extent[0], ctrl.extent[1]);
+            }
+        };
+
+        ctrl.onMouseLeave = function () {
+            $scope.$evalAsync(function () {
+                ctrl.tooltip = null;
+            });
+        };
+    },
+});
@@ -4,16 +4,401 @@
  */
 angular
 .module('Cleep')
-.service('chartsService', ['rpcService',
-function(rpcService) {
+.service('chartsService', ['rpcService', '$q',
+function(rpcService, $q) {
     var self = this;
-    
+    // max number of cached responses
+    self.CACHE_SIZE = 20;
+    // cached responses lifetime (in seconds)
+    self.CACHE_TTL = 600;
+    // range bounds shift accepted to serve request from cache (in seconds)
+    self.CACHE_TOLERANCE = 60;
+    // default max number of rows returned by get_data (backend MAX_POINTS)
+    self.MAX_POINTS = 5000;
+    // backend max number of rows returned by pixel of chart width (backend POINTS_PER_PIXEL)
+    self.POINTS_PER_PIXEL = 2;
+    // cached responses: [{ key, start, end, fetched, raw, resolution, resp }, ...] (most recently used last)
+    self.cache = [];
+    // in-flight requests by key and range: { promise, waiters, cancel }
+    self.pendingRequests = {};
+    // max number of get_data/get_stats commands running at the same time
+    self.MAX_CONCURRENT_REQUESTS = 2;
+    self.runningRequests = 0;
+    // requests waiting for a free slot: [{ send, priority, deferred }, ...]
+    self.queuedRequests = [];
+    // seconds a get_data command is waited for, backend abandons it after that
+    self.REQUEST_TIMEOUT = 30;
+
     /**
      * Get graph data for specified device
+     * Responses are cached: identical in-flight requests are sent once, ranges included in
+     * already loaded raw data (not averaged, bucketed, transformed nor limited) are served without
+     * request and ranges extending cached raw data only request the missing end. Chart width is
+     * not part of cache key: other responses are reused if they were requested for a chart at
+     * least as wide.
+     * @param priority: request priority (requests with higher priority are sent first, default 0). Can be
+     *                  a function returning current priority, it is evaluated each time a request is dequeued
+     * @param canceller: promise resolved when response is not needed anymore. Request is not sent
+     *                   if it is still queued and no other caller waits for it (optional)
+     */
+    self.getDeviceData = function(uuid, timestampStart, timestampEnd, options, priority, canceller) {
+        const key = self.__getCacheKey(uuid, options);
+        const requestKey = uuid + '|' + angular.toJson(options || {}) + '|' + timestampStart + '|' + timestampEnd;
+        if (self.pendingRequests[requestKey]) {
+            return self.__waitPendingRequest(self.pendingRequests[requestKey], canceller);
+        }
+
+        const now = Number(moment().format('X'));
+        self.cache = self.cache.filter((entry) => now - entry.fetched <= self.CACHE_TTL);
+        const entry = self.__findCacheEntry(key, timestampStart, timestampEnd, self.__getResolution(options));
+        if (entry) {
+            self.__touchCacheEntry(entry);
+            return $q.resolve(self.__sliceResponse(entry.resp, timestampStart, timestampEnd));
+        }
+
+        const pending = { waiters: 0, cancel: $q.defer() };
+        const tailEntry = self.__findTailEntry(key, timestampStart, timestampEnd, options);
+        let promise;
+        if (tailEntry) {
+            // only request data stored after cached one
+            promise = self.__sendGetData(uuid, tailEntry.end + 1, timestampEnd, options, priority, pending.cancel.promise)
+                .then(function(resp) {
+                    if (resp.error || resp.data.averaged) {
+                        // too many new rows to merge them, request whole range
+                        return self.__requestDeviceData(key, uuid, timestampStart, timestampEnd, options, priority, pending.cancel.promise);
+                    }
+                    // keep requested range only, cached entry must not grow endlessly
+                    self.__mergeResponse(tailEntry.resp, resp);
+                    const merged = self.__sliceResponse(tailEntry.resp, timestampStart, timestampEnd);
+                    if (self.__countRows(merged) > self.__getMaxPoints(options)) {
+                        // backend would have averaged this range
+                        self.cache.splice(self.cache.indexOf(tailEntry), 1);
+                        return self.__requestDeviceData(key, uuid, timestampStart, timestampEnd, options, priority, pending.cancel.promise);
+                    }
+                    // fetch time is kept: entry still expires after cache lifetime
+                    tailEntry.resp = merged;
+                    tailEntry.start = timestampStart;
+                    tailEntry.end = timestampEnd;
+                    self.__touchCacheEntry(tailEntry);
+                    return self.__sliceResponse(tailEntry.resp, timestampStart, timestampEnd);
+                });
+        } else {
+            promise = self.__requestDeviceData(key, uuid, timestampStart, timestampEnd, options, priority, pending.cancel.promise);
+        }
+
+        pending.promise = promise.finally(function() {
+            delete self.pendingRequests[requestKey];
+        });
+        self.pendingRequests[requestKey] = pending;
+        return self.__waitPendingRequest(pending, canceller);
+    };
+
+    /**
+     * Register caller of in-flight request, request is cancelled when all its callers cancelled it
+     * @return request promise
+     */
+    self.__waitPendingRequest = function(pending, canceller) {
+        pending.waiters++;
+        if (canceller) {
+            canceller.then(function() {
+                pending.waiters--;
+                if (pending.waiters===0) {
+                    pending.cancel.resolve();
+                }
+            });
+        }
+        return pending.promise;
+    };
+
+    /**
+     * Clear cached data of specified device (all devices if not specified)
+     */
+    self.clearDeviceDataCache = function(uuid) {
+        self.cache = self.cache.filter((entry) => uuid && !entry.key.startsWith(uuid + '|'));
+    };
+
+    /**
+     * Send get_data command
+     */
+    self.__sendGetData = function(uuid, timestampStart, timestampEnd, options, priority, canceller) {
+        // backend stops working on request when nobody waits for its response anymore
+        const requestOptions = Object.assign({ timeout: self.REQUEST_TIMEOUT }, options);
+        return self.__schedule(function() {
+            return rpcService.sendCommand('get_data', 'charts', {'device_uuid':uuid, 'timestamp_start':timestampStart, 'timestamp_end':timestampEnd, 'options':requestOptions});
+        }, priority, canceller);
+    };
+
+    /**
+     * Schedule request to limit number of heavy commands running at the same time on device
+     * @param send: function sending request and returning its promise
+     * @param priority: request priority or function returning it (default 0)
+     * @param canceller: promise resolved to drop request if it is still queued (optional)
+     * @return promise resolved with request response, rejected with { cancelled: true } if cancelled
+     */
+    self.__schedule = function(send, priority, canceller) {
+        const deferred = $q.defer();
+        const request = { send, priority, deferred };
+        self.queuedRequests.push(request);
+        if (canceller) {
+            canceller.then(function() {
+                const index = self.queuedRequests.indexOf(request);
+                if (index>=0) {
+                    self.queuedRequests.splice(index, 1);
+                    deferred.reject({ cancelled: true });
+                }
+            });
+        }
+        self.__runQueuedRequests();
+        return deferred.promise;
+    };
+
+    /**
+     * Return current request priority
+     */
+    self.__getPriority = function(priority) {
+        const value = angular.isFunction(priority) ? priority() : priority;
+        return value || 0;
+    };
+
+    /**
+     * Send queued requests while there are free slots (highest priority first, then oldest)
+     */
+    self.__runQueuedRequests = function() {
+        while (self.runningRequests < self.MAX_CONCURRENT_REQUESTS && self.queuedRequests.length) {
+            // priorities may have changed while requests were queued
+            const priorities = self.queuedRequests.map((request) => self.__getPriority(request.priority));
+            let next = 0;
+            priorities.forEach(function(priority, index) {
+                if (priority > priorities[next]) {
+                    next = index;
+                }
+            });
+            const request = self.queuedRequests.splice(next, 1)[0];
+            self.runningRequests++;
+            $q.when(request.send())
+                .then(request.deferred.resolve, request.deferred.reject)
+                .finally(function() {
+                    self.runningRequests--;
+                    self.__runQueuedRequests();
+                });
+        }
+    };
+
+    /**
+     * Request device data and cache response
+     */
+    self.__requestDeviceData = function(key, uuid, timestampStart, timestampEnd, options, priority, canceller) {
+        return self.__sendGetData(uuid, timestampStart, timestampEnd, options, priority, canceller)
+            .then(function(resp) {
+                if (!resp.error && resp.data) {
+                    self.cache.push({
+                        key,
+                        start: timestampStart,
+                        end: timestampEnd,
+                        fetched: Number(moment().format('X')),
+                        raw: !resp.data.averaged && self.__isRawRequest(options),
+                        resolution: self.__getResolution(options),
+                        resp,
+                    });
+                    if (self.cache.length > self.CACHE_SIZE) {
+                        self.cache.shift();
+                    }
+                    // cached response must not be altered by caller
+                    return self.__sliceResponse(resp, timestampStart, timestampEnd);
+                }
+                return resp;
+            });
+    };
+
+    /**
+     * Return cache key of request (chart width excluded)
+     */
+    self.__getCacheKey = function(uuid, options) {
+        const keyOptions = Object.assign({}, options);
+        delete keyOptions.width;
+        delete keyOptions.pixel_ratio;
+        return uuid + '|' + angular.toJson(keyOptions);
+    };
+
+    /**
+     * Return number of device pixels of chart width a request was made for (Infinity if not specified)
+     */
+    self.__getResolution = function(options) {
+        return options?.width ? options.width * (options.pixel_ratio || 1) : Infinity;
+    };
+
+    /**
+     * Return true if request returns stored rows as is (not bucketed, transformed, limited nor aggregated)
+     */
+    self.__isRawRequest = function(options) {
+        return !options?.bucket && !options?.transform && !options?.limit && !options?.aggregate;
+    };
+
+    /**
+     * Return max number of rows backend returns for specified options
+     */
+    self.__getMaxPoints = function(options) {
+        let maxPoints = options?.max_points || self.MAX_POINTS;
+        if (options?.width) {
+            maxPoints = Math.min(maxPoints, Math.max(1, Math.floor(options.width * (options.pixel_ratio || 1) * self.POINTS_PER_PIXEL)));
+        }
+        return maxPoints;
+    };
+
+    /**
+     * Return number of rows of response
+     */
+    self.__countRows = function(resp) {
+        if (angular.isArray(resp.data.data)) {
+            return resp.data.data.length;
+        }
+        const names = Object.keys(resp.data.data);
+        return names.length ? (resp.data.data[names[0]].values || []).length : 0;
+    };
+
+    /**
+     * Find cached response usable for specified range
+     * Raw data can be sliced to any included range, other data (averaged, bucketed...) is used only
+     * for the same range (shifted by less than cache tolerance, typically the same range requested
+     * a bit later) and requested for a chart at least as wide.
+     */
+    self.__findCacheEntry = function(key, timestampStart, timestampEnd, resolution) {
+        return self.cache.find((entry) => {
+            if (entry.key !== key) {
+                return false;
+            }
+            if (!entry.raw) {
+                return entry.resolution >= resolution
+                    && Math.abs(entry.start - timestampStart) <= self.CACHE_TOLERANCE
+                    && Math.abs(entry.end - timestampEnd) <= self.CACHE_TOLERANCE;
+            }
+            return entry.start <= timestampStart && timestampEnd <= entry.end + self.CACHE_TOLERANCE;
+        });
+    };
+
+    /**
+     * Find cached raw response that can be extended to specified range
+     * Not possible for descending sort, nor with max_bytes option (merged rows count can't be checked)
+     */
+    self.__findTailEntry = function(key, timestampStart, timestampEnd, options) {
+        if ((options?.sort && options.sort.toLowerCase() === 'desc') || options?.max_bytes) {
+            return undefined;
+        }
+        return self.cache.find((entry) => entry.key === key
+            && entry.raw
+            && entry.start <= timestampStart
+            && timestampStart <= entry.end
+            && entry.end < timestampEnd);
+    };
+
+    /**
+     * Move cache entry at end of cache (most recently used)
+     */
+    self.__touchCacheEntry = function(entry) {
+        self.cache.splice(self.cache.indexOf(entry), 1);
+        self.cache.push(entry);
+    };
+
+    /**
+     * Return copy of response with data in specified range only
      */
-    self.getDeviceData = function(uuid, timestampStart, timestampEnd, options) {
-        return rpcService.sendCommand('get_data', 'charts', {'device_uuid':uuid, 'timestamp_start':timestampStart, 'timestamp_end':timestampEnd, 'options':options});
+    self.__sliceResponse = function(resp, timestampStart, timestampEnd) {
+        const inRange = (ts) => ts >= timestampStart && ts <= timestampEnd;
+        let data;
+        if (angular.isArray(resp.data.data)) {
+            // dict output: [{ ts, field: value, ... }, ...]
+            data = resp.data.data.filter((row) => inRange(row.ts));
+        } else {
+            // list output: { field: { name, values: [[ts, value], ...] }, ... }
+            // or aggregate option: { field: { name, value }, ... } (not sliceable)
+            data = {};
+            for (const name in resp.data.data) {
+                const field = resp.data.data[name];
+                data[name] = angular.isUndefined(field.values) ? field : {
+                    name: field.name,
+                    values: field.values.filter((value) => inRange(value[0])),
+                };
+            }
+        }
+
+        return Object.assign({}, resp, { data: Object.assign({}, resp.data, { data }) });
+    };
+
+    /**
+     * Append data of response to cached response (ascending sort only)
+     */
+    self.__mergeResponse = function(cachedResp, resp) {
+        if (angular.isArray(cachedResp.data.data)) {
+            cachedResp.data.data = cachedResp.data.data.concat(resp.data.data);
+        } else {
+            for (const name in cachedResp.data.data) {
+                const values = resp.data.data[name]?.values || [];
+                cachedResp.data.data[name].values = cachedResp.data.data[name].values.concat(values);
+            }
+        }
+    };
+
+    /**
+     * Get statistics (count, min, max, mean, stddev, percentiles) for specified device
+     */
+    self.getDeviceStats = function(uuid, timestampStart, timestampEnd, options, priority, canceller) {
+        return self.__schedule(function() {
+            return rpcService.sendCommand('get_stats', 'charts', {'device_uuid':uuid, 'timestamp_start':timestampStart, 'timestamp_end':timestampEnd, 'options':options});
+        }, priority, canceller);
+    };
+
+    /**
+     * Get time spent in each state (value) of specified device fields
+     */
+    self.getDeviceStateDurations = function(uuid, timestampStart, timestampEnd, options, priority, canceller) {
+        return self.__schedule(function() {
+            return rpcService.sendCommand('get_state_durations', 'charts', {'device_uuid':uuid, 'timestamp_start':timestampStart, 'timestamp_end':timestampEnd, 'options':options});
+        }, priority, canceller);
+    };
+
+    /**
+     * Get fields of several devices resampled on the same time grid
+     * @param devices: list of devices ({ device_uuid, fields })
+     */
+    self.getAlignedData = function(devices, timestampStart, timestampEnd, options, priority, canceller) {
+        return self.__schedule(function() {
+            return rpcService.sendCommand('get_aligned_data', 'charts', {'devices':devices, 'timestamp_start':timestampStart, 'timestamp_end':timestampEnd, 'options':options});
+        }, priority, canceller);
+    };
+
+    /**
+     * Purge device data until specified time
+     * Cached data of device is cleared, it may contain purged rows
+     */
+    self.purgeDeviceData = function(uuid, timestampUntil) {
+        return rpcService.sendCommand('purge_data', 'charts', {'device_uuid':uuid, 'timestamp_until':timestampUntil})
+            .then(function(resp) {
+                if (!resp.error) {
+                    self.clearDeviceDataCache(uuid);
+                }
+                return resp;
+            });
+    };
+
+    /**
+     * Import data from archive
+     * Cached data of imported devices is cleared (all devices if not specified), imported rows may
+     * be inside cached ranges
+     * @param deviceUuids: list of device uuids to import (optional)
+     */
+    self.importData = function(archivePath, deviceUuids) {
+        return rpcService.sendCommand('import_data', 'charts', {'archive_path':archivePath, 'device_uuids':deviceUuids})
+            .then(function(resp) {
+                if (!resp.error) {
+                    if (deviceUuids) {
+                        deviceUuids.forEach((uuid) => self.clearDeviceDataCache(uuid));
+                    } else {
+                        self.clearDeviceDataCache();
+                    }
+                }
+                return resp;
+            });
     };
 
 }]);
-    
+
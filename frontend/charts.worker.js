@@ -0,0 +1,204 @@
+/**
+ * Charts worker service
+ * Transform chart data (downsampling to chart width, multibar stacking) in a web worker
+ * to keep UI responsive while charts are loading
+ */
+angular
+.module('Cleep')
+.service('chartsWorkerService', ['$q', '$window',
+function($q, $window) {
+    var self = this;
+    self.worker = null;
+    self.requests = {};
+    self.lastRequestId = 0;
+
+    /**
+     * Worker code (stringified and executed in worker context, no access to angular)
+     * Message format: { id, type, timestamps: Float64Array, series: [Float64Array, ...], maxPoints }
+     * Response format: { id, timestamps: Float64Array, series: [Float64Array, ...], bases: [Float64Array, ...] }
+     */
+    self.__workerMain = function() {
+        // return indexes of rows to keep: rows with min and max stacked total of each
+        // bucket (in time order), so peaks are kept and series stay aligned for stacking
+        function downsampleIndexes(count, series, maxPoints) {
+            if (count <= maxPoints) {
+                return null;
+            }
+            const bucketsCount = Math.floor(maxPoints / 2);
+            const indexes = [];
+            for (let bucket = 0; bucket < bucketsCount; bucket++) {
+                const start = Math.floor(bucket * count / bucketsCount);
+                const end = Math.floor((bucket + 1) * count / bucketsCount);
+                let minIndex = start;
+                let maxIndex = start;
+                let minTotal = Infinity;
+                let maxTotal = -Infinity;
+                for (let index = start; index < end; index++) {
+                    let total = 0;
+                    for (const values of series) {
+                        total += isNaN(values[index]) ? 0 : values[index];
+                    }
+                    if (total < minTotal) {
+                        minTotal = total;
+                        minIndex = index;
+                    }
+                    if (total > maxTotal) {
+                        maxTotal = total;
+                        maxIndex = index;
+                    }
+                }
+                indexes.push(Math.min(minIndex, maxIndex));
+                if (minIndex !== maxIndex) {
+                    indexes.push(Math.max(minIndex, maxIndex));
+                }
+            }
+            return indexes;
+        }
+
+        function pick(values, indexes) {
+            if (indexes === null) {
+                return values;
+            }
+            const picked = new Float64Array(indexes.length);
+            indexes.forEach(function(index, position) {
+                picked[position] = values[index];
+            });
+            return picked;
+        }
+
+        onmessage = function(event) {
+            const message = event.data;
+            const indexes = downsampleIndexes(message.timestamps.length, message.series, message.maxPoints);
+            const timestamps = pick(message.timestamps, indexes);
+            const series = message.series.map((values) => pick(values, indexes));
+
+            // stack bases (multibar only)
+            const bases = [];
+            if (message.type === 'multibar') {
+                let base = new Float64Array(timestamps.length);
+                for (const values of series) {
+                    bases.push(base);
+                    const next = new Float64Array(timestamps.length);
+                    for (let index = 0; index < timestamps.length; index++) {
+                        next[index] = base[index] + (isNaN(values[index]) ? 0 : values[index]);
+                    }
+                    base = next;
+                }
+            }
+
+            const transfer = [timestamps.buffer].concat(series.map((values) => values.buffer), bases.map((values) => values.buffer));
+            postMessage({ id: message.id, timestamps, series, bases }, transfer);
+        };
+    };
+
+    /**
+     * Return true if web workers are supported
+     */
+    self.isAvailable = function() {
+        return !angular.isUndefined($window.Worker) && !angular.isUndefined($window.Blob);
+    };
+
+    /**
+     * Return worker (created at first call)
+     */
+    self.__getWorker = function() {
+        if (self.worker === null) {
+            const source = '(' + self.__workerMain.toString() + ')();';
+            const url = $window.URL.createObjectURL(new $window.Blob([source], { type: 'application/javascript' }));
+            self.worker = new $window.Worker(url);
+            self.worker.onmessage = self.__onWorkerMessage;
+            self.worker.onerror = self.__onWorkerError;
+        }
+        return self.worker;
+    };
+
+    self.__onWorkerMessage = function(event) {
+        const request = self.requests[event.data.id];
+        if (request) {
+            delete self.requests[event.data.id];
+            request.resolve(request.decode(event.data));
+        }
+    };
+
+    self.__onWorkerError = function(error) {
+        // reject all pending requests, they will be computed on main thread
+        for (const id in self.requests) {
+            self.requests[id].reject(error);
+        }
+        self.requests = {};
+    };
+
+    /**
+     * Compute chart values in worker
+     * Result has the same format than chart component __computeXXXChartValues functions
+     * @param type: chart type (line, bar or multibar)
+     * @param data: get_data response data (list output for line and bar, dict output for multibar)
+     * @param maxPoints: max number of points of each serie (typically 2 points per pixel)
+     * @return promise
+     */
+    self.computeChartValues = function(type, data, maxPoints) {
+        let names;
+        let keys;
+        let timestamps;
+        let series;
+        if (type === 'multibar') {
+            // dict output: [{ ts, field: value, ... }, ...]
+            names = Object.keys(data[0] || {}).filter((name) => name !== 'ts');
+            keys = names;
+            timestamps = Float64Array.from(data, (row) => row.ts);
+            series = names.map((name) => Float64Array.from(data, (row) => row[name] ?? NaN));
+        } else {
+            // list output: { field: { name, values: [[ts, value], ...] }, ... }
+            names = Object.keys(data);
+            keys = type === 'line' ? names.map((name) => data[name].name) : names;
+            const first = names.length ? data[names[0]].values : [];
+            timestamps = Float64Array.from(first, (value) => value[0]);
+            series = names.map((name) => Float64Array.from(data[name].values, (value) => value[1] ?? NaN));
+        }
+
+        const deferred = $q.defer();
+        const id = ++self.lastRequestId;
+        self.requests[id] = {
+            resolve: deferred.resolve,
+            reject: deferred.reject,
+            decode: (result) => self.__decode(type, keys, result),
+        };
+        try {
+            const transfer = [timestamps.buffer].concat(series.map((values) => values.buffer));
+            self.__getWorker().postMessage({ id, type, timestamps, series, maxPoints }, transfer);
+        } catch (error) {
+            delete self.requests[id];
+            deferred.reject(error);
+        }
+
+        return deferred.promise;
+    };
+
+    /**
+     * Build chart values from worker result (only downsampled points are built on main thread)
+     */
+    self.__decode = function(type, keys, result) {
+        const value = (values, index) => isNaN(values[index]) ? null : values[index];
+        return keys.map(function(key, serieIndex) {
+            const values = result.series[serieIndex];
+            const points = new Array(result.timestamps.length);
+            for (let index = 0; index < result.timestamps.length; index++) {
+                if (type === 'multibar') {
+                    const y = value(values, index);
+                    const y0 = result.bases[serieIndex][index];
+                    points[index] = { x: result.timestamps[index], y, y0, series: serieIndex, key, size: y, y1: y + y0 };
+                } else {
+                    points[index] = [result.timestamps[index], value(values, index)];
+                }
+            }
+
+            const serie = { key, values: points };
+            if (type === 'bar') {
+                serie.bar = true;
+            }
+            return serie;
+        });
+    };
+
+}]);
+
@@ -0,0 +1,259 @@
+"""
+Charts benchmark suite
+
+Measure ingestion and query paths against a database generated in a temporary directory.
+It is not part of unit tests, run it manually:
+
+    python3 bench_charts.py --devices 8 --samples 50000 --interval 60
+"""
+
+from cleep.libs.tests import session
+import unittest
+import logging
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+
+sys.path.append("../")
+from backend.charts import Charts
+from backend.chartsprocessing import average_data
+
+RANGES = {
+    "1h": 3600,
+    "24h": 86400,
+    "7d": 604800,
+    "1y": 31536000,
+}
+
+
+class BenchmarkCharts(unittest.TestCase):
+    DEVICES = 8
+    SAMPLES = 50000
+    INTERVAL = 60
+    EVENTS = 1000
+    REPEAT = 20
+    JSON_OUTPUT = None
+
+    def setUp(self):
+        logging.basicConfig(level=logging.FATAL)
+        self.session = session.TestSession(self)
+        self.database_dir = tempfile.mkdtemp(prefix="charts_bench_")
+        self.report = {}
+
+    def tearDown(self):
+        self.session.clean()
+        shutil.rmtree(self.database_dir, ignore_errors=True)
+
+    def init(self):
+        _charts = Charts
+        _charts.DATABASE_PATH = self.database_dir
+        self.db_path = os.path.join(_charts.DATABASE_PATH, _charts.DATABASE_NAME)
+        self.module = self.session.setup(_charts)
+        self.session.start_module(self.module)
+
+    def generate_data(self, devices, samples, interval, timestamp_end):
+        """
+        Fill database with synthetic data. Devices are spread over data1..data4 tables
+
+        Args:
+            devices (int): number of devices
+            samples (int): number of samples per device
+            interval (int): interval between samples (in seconds)
+            timestamp_end (int): timestamp of last sample
+
+        Returns:
+            list: list of (device uuid, values count)
+        """
+        cur = self.module._cnx.cursor()
+        generated = []
+        for device in range(devices):
+            values_count = device % 4 + 1
+            uuid = f"bench-{device}"
+            fields = [f"field{i + 1}" for i in range(values_count)]
+            columns_str = ",".join(f"value{i + 1}" for i in range(values_count))
+            cur.execute(
+                f"INSERT INTO devices(uuid, event, valuescount, {columns_str}) "
+                f"VALUES(?,?,?{',?' * values_count})",
+                [uuid, "bench.bench.bench", values_count] + fields,
+            )
+            timestamps = timestamp_end - numpy.arange(samples)[::-1] * interval
+            values = numpy.sin(numpy.arange(samples) / 100.0) * 20 + 20
+            cur.executemany(
+                f"INSERT INTO data{values_count}(timestamp, uuid, {columns_str}) "
+                f"VALUES(?,?{',?' * values_count})",
+                (
+                    [int(timestamp), uuid] + [float(value)] * values_count
+                    for timestamp, value in zip(timestamps, values)
+                ),
+            )
+            generated.append((uuid, values_count))
+            # fill storage infos like _save_data does
+            cur.execute(
+                "INSERT INTO storage(uuid, rowscount, firsttimestamp, lasttimestamp) "
+                "SELECT uuid, COUNT(*), MIN(timestamp), MAX(timestamp) "
+                f"FROM data{values_count} WHERE uuid=?",
+                (uuid,),
+            )
+            cur.execute(
+                "INSERT INTO hourlycounts(uuid, hour, rowscount) "
+                "SELECT uuid, timestamp/3600, COUNT(*) "
+                f"FROM data{values_count} WHERE uuid=? GROUP BY timestamp/3600",
+                (uuid,),
+            )
+        self.module._cnx.commit()
+
+        return generated
+
+    def measure(self, func, repeat):
+        """
+        Measure function durations
+
+        Returns:
+            dict: p50 and p99 durations in milliseconds
+        """
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            durations.append((time.perf_counter() - start) * 1000)
+        return {
+            "p50_ms": round(float(numpy.percentile(durations, 50)), 3),
+            "p99_ms": round(float(numpy.percentile(durations, 99)), 3),
+        }
+
+    def bench_import(self):
+        # measured in a fresh interpreter, modules are already loaded in this one
+        code = (
+            "import time; start = time.perf_counter(); import backend.charts; "
+            "print((time.perf_counter() - start) * 1000)"
+        )
+        output = subprocess.check_output(
+            [sys.executable, "-c", code],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."),
+        )
+        self.report["import_ms"] = round(float(output.decode()), 3)
+
+    def bench_startup(self):
+        start = time.perf_counter()
+        self.init()
+        self.report["startup_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def bench_ingestion(self, devices):
+        start = time.perf_counter()
+        for event in range(self.EVENTS):
+            uuid, values_count = devices[event % len(devices)]
+            self.module._save_data(
+                uuid,
+                "bench.bench.bench",
+                [
+                    {"field": f"field{i + 1}", "value": event}
+                    for i in range(values_count)
+                ],
+            )
+        duration = time.perf_counter() - start
+        self.report["ingestion_events_per_sec"] = round(self.EVENTS / duration, 1)
+
+    def bench_get_data(self, devices, timestamp_end):
+        self.report["get_data"] = {}
+        uuid, _ = devices[-1]
+        for range_name, range_duration in RANGES.items():
+            for average in (True, False):
+                self.report["get_data"][f"{range_name}_average_{average}"] = (
+                    self.measure(
+                        lambda: self.module.get_data(
+                            uuid,
+                            timestamp_end - range_duration,
+                            timestamp_end,
+                            {"output": "list", "average": average},
+                        ),
+                        self.REPEAT,
+                    )
+                )
+
+    def bench_average_data(self):
+        self.report["average_data"] = {}
+        for rows_count in (10000, 100000):
+            rows = [(i, float(i), float(i)) for i in range(rows_count)]
+            # reduce to about 500 rows
+            self.report["average_data"][f"{rows_count}_rows"] = self.measure(
+                lambda: average_data(rows, 2, rows_count // 500),
+                self.REPEAT,
+            )
+
+    def bench_purge_and_delete(self, devices, timestamp_end):
+        uuid, _ = devices[0]
+        timestamp_until = timestamp_end - self.SAMPLES * self.INTERVAL // 2
+        self.report["purge_data"] = self.measure(
+            lambda: self.module.purge_data(uuid, timestamp_until), 1
+        )
+        self.report["delete_device"] = self.measure(
+            lambda: self.module._delete_device(uuid), 1
+        )
+
+    def test_benchmark(self):
+        self.bench_import()
+        self.bench_startup()
+        timestamp_end = int(time.time())
+        devices = self.generate_data(
+            self.DEVICES, self.SAMPLES, self.INTERVAL, timestamp_end
+        )
+        self.report["parameters"] = {
+            "devices": self.DEVICES,
+            "samples": self.SAMPLES,
+            "interval": self.INTERVAL,
+            "events": self.EVENTS,
+            "repeat": self.REPEAT,
+        }
+
+        self.bench_ingestion(devices)
+        self.bench_get_data(devices, timestamp_end)
+        self.bench_average_data()
+        self.bench_purge_and_delete(devices, timestamp_end)
+        self.report["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.report["database_size_bytes"] = os.path.getsize(self.db_path)
+
+        print(json.dumps(self.report, indent=4))
+        if self.JSON_OUTPUT:
+            with open(self.JSON_OUTPUT, "w") as output:
+                json.dump(self.report, output, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Charts benchmark")
+    parser.add_argument("--devices", type=int, default=BenchmarkCharts.DEVICES)
+    parser.add_argument("--samples", type=int, default=BenchmarkCharts.SAMPLES)
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=BenchmarkCharts.INTERVAL,
+        help="interval between samples (in seconds)",
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=BenchmarkCharts.EVENTS,
+        help="number of events ingested",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=BenchmarkCharts.REPEAT,
+        help="number of queries for latency percentiles",
+    )
+    parser.add_argument("--json", help="write report to specified json file")
+    args = parser.parse_args()
+
+    BenchmarkCharts.DEVICES = args.devices
+    BenchmarkCharts.SAMPLES = args.samples
+    BenchmarkCharts.INTERVAL = args.interval
+    BenchmarkCharts.EVENTS = args.events
+    BenchmarkCharts.REPEAT = args.repeat
+    BenchmarkCharts.JSON_OUTPUT = args.json
+    unittest.main(argv=[sys.argv[0]])
@@ -13,8 +13,12 @@ from cleep.exception import (
 )
 import os
 import sqlite3
+import gzip
+import shutil
 import time
-from unittest.mock import Mock
+import json
+import numpy
+from unittest.mock import Mock, patch
 from cleep.libs.tests.common import get_log_level
 
 LOG_LEVEL = get_log_level()
@@ -677,21 +681,20 @@ class TestCharts(unittest.TestCase):
         self.__fill_data_table("data3", values)
         # logging.debug('Data3: %s' % self.__get_table_rows('data3'))
         # logging.debug('Device: %s' % self.__get_table_rows('devices'))
-        values_size = sys.getsizeof(values)
-        logging.debug("Values size: %s" % values_size)
-
-        # set low value for max data size to make sure to trigger average if available
-        self.module.MAX_DATA_SIZE = int(round(values_size / 20.0))
 
         # make sure average is enable
-        data = self.module.get_data(uuid, start, start + count * 2)
+        data = self.module.get_data(uuid, start, start + count * 2, {"max_points": 5})
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), int(len(values) / 20.0))
+        self.assertTrue(data["averaged"])
 
         # test average disabled
-        data = self.module.get_data(uuid, start, start + count * 2, {"average": False})
+        data = self.module.get_data(
+            uuid, start, start + count * 2, {"average": False, "max_points": 5}
+        )
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), len(values))
+        self.assertFalse(data["averaged"])
 
     def test_get_data_check_dict_output_averaged(self):
         self.init()
@@ -705,29 +708,24 @@ class TestCharts(unittest.TestCase):
         self.__fill_data_table("data3", values)
         # logging.debug('Data3: %s' % self.__get_table_rows('data3'))
         # logging.debug('Device: %s' % self.__get_table_rows('devices'))
-        values_size = sys.getsizeof(values)
-        logging.debug("Values size: %s" % values_size)
 
         # no average
         data = self.module.get_data(uuid, start, start + count * 2)
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), len(values))
 
-        # reduce by 2 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 2.0))
-        data = self.module.get_data(uuid, start, start + count * 2)
+        # limit to half of points to get average data to be triggered
+        data = self.module.get_data(uuid, start, start + count * 2, {"max_points": 50})
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), int(len(values) / 2.0))
 
-        # reduce by 4 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 4.0))
-        data = self.module.get_data(uuid, start, start + count * 2)
+        # limit to quarter of points to get average data to be triggered
+        data = self.module.get_data(uuid, start, start + count * 2, {"max_points": 25})
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), int(len(values) / 4.0))
 
-        # reduce by 20 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 20.0))
-        data = self.module.get_data(uuid, start, start + count * 2)
+        # limit to 5 points to get average data to be triggered
+        data = self.module.get_data(uuid, start, start + count * 2, {"max_points": 5})
         logging.debug("Data size: %s" % len(data["data"]))
         self.assertEqual(len(data["data"]), int(len(values) / 20.0))
 
@@ -751,8 +749,6 @@ class TestCharts(unittest.TestCase):
         self.__fill_data_table("data3", values)
         # logging.debug('Data3: %s' % self.__get_table_rows('data3'))
         # logging.debug('Device: %s' % self.__get_table_rows('devices'))
-        values_size = sys.getsizeof(values)
-        logging.debug("Values size: %s" % values_size)
 
         # no average
         data = self.module.get_data(uuid, start, start + count * 2, {"output": "list"})
@@ -762,25 +758,28 @@ class TestCharts(unittest.TestCase):
         self.assertEqual(len(data["data"]["field2"]["values"]), len(values))
         self.assertEqual(len(data["data"]["field3"]["values"]), len(values))
 
-        # reduce by 2 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 2.0))
-        data = self.module.get_data(uuid, start, start + count * 2, {"output": "list"})
+        # limit to half of points to get average data to be triggered
+        data = self.module.get_data(
+            uuid, start, start + count * 2, {"output": "list", "max_points": 50}
+        )
         logging.debug("Data size: %s" % len(data["data"]["field1"]["values"]))
         self.assertEqual(len(data["data"]["field1"]["values"]), int(len(values) / 2.0))
         self.assertEqual(len(data["data"]["field2"]["values"]), int(len(values) / 2.0))
         self.assertEqual(len(data["data"]["field3"]["values"]), int(len(values) / 2.0))
 
-        # reduce by 4 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 4.0))
-        data = self.module.get_data(uuid, start, start + count * 2, {"output": "list"})
+        # limit to quarter of points to get average data to be triggered
+        data = self.module.get_data(
+            uuid, start, start + count * 2, {"output": "list", "max_points": 25}
+        )
         logging.debug("Data size: %s" % len(data["data"]["field1"]["values"]))
         self.assertEqual(len(data["data"]["field1"]["values"]), int(len(values) / 4.0))
         self.assertEqual(len(data["data"]["field2"]["values"]), int(len(values) / 4.0))
         self.assertEqual(len(data["data"]["field3"]["values"]), int(len(values) / 4.0))
 
-        # reduce by 20 values size to get average data to be triggered and return half of data
-        self.module.MAX_DATA_SIZE = int(round(values_size / 20.0))
-        data = self.module.get_data(uuid, start, start + count * 2, {"output": "list"})
+        # limit to 5 points to get average data to be triggered
+        data = self.module.get_data(
+            uuid, start, start + count * 2, {"output": "list", "max_points": 5}
+        )
         logging.debug("Data size: %s" % len(data["data"]["field1"]["values"]))
         self.assertEqual(len(data["data"]["field1"]["values"]), int(len(values) / 20.0))
         self.assertEqual(len(data["data"]["field2"]["values"]), int(len(values) / 20.0))
@@ -794,6 +793,429 @@ class TestCharts(unittest.TestCase):
             self.assertEqual(data["data"]["field2"]["values"][i][1], value)
             self.assertEqual(data["data"]["field3"]["values"][i][1], value)
 
+    def test_get_data_max_points_default(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(100)])
+        self.module.MAX_POINTS = 30
+
+        data = self.module.get_data(uuid, start, start + 200)
+
+        # 100 rows averaged by 4 to return at most 30 rows
+        self.assertEqual(len(data["data"]), 25)
+
+    def test_get_data_max_bytes(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(100)])
+
+        # list output row size is 2 values + 4 bytes
+        row_size = 2 * Charts.VALUE_SIZE + 4
+        data = self.module.get_data(
+            uuid, start, start + 200, {"output": "list", "max_bytes": row_size * 10}
+        )
+        self.assertEqual(len(data["data"]["field1"]["values"]), 10)
+
+        # max_points has precedence when smaller
+        data = self.module.get_data(
+            uuid,
+            start,
+            start + 200,
+            {"output": "list", "max_bytes": row_size * 10, "max_points": 5},
+        )
+        self.assertEqual(len(data["data"]["field1"]["values"]), 5)
+
+        # at least one row is returned
+        data = self.module.get_data(uuid, start, start + 200, {"max_bytes": 1})
+        self.assertEqual(len(data["data"]), 1)
+
+    def test_get_data_max_bytes_dict_output(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table(
+            "data1", [(start + i, uuid, 1234567.890123) for i in range(100)]
+        )
+        rows = self.module.get_data(uuid, start, start + 9, {"average": False})["data"]
+        max_bytes = len(json.dumps(rows))
+
+        data = self.module.get_data(uuid, start, start + 200, {"max_bytes": max_bytes})
+
+        # serialized rows fit in max_bytes without dropping more rows than needed
+        self.assertLessEqual(len(json.dumps(data["data"])), max_bytes)
+        self.assertEqual(len(data["data"]), 8)
+
+    def test_get_data_aggregate(self):
+        self.init()
+        start = int(time.time()) - 100
+        uuid = "123-456-789"
+        values = [1, 0, 1, 1, 0]
+        self.__fill_data_table(
+            "data1", [(start + i * 10, uuid, value) for i, value in enumerate(values)]
+        )
+        end = start + 40
+
+        def aggregate(mode, timestamp_end=end):
+            data = self.module.get_data(uuid, start, timestamp_end, {"aggregate": mode})
+            self.assertTrue(data["averaged"])
+            return data["data"]["field1"]
+
+        self.assertEqual(aggregate("sum"), {"name": "field1", "value": 3})
+        self.assertEqual(aggregate("avg")["value"], 0.6)
+        self.assertEqual(aggregate("min")["value"], 0)
+        self.assertEqual(aggregate("max")["value"], 1)
+        self.assertEqual(aggregate("last")["value"], 0)
+        self.assertEqual(aggregate("duration")["value"], 30)
+        # last value lasts until end of range
+        self.assertEqual(aggregate("duration", start + 35)["value"], 25)
+        self.assertEqual(self.module.get_metrics()["counters"]["queries.aggregated"], 7)
+
+        # no data in range
+        data = self.module.get_data(uuid, end + 1, end + 10, {"aggregate": "last"})
+        self.assertEqual(data["data"], {"field1": {"name": "field1", "value": None}})
+
+        # invalid aggregate is ignored
+        data = self.module.get_data(uuid, start, end, {"aggregate": "dummy"})
+        self.assertEqual(len(data["data"]), 5)
+
+    def test_get_data_aggregate_duration_state_before_range(self):
+        self.init()
+        start = int(time.time()) - 1000
+        uuid = "123-456-789"
+        # door opened before range, closed at +10, opened at +30, closed at +45
+        states = [(start - 100, 1), (start + 10, 0), (start + 30, 1), (start + 45, 0)]
+        self.__fill_data_table("data1", [(ts, uuid, state) for ts, state in states])
+
+        data = self.module.get_data(uuid, start, start + 60, {"aggregate": "duration"})
+
+        self.assertEqual(data["data"]["field1"]["value"], 25)
+        durations = self.module.get_state_durations(uuid, start, start + 60)
+        self.assertEqual(durations["durations"]["field1"][1]["duration"], 25)
+
+        # no state known in range
+        data = self.module.get_data(
+            uuid, start - 200, start - 150, {"aggregate": "duration"}
+        )
+        self.assertEqual(data["data"]["field1"]["value"], None)
+
+    def test_get_data_timeout(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(1000)])
+
+        data = self.module.get_data(uuid, start, start + 2000, {"timeout": 10})
+        self.assertEqual(len(data["data"]), 1000)
+
+        # query is interrupted once client stopped waiting
+        with patch("backend.charts.time.monotonic", side_effect=[0, 11, 11, 11, 11]):
+            with self.assertRaises(CommandError) as cm:
+                self.module.get_data(uuid, start, start + 2000, {"timeout": 10})
+        self.assertEqual(str(cm.exception), "Request timed out")
+        self.assertEqual(
+            self.module.get_metrics()["counters"]["queries.interrupted"], 1
+        )
+
+        # connection still works after interruption
+        data = self.module.get_data(uuid, start, start + 2000, {"timeout": -1})
+        self.assertEqual(len(data["data"]), 1000)
+
+    def test_get_data_width(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(100)])
+
+        # 2 points per pixel
+        data = self.module.get_data(uuid, start, start + 200, {"width": 10})
+        self.assertEqual(len(data["data"]), 20)
+        self.assertTrue(data["averaged"])
+        data = self.module.get_data(
+            uuid, start, start + 200, {"width": 10, "pixel_ratio": 2.5}
+        )
+        self.assertEqual(len(data["data"]), 50)
+
+        # max_points has precedence when smaller
+        data = self.module.get_data(
+            uuid, start, start + 200, {"width": 10, "max_points": 5}
+        )
+        self.assertEqual(len(data["data"]), 5)
+
+        # invalid values are ignored
+        data = self.module.get_data(
+            uuid,
+            start,
+            start + 200,
+            {"width": 0, "pixel_ratio": -1, "reduction": "dummy"},
+        )
+        self.assertEqual(len(data["data"]), 100)
+        self.assertFalse(data["averaged"])
+
+    def test_get_data_reduction_lttb(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        rows = [(start + i, uuid, 100 if i == 42 else 0) for i in range(100)]
+        self.__fill_data_table("data1", rows)
+
+        data = self.module.get_data(
+            uuid, start, start + 200, {"max_points": 10, "reduction": "lttb"}
+        )
+
+        self.assertEqual(len(data["data"]), 10)
+        self.assertTrue(data["averaged"])
+        # original rows are returned, spike is kept
+        self.assertEqual(data["data"][0], {"ts": start, "field1": 0})
+        self.assertEqual(data["data"][-1], {"ts": start + 99, "field1": 0})
+        self.assertIn({"ts": start + 42, "field1": 100}, data["data"])
+
+        data = self.module.get_data(
+            uuid,
+            start,
+            start + 200,
+            {"max_points": 10, "reduction": "lttb", "sort": "desc"},
+        )
+        self.assertEqual(data["data"][0]["ts"], start + 99)
+        self.assertIn({"ts": start + 42, "field1": 100}, data["data"])
+
+    def test_hourly_counts(self):
+        self.init()
+        values = [{"field": "test", "value": 1}]
+        for timestamp in (3600, 3700, 7199, 7200, 18000):
+            self.module._save_data("uuid1", "test.test.test", values, timestamp)
+        self.module._save_data("uuid2", "test.test.test", values, 3600)
+
+        self.assertEqual(
+            self.__get_table_rows("hourlycounts", "uuid1"),
+            [("uuid1", 1, 3), ("uuid1", 2, 1), ("uuid1", 5, 1)],
+        )
+
+        # hour partially purged is recounted
+        self.module.purge_data("uuid1", 3701)
+        self.assertEqual(
+            self.__get_table_rows("hourlycounts", "uuid1"),
+            [("uuid1", 1, 1), ("uuid1", 2, 1), ("uuid1", 5, 1)],
+        )
+
+        self.module._delete_device("uuid1")
+        self.assertEqual(self.__get_table_count("hourlycounts", "uuid1"), 0)
+        self.assertEqual(self.__get_table_count("hourlycounts", "uuid2"), 1)
+
+    def test_migrate_database_hourly_counts(self):
+        self.init()
+        self.__fill_data_table(
+            "data1", [(3600 + i * 600, "uuid1", i) for i in range(10)]
+        )
+        self.cur.execute("DROP TABLE hourlycounts")
+        self.cnx.commit()
+
+        self.session.start_module(self.module)
+
+        self.assertEqual(
+            self.__get_table_rows("hourlycounts", "uuid1"),
+            [("uuid1", 1, 6), ("uuid1", 2, 4)],
+        )
+
+    def test_estimate_range(self):
+        self.init()
+        values = [{"field": "test", "value": 1}]
+        # one row every minute during 3 hours
+        for timestamp in range(3600, 3 * 3600 + 3600, 60):
+            self.module._save_data("uuid1", "test.test.test", values, timestamp)
+
+        self.assertEqual(
+            self.module._estimate_range("uuid1", 0, 100000), (180, 3600, 14340)
+        )
+        self.assertEqual(
+            self.module._estimate_range("uuid1", 3600, 7199), (60, 3600, 7199)
+        )
+        # partial hours are counted proportionally
+        self.assertEqual(
+            self.module._estimate_range("uuid1", 5400, 9000), (60, 5400, 9000)
+        )
+        self.assertEqual(self.module._estimate_range("uuid1", 0, 3000), (0, None, None))
+        self.assertEqual(
+            self.module._estimate_range("uuid2", 0, 100000), (0, None, None)
+        )
+
+    def test_get_data_sql_average(self):
+        self.init()
+        start = 36000
+        uuid = "123-456-789"
+        for i in range(100):
+            self.module._save_data(
+                uuid,
+                "test.test.test",
+                [{"field": "field1", "value": i}, {"field": "field2", "value": 2 * i}],
+                start + i,
+            )
+
+        data = self.module.get_data(uuid, start, start + 200, {"max_points": 5})
+
+        self.assertEqual(
+            self.module.get_metrics()["counters"]["queries.sql_averaged"], 1
+        )
+        self.assertTrue(data["averaged"])
+        self.assertEqual(
+            data["data"],
+            [
+                {
+                    "ts": start + 9.5 + 20 * i,
+                    "field1": 9.5 + 20 * i,
+                    "field2": 19.0 + 40 * i,
+                }
+                for i in range(5)
+            ],
+        )
+        data = self.module.get_data(
+            uuid,
+            start,
+            start + 200,
+            {"max_points": 5, "sort": "desc", "fields": ["field2"]},
+        )
+        self.assertEqual(data["data"][0], {"ts": start + 89.5, "field2": 179.0})
+
+        # range not much larger than max points is averaged after fetching rows
+        data = self.module.get_data(uuid, start, start + 200, {"max_points": 50})
+        self.assertEqual(
+            self.module.get_metrics()["counters"]["queries.sql_averaged"], 2
+        )
+        self.assertEqual(len(data["data"]), 50)
+
+    def test_get_data_bucket(self):
+        self.init()
+        start = 1000
+        uuid = "123-456-789"
+        values = [(start + i * 10, uuid, i, 2 * i) for i in range(10)]
+        self.__fill_data_table("data2", values)
+
+        data = self.module.get_data(uuid, start, start + 100, {"bucket": 30})
+        self.assertEqual(
+            data["data"],
+            [
+                {"ts": 1000, "field1": 1.0, "field2": 2.0},
+                {"ts": 1030, "field1": 4.0, "field2": 8.0},
+                {"ts": 1060, "field1": 7.0, "field2": 14.0},
+                {"ts": 1090, "field1": 9.0, "field2": 18.0},
+            ],
+        )
+
+        data = self.module.get_data(
+            uuid, start, start + 100, {"bucket": 30, "output": "list", "sort": "desc"}
+        )
+        self.assertEqual(
+            data["data"]["field1"]["values"],
+            [(1090, 9.0), (1060, 7.0), (1030, 4.0), (1000, 1.0)],
+        )
+
+    def test_get_data_transform_delta(self):
+        self.init()
+        start = 1000
+        uuid = "123-456-789"
+        # counter reset between 4th and 5th values
+        counters = [10, 12, 15, 20, 3, 5]
+        values = [(start + i * 10, uuid, counter) for i, counter in enumerate(counters)]
+        self.__fill_data_table("data1", values)
+
+        data = self.module.get_data(uuid, start, start + 100, {"transform": "delta"})
+        self.assertEqual(
+            data["data"],
+            [
+                {"ts": 1010, "field1": 2.0},
+                {"ts": 1020, "field1": 3.0},
+                {"ts": 1030, "field1": 5.0},
+                {"ts": 1040, "field1": 3.0},
+                {"ts": 1050, "field1": 2.0},
+            ],
+        )
+
+        data = self.module.get_data(
+            uuid, start, start + 100, {"transform": "delta", "sort": "desc"}
+        )
+        self.assertEqual(
+            [row["ts"] for row in data["data"]], [1050, 1040, 1030, 1020, 1010]
+        )
+
+    def test_get_data_transform_rate(self):
+        self.init()
+        start = 1000
+        uuid = "123-456-789"
+        values = [(1000, uuid, 0), (1010, uuid, 20), (1015, uuid, 30), (1015, uuid, 31)]
+        self.__fill_data_table("data1", values)
+
+        data = self.module.get_data(uuid, start, start + 100, {"transform": "rate"})
+        self.assertEqual(
+            data["data"],
+            [
+                {"ts": 1010, "field1": 2.0},
+                {"ts": 1015, "field1": 2.0},
+                {"ts": 1015, "field1": None},
+            ],
+        )
+
+    def test_get_data_transform_with_bucket(self):
+        self.init()
+        start = 0
+        uuid = "123-456-789"
+        # counter incremented by 1 every 10 seconds
+        values = [(i * 10, uuid, i) for i in range(1, 25)]
+        self.__fill_data_table("data1", values)
+
+        data = self.module.get_data(
+            uuid, start, 239, {"transform": "delta", "bucket": 60}
+        )
+        self.assertEqual(
+            data["data"],
+            [
+                {"ts": 0, "field1": 4.0},
+                {"ts": 60, "field1": 6.0},
+                {"ts": 120, "field1": 6.0},
+                {"ts": 180, "field1": 6.0},
+            ],
+        )
+
+        data = self.module.get_data(
+            uuid, start, 239, {"transform": "rate", "bucket": 60}
+        )
+        self.assertEqual(data["data"][1], {"ts": 60, "field1": 0.1})
+
+    def test_get_data_time_weighted_bucket(self):
+        self.init()
+        uuid = "123-456-789"
+        values = [(0, uuid, 10), (50, uuid, 40), (60, uuid, 0), (90, uuid, 10)]
+        self.__fill_data_table("data1", values)
+
+        data = self.module.get_data(
+            uuid, 0, 120, {"bucket": 60, "average_mode": "time"}
+        )
+        self.assertEqual(
+            data["data"],
+            [{"ts": 0, "field1": 15.0}, {"ts": 60, "field1": 5.0}],
+        )
+
+        data = self.module.get_data(uuid, 0, 120, {"bucket": 60})
+        self.assertEqual(
+            data["data"],
+            [{"ts": 0, "field1": 25.0}, {"ts": 60, "field1": 5.0}],
+        )
+
+    def test_get_stats_time_weighted(self):
+        self.init()
+        uuid = "123-456-789"
+        values = [(0, uuid, 10), (50, uuid, 40), (60, uuid, 0), (90, uuid, 10)]
+        self.__fill_data_table("data1", values)
+
+        stats = self.module.get_stats(uuid, 0, 120, {"average_mode": "time"})
+        self.assertEqual(stats["stats"]["field1"]["mean"], (500 + 400 + 0 + 300) / 120)
+
+        stats = self.module.get_stats(
+            uuid, 0, 120, {"average_mode": "time", "bucket": 60}
+        )
+        self.assertEqual(stats["stats"]["field1"][0]["mean"], 15.0)
+        self.assertEqual(stats["stats"]["field1"][1]["mean"], 5.0)
+
     def test_get_data_invalid_parameters(self):
         self.init()
         start = int(time.time())
@@ -851,105 +1273,468 @@ class TestCharts(unittest.TestCase):
             "Timestamp_end should be >0",
         )
 
-    def test_purge_data_1(self):
+    def test_get_stats(self):
         self.init()
         start = int(time.time())
         uuid = "123-456-789"
-        event = "test.test.test"
-        values = [{"field": "test1", "value": 1}]
-        self.module._save_data(uuid, event, values)
-        end = int(time.time())
-
-        count = self.__get_table_count("data1")
-        self.assertEqual(count, 1, "Data1 should not be empty")
-        self.module.purge_data(uuid, end + 1)
-        count = self.__get_table_count("data1")
-        self.assertEqual(count, 0, "Data1 should be empty")
+        values = [(start + i, uuid, i, 100 - i) for i in range(101)]
+        self.__fill_data_table("data2", values)
 
-    def test_purge_data_2(self):
-        self.init()
-        start = int(time.time())
-        uuid = "123-456-789"
-        event = "test.test.test"
-        values = [{"field": "test1", "value": 1}, {"field": "test2", "value": 2}]
-        self.module._save_data(uuid, event, values)
-        end = int(time.time())
+        stats = self.module.get_stats(
+            uuid, start, start + 200, {"percentiles": [10, 50]}
+        )
 
-        count = self.__get_table_count("data2")
-        self.assertEqual(count, 1, "Data2 should not be empty")
-        self.module.purge_data(uuid, end + 1)
-        count = self.__get_table_count("data2")
-        self.assertEqual(count, 0, "Data2 should be empty")
+        self.assertEqual(stats["uuid"], uuid)
+        self.assertEqual(stats["event"], "test.test.test")
+        self.assertEqual(
+            stats["stats"]["field1"],
+            {
+                "count": 101,
+                "min": 0.0,
+                "max": 100.0,
+                "mean": 50.0,
+                "stddev": numpy.std(range(101)),
+                "percentiles": {"10": 10.0, "50": 50.0},
+            },
+        )
+        self.assertEqual(stats["stats"]["field2"]["min"], 0.0)
+        self.assertEqual(stats["stats"]["field2"]["max"], 100.0)
 
-    def test_purge_data_3(self):
+    def test_get_stats_with_options(self):
         self.init()
         start = int(time.time())
         uuid = "123-456-789"
-        event = "test.test.test"
-        values = [
-            {"field": "test1", "value": 1},
-            {"field": "test2", "value": 2},
-            {"field": "test3", "value": 3},
-        ]
-        self.module._save_data(uuid, event, values)
-        end = int(time.time())
+        values = [(start + i, uuid, i, i) for i in range(100)]
+        self.__fill_data_table("data2", values)
 
-        count = self.__get_table_count("data3")
-        self.assertEqual(count, 1, "Data3 should not be empty")
-        self.module.purge_data(uuid, end + 1)
-        count = self.__get_table_count("data3")
-        self.assertEqual(count, 0, "Data3 should be empty")
+        stats = self.module.get_stats(
+            uuid, start, start + 100, {"fields": ["field2"], "bucket": 25}
+        )
 
-    def test_purge_data_4(self):
+        self.assertEqual(list(stats["stats"].keys()), ["field2"])
+        self.assertEqual(len(stats["stats"]["field2"]), 4)
+        self.assertEqual(stats["stats"]["field2"][1]["ts"], start + 25)
+        self.assertEqual(stats["stats"]["field2"][1]["count"], 25)
+        self.assertEqual(stats["stats"]["field2"][1]["min"], 25.0)
+        self.assertEqual(stats["stats"]["field2"][1]["max"], 49.0)
+        self.assertEqual(stats["stats"]["field2"][1]["percentiles"], {"50": 37.0})
+
+    def test_get_stats_no_data(self):
         self.init()
         start = int(time.time())
         uuid = "123-456-789"
-        event = "test.test.test"
-        values = [
-            {"field": "test1", "value": 1},
-            {"field": "test2", "value": 2},
-            {"field": "test3", "value": 3},
-            {"field": "test4", "value": 4},
-        ]
-        self.module._save_data(uuid, event, values)
-        end = int(time.time())
+        self.__fill_data_table("data1", [(start, uuid, 1)])
 
-        count = self.__get_table_count("data4")
-        self.assertEqual(count, 1, "Data4 should not be empty")
-        self.module.purge_data(uuid, end + 1)
-        count = self.__get_table_count("data4")
-        self.assertEqual(count, 0, "Data4 should be empty")
+        stats = self.module.get_stats(uuid, start + 10, start + 20)
+        self.assertEqual(
+            stats["stats"]["field1"],
+            {
+                "count": 0,
+                "min": None,
+                "max": None,
+                "mean": None,
+                "stddev": None,
+                "percentiles": {"50": None},
+            },
+        )
 
-    def test_purge_data_missing_parameters(self):
+        stats = self.module.get_stats(uuid, start + 10, start + 20, {"bucket": 5})
+        self.assertEqual(stats["stats"]["field1"], [])
+
+    def test_get_stats_invalid_parameters(self):
         self.init()
         start = int(time.time())
         uuid = "123-456-789"
-        event = "test.test.test"
-        values = [
-            {"field": "test1", "value": 1},
-            {"field": "test2", "value": 2},
-            {"field": "test3", "value": 3},
-            {"field": "test4", "value": 4},
-        ]
-        self.module._save_data(uuid, event, values)
-        end = int(time.time())
+        self.__fill_data_table("data1", [(start, uuid, 1)])
 
         with self.assertRaises(MissingParameter) as cm:
-            self.module.purge_data(None, end)
-        self.assertEqual(
-            cm.exception.message,
-            'Parameter "device_uuid" is missing',
-            "Uuid should not be None",
-        )
+            self.module.get_stats(None, start, start)
+        self.assertEqual(cm.exception.message, 'Parameter "device_uuid" is missing')
         with self.assertRaises(MissingParameter) as cm:
-            self.module.purge_data("", end)
+            self.module.get_stats(uuid, None, start)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_start" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_stats(uuid, -1, start)
+        self.assertEqual(cm.exception.message, "Timestamp_start value must be positive")
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_stats(uuid, start, None)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_end" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_stats(uuid, start, -1)
+        self.assertEqual(cm.exception.message, "Timestamp_end value must be positive")
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_stats(uuid, start, start, {"percentiles": [101]})
         self.assertEqual(
             cm.exception.message,
-            'Parameter "device_uuid" is missing',
-            "Uuid should not be empty",
+            'Option "percentiles" must be a list of values between 0 and 100',
         )
-        with self.assertRaises(MissingParameter) as cm:
-            self.module.purge_data(uuid, None)
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_stats(uuid, start, start, {"average_mode": "dummy"})
+        self.assertEqual(
+            cm.exception.message, 'Option "average_mode" must be "sample" or "time"'
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_stats(uuid, start, start, {"bucket": 0})
+        self.assertEqual(
+            cm.exception.message, 'Option "bucket" must be a positive integer'
+        )
+
+    def test_get_state_durations(self):
+        self.init()
+        start = int(time.time()) - 1000
+        uuid = "123-456-789"
+        # door opened before range, closed at +10, opened at +30, closed at +45
+        states = [(start - 100, 1), (start + 10, 0), (start + 30, 1), (start + 45, 0)]
+        self.__fill_data_table("data1", [(ts, uuid, state) for ts, state in states])
+
+        durations = self.module.get_state_durations(uuid, start, start + 60)
+
+        self.assertEqual(durations["uuid"], uuid)
+        self.assertEqual(durations["event"], "test.test.test")
+        self.assertEqual(
+            durations["durations"]["field1"],
+            [
+                {"state": 0, "duration": 35, "transitions": 2},
+                {"state": 1, "duration": 25, "transitions": 1},
+            ],
+        )
+
+    def test_get_state_durations_bucket(self):
+        self.init()
+        start = int(time.time()) - 1000
+        uuid = "123-456-789"
+        states = [(start, 1), (start + 10, 0), (start + 30, 1), (start + 45, 0)]
+        self.__fill_data_table("data1", [(ts, uuid, state) for ts, state in states])
+
+        durations = self.module.get_state_durations(
+            uuid, start, start + 60, {"bucket": 20}
+        )
+
+        # state 0 lasts from +10 to +30 over 2 buckets
+        self.assertEqual(
+            durations["durations"]["field1"],
+            [
+                {
+                    "ts": start,
+                    "states": [
+                        {"state": 0, "duration": 10, "transitions": 1},
+                        {"state": 1, "duration": 10, "transitions": 0},
+                    ],
+                },
+                {
+                    "ts": start + 20,
+                    "states": [
+                        {"state": 0, "duration": 10, "transitions": 0},
+                        {"state": 1, "duration": 10, "transitions": 1},
+                    ],
+                },
+                {
+                    "ts": start + 40,
+                    "states": [
+                        {"state": 0, "duration": 15, "transitions": 1},
+                        {"state": 1, "duration": 5, "transitions": 0},
+                    ],
+                },
+            ],
+        )
+
+    def test_get_state_durations_buckets_count(self):
+        self.init()
+        now = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(0, uuid, 1), (now // 2, uuid, 0)])
+
+        durations = self.module.get_state_durations(uuid, 0, now, {"bucket": 1})
+
+        buckets = durations["durations"]["field1"]
+        self.assertLessEqual(len(buckets), Charts.MAX_POINTS)
+        bucket_size = buckets[1]["ts"] - buckets[0]["ts"]
+        self.assertGreaterEqual(bucket_size * Charts.MAX_POINTS, now)
+        self.assertEqual(
+            sum(state["duration"] for bucket in buckets for state in bucket["states"]),
+            now,
+        )
+
+    def test_get_state_durations_no_data(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + 100, uuid, 1)])
+
+        durations = self.module.get_state_durations(uuid, start, start + 20)
+        self.assertEqual(durations["durations"]["field1"], [])
+        durations = self.module.get_state_durations(
+            uuid, start, start + 20, {"bucket": 5}
+        )
+        self.assertEqual(durations["durations"]["field1"], [])
+
+    def test_get_state_durations_invalid_parameters(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start, uuid, 1)])
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_state_durations(None, start, start)
+        self.assertEqual(cm.exception.message, 'Parameter "device_uuid" is missing')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_state_durations(uuid, None, start)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_start" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_state_durations(uuid, -1, start)
+        self.assertEqual(cm.exception.message, "Timestamp_start value must be positive")
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_state_durations(uuid, start, None)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_end" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_state_durations(uuid, start, -1)
+        self.assertEqual(cm.exception.message, "Timestamp_end value must be positive")
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_state_durations(uuid, start, start, {"bucket": 0})
+        self.assertEqual(
+            cm.exception.message, 'Option "bucket" must be a positive integer'
+        )
+
+    def test_get_aligned_data(self):
+        self.init()
+        start = int(time.time()) - 1000
+        self.__fill_data_table(
+            "data1",
+            [
+                (start, "indoor", 20),
+                (start + 5, "indoor", 22),
+                (start + 25, "indoor", 24),
+            ],
+        )
+        self.__fill_data_table(
+            "data2",
+            [(start + 12, "outdoor", 10, 50), (start + 35, "outdoor", 14, 70)],
+            fields_name=["temperature", "humidity"],
+        )
+
+        data = self.module.get_aligned_data(
+            [
+                {"device_uuid": "indoor"},
+                {"device_uuid": "outdoor", "fields": ["temperature"]},
+            ],
+            start,
+            start + 39,
+            {"bucket": 10},
+        )
+
+        self.assertEqual(data["ts"], [start, start + 10, start + 20, start + 30])
+        self.assertEqual(
+            data["series"],
+            [
+                {
+                    "uuid": "indoor",
+                    "event": "test.test.test",
+                    "name": "field1",
+                    "values": [21.0, None, 24.0, None],
+                },
+                {
+                    "uuid": "outdoor",
+                    "event": "test.test.test",
+                    "name": "temperature",
+                    "values": [None, 10.0, None, 14.0],
+                },
+            ],
+        )
+
+    def test_get_aligned_data_fill(self):
+        self.init()
+        start = int(time.time()) - 1000
+        self.__fill_data_table(
+            "data1", [(start + 10, "uuid1", 10), (start + 40, "uuid1", 40)]
+        )
+        devices = [{"device_uuid": "uuid1"}]
+
+        data = self.module.get_aligned_data(
+            devices, start, start + 59, {"bucket": 10, "fill": "previous"}
+        )
+        self.assertEqual(
+            data["series"][0]["values"], [None, 10.0, 10.0, 10.0, 40.0, 40.0]
+        )
+
+        data = self.module.get_aligned_data(
+            devices, start, start + 59, {"bucket": 10, "fill": "linear"}
+        )
+        self.assertEqual(
+            data["series"][0]["values"], [None, 10.0, 20.0, 30.0, 40.0, None]
+        )
+
+    def test_get_aligned_data_default_bucket(self):
+        self.init()
+        start = int(time.time()) - 1000
+        self.__fill_data_table("data1", [(start + i, "uuid1", i) for i in range(100)])
+        self.module.MAX_POINTS = 10
+
+        data = self.module.get_aligned_data(
+            [{"device_uuid": "uuid1"}], start, start + 99
+        )
+
+        self.assertEqual(len(data["ts"]), 10)
+        self.assertEqual(data["series"][0]["values"][0], 4.5)
+
+    def test_get_aligned_data_grid_size(self):
+        self.init()
+        now = int(time.time())
+        self.__fill_data_table("data1", [(now - 10, "uuid1", 1)])
+        self.module.MAX_POINTS = 100
+        devices = [{"device_uuid": "uuid1"}]
+
+        # bucket is increased to keep at most MAX_POINTS buckets
+        data = self.module.get_aligned_data(devices, 0, now, {"bucket": 1})
+        self.assertLessEqual(len(data["ts"]), 100)
+        self.assertEqual(len(data["series"][0]["values"]), len(data["ts"]))
+
+        # range end is clipped to current time
+        data = self.module.get_aligned_data(
+            devices, now - 98, now + 10**9, {"bucket": 1}
+        )
+        self.assertLessEqual(len(data["ts"]), 100)
+        self.assertEqual(data["ts"][1] - data["ts"][0], 1)
+
+    def test_get_aligned_data_invalid_parameters(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start, "uuid1", 1)])
+        devices = [{"device_uuid": "uuid1"}]
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_aligned_data([], start, start)
+        self.assertEqual(cm.exception.message, 'Parameter "devices" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_aligned_data(["uuid1"], start, start)
+        self.assertEqual(
+            cm.exception.message,
+            'Parameter "devices" must be a list of devices with "device_uuid"',
+        )
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_aligned_data(devices, None, start)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_start" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_aligned_data(devices, -1, start)
+        self.assertEqual(cm.exception.message, "Timestamp_start value must be positive")
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.get_aligned_data(devices, start, None)
+        self.assertEqual(cm.exception.message, 'Parameter "timestamp_end" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_aligned_data(devices, start, start - 1)
+        self.assertEqual(
+            cm.exception.message, "Timestamp_end value must be greater than start"
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_aligned_data(devices, start, start, {"bucket": 0})
+        self.assertEqual(
+            cm.exception.message, 'Option "bucket" must be a positive integer'
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.get_aligned_data(devices, start, start, {"fill": "dummy"})
+        self.assertEqual(
+            cm.exception.message,
+            "Option \"fill\" must be one of ['none', 'previous', 'linear']",
+        )
+
+    def test_purge_data_1(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        event = "test.test.test"
+        values = [{"field": "test1", "value": 1}]
+        self.module._save_data(uuid, event, values)
+        end = int(time.time())
+
+        count = self.__get_table_count("data1")
+        self.assertEqual(count, 1, "Data1 should not be empty")
+        self.module.purge_data(uuid, end + 1)
+        count = self.__get_table_count("data1")
+        self.assertEqual(count, 0, "Data1 should be empty")
+
+    def test_purge_data_2(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        event = "test.test.test"
+        values = [{"field": "test1", "value": 1}, {"field": "test2", "value": 2}]
+        self.module._save_data(uuid, event, values)
+        end = int(time.time())
+
+        count = self.__get_table_count("data2")
+        self.assertEqual(count, 1, "Data2 should not be empty")
+        self.module.purge_data(uuid, end + 1)
+        count = self.__get_table_count("data2")
+        self.assertEqual(count, 0, "Data2 should be empty")
+
+    def test_purge_data_3(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        event = "test.test.test"
+        values = [
+            {"field": "test1", "value": 1},
+            {"field": "test2", "value": 2},
+            {"field": "test3", "value": 3},
+        ]
+        self.module._save_data(uuid, event, values)
+        end = int(time.time())
+
+        count = self.__get_table_count("data3")
+        self.assertEqual(count, 1, "Data3 should not be empty")
+        self.module.purge_data(uuid, end + 1)
+        count = self.__get_table_count("data3")
+        self.assertEqual(count, 0, "Data3 should be empty")
+
+    def test_purge_data_4(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        event = "test.test.test"
+        values = [
+            {"field": "test1", "value": 1},
+            {"field": "test2", "value": 2},
+            {"field": "test3", "value": 3},
+            {"field": "test4", "value": 4},
+        ]
+        self.module._save_data(uuid, event, values)
+        end = int(time.time())
+
+        count = self.__get_table_count("data4")
+        self.assertEqual(count, 1, "Data4 should not be empty")
+        self.module.purge_data(uuid, end + 1)
+        count = self.__get_table_count("data4")
+        self.assertEqual(count, 0, "Data4 should be empty")
+
+    def test_purge_data_missing_parameters(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        event = "test.test.test"
+        values = [
+            {"field": "test1", "value": 1},
+            {"field": "test2", "value": 2},
+            {"field": "test3", "value": 3},
+            {"field": "test4", "value": 4},
+        ]
+        self.module._save_data(uuid, event, values)
+        end = int(time.time())
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.purge_data(None, end)
+        self.assertEqual(
+            cm.exception.message,
+            'Parameter "device_uuid" is missing',
+            "Uuid should not be None",
+        )
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.purge_data("", end)
+        self.assertEqual(
+            cm.exception.message,
+            'Parameter "device_uuid" is missing',
+            "Uuid should not be empty",
+        )
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.purge_data(uuid, None)
         self.assertEqual(
             cm.exception.message,
             'Parameter "timestamp_until" is missing',
@@ -1032,6 +1817,903 @@ class TestCharts(unittest.TestCase):
             "Uuid should not be None",
         )
 
+    def __make_archive(self, compress=False):
+        archive_path = "/tmp/charts_archive.db" + (".gz" if compress else "")
+        self.addCleanup(
+            lambda: os.path.exists(archive_path) and os.remove(archive_path)
+        )
+        if compress:
+            with open(self.db_path, "rb") as src, gzip.open(archive_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            shutil.copyfile(self.db_path, archive_path)
+        return archive_path
+
+    def test_import_data(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        values = [(start + i, uuid, i, i) for i in range(100)]
+        self.__fill_data_table("data2", values)
+        archive_path = self.__make_archive()
+        self.module._delete_device(uuid)
+
+        result = self.module.import_data(archive_path)
+
+        self.assertEqual(result, {"devices": 1, "rows": 100})
+        self.assertEqual(self.__get_table_count("devices", uuid), 1)
+        self.assertEqual(self.__get_table_count("data2", uuid), 100)
+        data = self.module.get_data(uuid, start, start + 100, {"average": False})
+        self.assertEqual(
+            data["data"][10], {"ts": start + 10, "field1": 10, "field2": 10}
+        )
+        self.cur.execute(
+            'SELECT name FROM sqlite_master WHERE type="index" AND tbl_name="data2" AND sql IS NOT NULL'
+        )
+        self.assertCountEqual(
+            [row[0] for row in self.cur.fetchall()],
+            ["data2_device_index", "data2_timestamp_index"],
+        )
+
+    def test_import_data_compressed_archive(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(50)])
+        archive_path = self.__make_archive(compress=True)
+        self.module._delete_device(uuid)
+
+        result = self.module.import_data(archive_path)
+
+        self.assertEqual(result, {"devices": 1, "rows": 50})
+        self.assertEqual(self.__get_table_count("data1", uuid), 50)
+
+    def test_import_data_skip_stored_rows(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(50)])
+        archive_path = self.__make_archive()
+
+        result = self.module.import_data(archive_path)
+        self.assertEqual(result, {"devices": 1, "rows": 0})
+        self.assertEqual(self.__get_table_count("data1", uuid), 50)
+
+        # purged rows are imported again
+        self.module.purge_data(uuid, start + 40)
+        result = self.module.import_data(archive_path)
+        self.assertEqual(result, {"devices": 1, "rows": 40})
+        self.assertEqual(self.__get_table_count("data1", uuid), 50)
+
+    def test_import_data_older_overlapping_archive(self):
+        self.init()
+        start = int(time.time()) - 200
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(60)])
+        archive_path = self.__make_archive()
+        self.module._delete_device(uuid)
+        # recent data overlaps archive end, with a different value at same timestamp
+        self.__fill_data_table(
+            "data1", [(start + i, uuid, i) for i in range(50, 100) if i != 55]
+        )
+        self.module._save_data(
+            uuid, "test.test.test", [{"field": "test", "value": 0}], start + 55
+        )
+
+        result = self.module.import_data(archive_path)
+
+        self.assertEqual(result, {"devices": 1, "rows": 51})
+        self.assertEqual(self.__get_table_count("data1", uuid), 101)
+        report = self.module.get_storage_report()
+        self.assertEqual(report["devices"][0]["rows"], 101)
+        self.assertEqual(report["devices"][0]["first_timestamp"], start)
+        self.assertEqual(report["devices"][0]["last_timestamp"], start + 99)
+
+    def test_import_data_filter_devices(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid1", i) for i in range(10)])
+        self.__fill_data_table("data2", [(start + i, "uuid2", i, i) for i in range(10)])
+        archive_path = self.__make_archive()
+        self.module._delete_device("uuid1")
+        self.module._delete_device("uuid2")
+
+        result = self.module.import_data(archive_path, ["uuid2"])
+
+        self.assertEqual(result, {"devices": 1, "rows": 10})
+        self.assertEqual(self.__get_table_count("devices", "uuid1"), 0)
+        self.assertEqual(self.__get_table_count("data2", "uuid2"), 10)
+
+    def test_import_data_incompatible_device(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(10)])
+        archive_path = self.__make_archive()
+        self.module._delete_device(uuid)
+        self.module._save_data(uuid, "test.test.other", [{"field": "test", "value": 1}])
+
+        with self.assertRaises(CommandError) as cm:
+            self.module.import_data(archive_path)
+        self.assertEqual(
+            cm.exception.message,
+            f"Device {uuid} stored for event test.test.other with 1 values cannot import event test.test.test with 1 values",
+        )
+        self.assertEqual(self.__get_table_count("data1", uuid), 1)
+
+    def test_import_data_invalid_archive(self):
+        self.init()
+        archive_path = "/tmp/charts_archive.db"
+        self.addCleanup(os.remove, archive_path)
+        with open(archive_path, "w") as archive:
+            archive.write("not a database" * 100)
+
+        with self.assertRaises(CommandError) as cm:
+            self.module.import_data(archive_path)
+        self.assertTrue(cm.exception.message.startswith("Invalid archive: "))
+
+    def test_import_data_database_error(self):
+        self.init()
+        self.__fill_data_table("data1", [(100, "uuid", 1)])
+        archive_path = self.__make_archive()
+        self.module._cur = Mock()
+        self.module._cur.execute.side_effect = sqlite3.OperationalError(
+            "disk I/O error"
+        )
+
+        # errors of module database are not reported as invalid archive
+        with self.assertRaises(sqlite3.OperationalError):
+            self.module.import_data(archive_path)
+
+    def test_import_data_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.import_data(None)
+        self.assertEqual(cm.exception.message, 'Parameter "archive_path" is missing')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.import_data("")
+        self.assertEqual(cm.exception.message, 'Parameter "archive_path" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.import_data("/tmp/dummy.db")
+        self.assertEqual(cm.exception.message, 'Archive "/tmp/dummy.db" does not exist')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.import_data(self.db_path, "uuid")
+        self.assertEqual(
+            cm.exception.message, 'Parameter "device_uuids" must be a list'
+        )
+
+    def __get_backup_rows_count(self, backup_path, table_name):
+        self.module._backup_thread.join()
+        self.addCleanup(os.remove, backup_path)
+        if backup_path.endswith(".gz"):
+            with gzip.open(backup_path, "rb") as src, open(
+                "/tmp/charts_backup.tmp", "wb"
+            ) as dst:
+                shutil.copyfileobj(src, dst)
+            self.addCleanup(os.remove, "/tmp/charts_backup.tmp")
+            backup_path = "/tmp/charts_backup.tmp"
+        cnx = sqlite3.connect(backup_path)
+        count = cnx.execute("SELECT count(*) FROM %s" % table_name).fetchone()[0]
+        cnx.close()
+        return count
+
+    def test_backup_database(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid", i) for i in range(100)])
+
+        backup_path = self.module.backup_database("/tmp/charts_backup.db")
+
+        self.assertEqual(backup_path, "/tmp/charts_backup.db")
+        self.assertEqual(self.__get_backup_rows_count(backup_path, "data1"), 100)
+        status = self.module.get_backup_status()
+        self.assertFalse(status["running"])
+        self.assertEqual(status["progress"], 100)
+        self.assertIsNone(status["error"])
+
+    @patch.object(Charts, "BACKUP_STEP_PAGES", 1)
+    def test_backup_database_cancelled_on_stop(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid", i) for i in range(100)])
+
+        self.module.backup_database("/tmp/charts_backup.db")
+        self.module._on_stop()
+
+        self.assertFalse(self.module._backup_thread.is_alive())
+        status = self.module.get_backup_status()
+        self.assertFalse(status["running"])
+        self.assertEqual(status["error"], "Backup cancelled")
+        self.assertFalse(os.path.exists("/tmp/charts_backup.db"))
+
+    def test_backup_database_compressed(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid", i) for i in range(100)])
+
+        backup_path = self.module.backup_database("/tmp/charts_backup.db", True)
+
+        self.assertEqual(backup_path, "/tmp/charts_backup.db.gz")
+        self.assertEqual(self.__get_backup_rows_count(backup_path, "data1"), 100)
+        self.assertFalse(os.path.exists("/tmp/charts_backup.db.gz.tmp"))
+
+    def test_backup_database_default_path(self):
+        self.init()
+
+        backup_path = self.module.backup_database()
+
+        self.assertTrue(
+            backup_path.startswith(os.path.join(Charts.DATABASE_PATH, "charts_"))
+        )
+        self.assertEqual(self.__get_backup_rows_count(backup_path, "devices"), 0)
+
+    def test_backup_database_already_running(self):
+        self.init()
+        self.module._backup_status["running"] = True
+
+        with self.assertRaises(CommandError) as cm:
+            self.module.backup_database("/tmp/charts_backup.db")
+        self.assertEqual(cm.exception.message, "A backup is already running")
+
+    def test_backup_database_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.backup_database("/tmp/dummy/charts_backup.db")
+        self.assertEqual(
+            cm.exception.message,
+            'Backup directory of "/tmp/dummy/charts_backup.db" does not exist',
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.backup_database("/tmp/charts_backup.db", "true")
+        self.assertEqual(cm.exception.message, 'Parameter "compress" must be a bool')
+
+    def test_get_metrics(self):
+        self.init()
+        uuid = "123-456-789"
+        self.module._save_data(uuid, "test.test.test", [{"field": "test", "value": 1}])
+        self.module._save_data(uuid, "test.test.test", [{"field": "test", "value": 2}])
+        self.module.get_data(uuid, 0, int(time.time()))
+        self.module.purge_data(uuid, int(time.time()) + 1)
+        self.module._delete_device(uuid)
+
+        metrics = self.module.get_metrics()
+
+        self.assertEqual(metrics["timings"]["save_data.lookup"]["count"], 2)
+        self.assertEqual(metrics["timings"]["save_data.insert"]["count"], 2)
+        self.assertEqual(metrics["timings"]["save_data.commit"]["count"], 2)
+        for name in (
+            "get_data.query",
+            "get_data.fetch",
+            "get_data.average",
+            "get_data.format",
+            "purge_data",
+            "delete_device",
+        ):
+            self.assertEqual(metrics["timings"][name]["count"], 1, name)
+        self.assertEqual(
+            metrics["counters"],
+            {"rows.inserted": 2, "rows.fetched": 2, "rows.deleted": 2},
+        )
+        self.assertEqual(metrics["database"]["size"], os.path.getsize(self.db_path))
+
+    def test_get_metrics_reset(self):
+        self.init()
+        self.module._save_data(
+            "uuid", "test.test.test", [{"field": "test", "value": 1}]
+        )
+
+        self.module.get_metrics(True)
+        metrics = self.module.get_metrics()
+
+        self.assertEqual(metrics["timings"], {})
+        self.assertEqual(metrics["counters"], {})
+
+    def test_set_metrics_log_interval(self):
+        self.init()
+        self.module.logger.info = Mock()
+
+        self.assertTrue(self.module.set_metrics_log_interval(1))
+        self.assertEqual(self.module._get_config_field("metrics_log_interval"), 1)
+        self.assertIsNotNone(self.module._metrics_task)
+        self.module._log_metrics()
+        self.module.logger.info.assert_called()
+
+        self.assertTrue(self.module.set_metrics_log_interval(0))
+        self.assertIsNone(self.module._metrics_task)
+
+    def test_set_metrics_log_interval_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_metrics_log_interval(None)
+        self.assertEqual(cm.exception.message, 'Parameter "interval" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_metrics_log_interval(-1)
+        self.assertEqual(
+            cm.exception.message, 'Parameter "interval" must be a positive integer'
+        )
+
+    def test_slow_queries(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start + i, uuid, i) for i in range(10)])
+        self.module.get_data(uuid, start, start + 10)
+        self.assertEqual(self.module.get_slow_queries(), [])
+
+        self.assertTrue(self.module.set_slow_query_threshold(0.000001))
+        self.module.get_data(uuid, start, start + 10, {"average": False})
+        self.module.purge_data(uuid, start + 5)
+
+        slow_queries = self.module.get_slow_queries()
+        self.assertEqual(len(slow_queries), 2)
+        self.assertTrue(slow_queries[0]["query"].startswith("SELECT timestamp,value1"))
+        self.assertEqual(slow_queries[0]["params"], [uuid, start, start + 10])
+        self.assertEqual(slow_queries[0]["rows"], 10)
+        self.assertGreater(slow_queries[0]["duration_ms"], 0)
+        self.assertTrue(
+            any("data1" in detail for detail in slow_queries[0]["plan"]),
+            slow_queries[0]["plan"],
+        )
+        self.assertTrue(slow_queries[1]["query"].startswith("DELETE FROM data1"))
+        self.assertEqual(slow_queries[1]["rows"], 5)
+
+    def test_slow_queries_ring_buffer(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start, uuid, 1)])
+        self.module.set_slow_query_threshold(0.000001)
+
+        for _ in range(Charts.SLOW_QUERIES_SIZE + 5):
+            self.module.get_data(uuid, start, start)
+
+        self.assertEqual(len(self.module.get_slow_queries()), Charts.SLOW_QUERIES_SIZE)
+
+    def test_slow_queries_do_not_read_config(self):
+        self.init()
+        start = int(time.time())
+        uuid = "123-456-789"
+        self.__fill_data_table("data1", [(start, uuid, 1)])
+        self.module.set_slow_query_threshold(0.000001)
+        self.module._get_config_field = Mock()
+
+        self.module.get_data(uuid, start, start)
+
+        self.module._get_config_field.assert_not_called()
+        self.assertEqual(len(self.module.get_slow_queries()), 1)
+
+    def test_set_slow_query_threshold_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_slow_query_threshold(None)
+        self.assertEqual(cm.exception.message, 'Parameter "threshold" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_slow_query_threshold(-1)
+        self.assertEqual(
+            cm.exception.message, 'Parameter "threshold" must be a positive number'
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_slow_query_threshold("1")
+        self.assertEqual(
+            cm.exception.message, 'Parameter "threshold" must be a positive number'
+        )
+
+    def test_get_storage_report(self):
+        self.init()
+        self.module._save_data(
+            "uuid1", "test.test.test", [{"field": "test", "value": 1}]
+        )
+        self.module._save_data(
+            "uuid1", "test.test.test", [{"field": "test", "value": 2}]
+        )
+        self.module._save_data(
+            "uuid2",
+            "test.test.test",
+            [{"field": "test1", "value": 1}, {"field": "test2", "value": 1}],
+        )
+        self.cur.execute(
+            "UPDATE storage SET firsttimestamp=lasttimestamp-3600 WHERE uuid='uuid1'"
+        )
+        self.cnx.commit()
+
+        report = self.module.get_storage_report()
+
+        self.assertEqual(report["database_size"], os.path.getsize(self.db_path))
+        self.assertEqual(len(report["devices"]), 2)
+        device = report["devices"][0]
+        self.assertEqual(device["uuid"], "uuid1")
+        self.assertEqual(device["event"], "test.test.test")
+        self.assertEqual(device["rows"], 2)
+        self.assertEqual(device["span"], 3600)
+        self.assertEqual(device["last_timestamp"] - device["first_timestamp"], 3600)
+        self.assertEqual(
+            device["estimated_bytes"], 2 * (Charts.ROW_OVERHEAD_SIZE + 10 + 8)
+        )
+        self.assertEqual(device["ingest_rate"], 2.0)
+        device = report["devices"][1]
+        self.assertEqual(device["uuid"], "uuid2")
+        self.assertEqual(device["rows"], 1)
+        self.assertEqual(device["span"], 0)
+        self.assertIsNone(device["ingest_rate"])
+
+    def test_get_storage_report_after_purge_and_delete(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid1", i) for i in range(10)])
+        self.__fill_data_table("data1", [(start + i, "uuid2", i) for i in range(10)])
+        self.cur.execute(
+            "INSERT INTO storage VALUES ('uuid1', 10, ?, ?), ('uuid2', 10, ?, ?)",
+            (start, start + 9, start, start + 9),
+        )
+        self.cnx.commit()
+
+        self.module.purge_data("uuid1", start + 4)
+        self.module._delete_device("uuid2")
+
+        devices = self.module.get_storage_report()["devices"]
+        self.assertEqual(len(devices), 1)
+        self.assertEqual(devices[0]["rows"], 6)
+        self.assertEqual(devices[0]["first_timestamp"], start + 4)
+        self.assertEqual(devices[0]["last_timestamp"], start + 9)
+        self.assertEqual(self.__get_table_count("storage"), 1)
+
+    def test_get_storage_report_save_after_full_purge(self):
+        self.init()
+        values = [{"field": "test", "value": 1}]
+        for timestamp in (1000, 1010):
+            self.module._save_data("uuid1", "test.test.test", values, timestamp)
+        self.module.purge_data("uuid1", 2000)
+        for timestamp in (3000, 3010, 3020):
+            self.module._save_data("uuid1", "test.test.test", values, timestamp)
+
+        devices = self.module.get_storage_report()["devices"]
+        self.assertEqual(devices[0]["rows"], 3)
+        self.assertEqual(devices[0]["first_timestamp"], 3000)
+        self.assertEqual(devices[0]["last_timestamp"], 3020)
+        self.assertEqual(self.module._estimate_range("uuid1", 0, 4000), (3, 3000, 3020))
+
+    def test_get_storage_report_after_import(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data1", [(start + i, "uuid1", i) for i in range(10)])
+        archive_path = self.__make_archive()
+        self.module._delete_device("uuid1")
+
+        self.module.import_data(archive_path)
+
+        devices = self.module.get_storage_report()["devices"]
+        self.assertEqual(devices[0]["rows"], 10)
+        self.assertEqual(devices[0]["first_timestamp"], start)
+        self.assertEqual(devices[0]["last_timestamp"], start + 9)
+        self.cur.execute("SELECT SUM(rowscount) FROM hourlycounts WHERE uuid='uuid1'")
+        self.assertEqual(self.cur.fetchone()[0], 10)
+
+    def test_migrate_database_storage(self):
+        self.init()
+        start = int(time.time())
+        self.__fill_data_table("data2", [(start + i, "uuid1", i, i) for i in range(10)])
+        self.cur.execute("DROP TABLE storage")
+        self.cnx.commit()
+
+        self.session.start_module(self.module)
+
+        devices = self.module.get_storage_report()["devices"]
+        self.assertEqual(devices[0]["uuid"], "uuid1")
+        self.assertEqual(devices[0]["rows"], 10)
+        self.assertEqual(devices[0]["first_timestamp"], start)
+        self.assertEqual(devices[0]["last_timestamp"], start + 9)
+
+    def test_set_ingestion_policy(self):
+        self.init()
+
+        self.assertTrue(self.module.set_ingestion_policy("uuid1", 0.5, 600))
+
+        self.assertEqual(
+            self.module._get_config_field("ingestion_policies"),
+            {"uuid1": {"deadband": 0.5, "max_interval": 600}},
+        )
+
+    def test_set_ingestion_policy_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_ingestion_policy(None)
+        self.assertEqual(cm.exception.message, 'Parameter "key" is missing')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_ingestion_policy("")
+        self.assertEqual(cm.exception.message, 'Parameter "key" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_ingestion_policy("uuid1", -1)
+        self.assertEqual(
+            cm.exception.message, 'Parameter "deadband" must be a positive number'
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_ingestion_policy("uuid1", "1")
+        self.assertEqual(
+            cm.exception.message, 'Parameter "deadband" must be a positive number'
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_ingestion_policy("uuid1", 0, 1.5)
+        self.assertEqual(
+            cm.exception.message, 'Parameter "max_interval" must be a positive integer'
+        )
+
+    def test_delete_ingestion_policy(self):
+        self.init()
+        self.module.set_ingestion_policy("uuid1")
+
+        self.assertTrue(self.module.delete_ingestion_policy("uuid1"))
+
+        self.assertEqual(self.module._get_config_field("ingestion_policies"), {})
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.delete_ingestion_policy("uuid1")
+        self.assertEqual(cm.exception.message, 'No ingestion policy for "uuid1"')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.delete_ingestion_policy(None)
+        self.assertEqual(cm.exception.message, 'Parameter "key" is missing')
+
+    def test_filter_values_without_policy(self):
+        self.init()
+        values = [{"field": "test", "value": 1}]
+
+        self.assertEqual(
+            self.module._filter_values("uuid1", "test.test.test", values, 100),
+            [(100, values)],
+        )
+        self.assertEqual(
+            self.module._filter_values("uuid1", "test.test.test", values, 101),
+            [(101, values)],
+        )
+
+    def test_filter_values_deduplication(self):
+        self.init()
+        self.module.set_ingestion_policy("test.test.test")
+        value1 = [{"field": "test", "value": 1}]
+        value2 = [{"field": "test", "value": 2}]
+
+        result = [
+            self.module._filter_values("uuid1", "test.test.test", value1, 100),
+            self.module._filter_values("uuid1", "test.test.test", value1, 110),
+            self.module._filter_values("uuid1", "test.test.test", value1, 120),
+            self.module._filter_values("uuid1", "test.test.test", value2, 130),
+            self.module._filter_values("uuid1", "test.test.test", value2, 140),
+        ]
+
+        # last skipped value is stored before changed value
+        self.assertEqual(
+            result,
+            [
+                [(100, value1)],
+                [],
+                [],
+                [(120, value1), (130, value2)],
+                [],
+            ],
+        )
+        self.assertEqual(self.module.get_metrics()["counters"]["rows.skipped"], 3)
+
+    def test_filter_values_deadband(self):
+        self.init()
+        self.module.set_ingestion_policy("uuid1", 0.5)
+        self.module.set_ingestion_policy("test.test.test", 10)
+
+        self.module._filter_values(
+            "uuid1", "test.test.test", [{"field": "test", "value": 20.0}], 100
+        )
+        result = [
+            self.module._filter_values(
+                "uuid1", "test.test.test", [{"field": "test", "value": 20.5}], 110
+            ),
+            self.module._filter_values(
+                "uuid1", "test.test.test", [{"field": "test", "value": 20.6}], 120
+            ),
+        ]
+
+        # device policy has precedence over event one
+        self.assertEqual(result[0], [])
+        self.assertEqual(
+            result[1],
+            [
+                (110, [{"field": "test", "value": 20.5}]),
+                (120, [{"field": "test", "value": 20.6}]),
+            ],
+        )
+
+    def test_filter_values_max_interval(self):
+        self.init()
+        self.module.set_ingestion_policy("uuid1", 0, 60)
+        values = [{"field": "test", "value": "on"}]
+
+        result = [
+            self.module._filter_values("uuid1", "test.test.test", values, 100),
+            self.module._filter_values("uuid1", "test.test.test", values, 130),
+            self.module._filter_values("uuid1", "test.test.test", values, 160),
+            self.module._filter_values("uuid1", "test.test.test", values, 170),
+        ]
+
+        self.assertEqual(result, [[(100, values)], [], [(160, values)], []])
+
+    def test_filter_values_delete_device(self):
+        self.init()
+        self.module.set_ingestion_policy("uuid1")
+        values = [{"field": "test", "value": 1}]
+        self.module._save_data("uuid1", "test.test.test", values)
+        self.module._filter_values("uuid1", "test.test.test", values, 100)
+
+        self.module._delete_device("uuid1")
+
+        self.assertEqual(
+            self.module._filter_values("uuid1", "test.test.test", values, 110),
+            [(110, values)],
+        )
+
+    @patch("backend.charts.time.time")
+    def test_on_event_ingestion_policy(self, time_mock):
+        self.init()
+        self.module.set_ingestion_policy("test.test.test")
+        uuid = "123-456-789"
+        event = {
+            "event": "test.test.test",
+            "params": {},
+            "startup": False,
+            "device_id": uuid,
+            "from": "test",
+        }
+        for timestamp, value in ((100, 1), (110, 1), (120, 1), (130, 2)):
+            time_mock.return_value = timestamp
+            fake_event = FakeEvent([{"field": "test", "value": value}])
+            self.module.events_broker.get_event_instance = Mock(return_value=fake_event)
+            self.module.on_event(event)
+
+        rows = self.__get_table_rows("data1", uuid)
+        self.assertEqual(
+            [(row[1], row[3]) for row in rows], [(100, 1), (120, 1), (130, 2)]
+        )
+        self.cur.execute("SELECT rowscount, lasttimestamp FROM storage")
+        self.assertEqual(self.cur.fetchone(), (3, 130))
+
+    def test_set_rate_limit(self):
+        self.init()
+
+        self.assertTrue(self.module.set_rate_limit("uuid1", 10, "mean"))
+
+        self.assertEqual(
+            self.module._get_config_field("rate_limits"),
+            {"uuid1": {"min_interval": 10, "aggregation": "mean"}},
+        )
+
+    def test_set_rate_limit_invalid_parameters(self):
+        self.init()
+
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_rate_limit(None, 10)
+        self.assertEqual(cm.exception.message, 'Parameter "key" is missing')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.set_rate_limit("uuid1", None)
+        self.assertEqual(cm.exception.message, 'Parameter "min_interval" is missing')
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_rate_limit("uuid1", 0)
+        self.assertEqual(
+            cm.exception.message,
+            'Parameter "min_interval" must be a strictly positive integer',
+        )
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.set_rate_limit("uuid1", 10, "median")
+        self.assertEqual(
+            cm.exception.message,
+            "Parameter \"aggregation\" must be one of ['last', 'mean', 'min', 'max']",
+        )
+
+    def test_delete_rate_limit(self):
+        self.init()
+        self.module.set_rate_limit("uuid1", 10)
+
+        self.assertTrue(self.module.delete_rate_limit("uuid1"))
+
+        self.assertEqual(self.module._get_config_field("rate_limits"), {})
+        with self.assertRaises(InvalidParameter) as cm:
+            self.module.delete_rate_limit("uuid1")
+        self.assertEqual(cm.exception.message, 'No rate limit for "uuid1"')
+        with self.assertRaises(MissingParameter) as cm:
+            self.module.delete_rate_limit("")
+        self.assertEqual(cm.exception.message, 'Parameter "key" is missing')
+
+    def test_aggregate_values(self):
+        self.init()
+        rows = {}
+        for aggregation in ("last", "mean", "min", "max"):
+            uuid = f"uuid-{aggregation}"
+            rate_limit = {"min_interval": 10, "aggregation": aggregation}
+            for timestamp, value in ((100, 4), (102, 1), (105, 7)):
+                self.module._aggregate_values(
+                    uuid,
+                    "test.test.test",
+                    [
+                        {"field": "test", "value": value},
+                        {"field": "on", "value": value == 1},
+                    ],
+                    timestamp,
+                    rate_limit,
+                )
+            self.module._flush_aggregated_values(109)
+            self.assertEqual(self.__get_table_count("data2", uuid), 0)
+            self.module._flush_aggregated_values(110)
+            rows[aggregation] = [
+                (row[1], row[3], row[4]) for row in self.__get_table_rows("data2", uuid)
+            ]
+
+        # bool value is always aggregated with last
+        self.assertEqual(rows["last"], [(105, 7, 0)])
+        self.assertEqual(rows["mean"], [(105, 4, 0)])
+        self.assertEqual(rows["min"], [(105, 1, 0)])
+        self.assertEqual(rows["max"], [(105, 7, 0)])
+        self.assertEqual(self.module.get_metrics()["counters"]["rows.aggregated"], 8)
+
+    def test_aggregate_values_missing_values(self):
+        self.init()
+        rows = {}
+        for aggregation in ("last", "mean", "min", "max"):
+            uuid = f"uuid-{aggregation}"
+            rate_limit = {"min_interval": 10, "aggregation": aggregation}
+            for timestamp, value in ((100, None), (102, 2), (103, None), (105, 4)):
+                self.module._aggregate_values(
+                    uuid,
+                    "test.test.test",
+                    [{"field": "test", "value": value}],
+                    timestamp,
+                    rate_limit,
+                )
+            self.module._flush_aggregated_values(110)
+            rows[aggregation] = [
+                (row[1], row[3]) for row in self.__get_table_rows("data1", uuid)
+            ]
+
+        # missing values are not aggregated
+        self.assertEqual(rows["last"], [(105, 4)])
+        self.assertEqual(rows["mean"], [(105, 3)])
+        self.assertEqual(rows["min"], [(105, 2)])
+        self.assertEqual(rows["max"], [(105, 4)])
+
+    @patch("backend.charts.time.time")
+    def test_on_event_rate_limit(self, time_mock):
+        self.init()
+        self.module.set_rate_limit("test.test.test", 10, "max")
+        uuid = "123-456-789"
+        event = {
+            "event": "test.test.test",
+            "params": {},
+            "startup": False,
+            "device_id": uuid,
+            "from": "test",
+        }
+        for timestamp, value in ((100, 1), (101, 3), (102, 2), (110, 5), (111, 4)):
+            time_mock.return_value = timestamp
+            fake_event = FakeEvent([{"field": "test", "value": value}])
+            self.module.events_broker.get_event_instance = Mock(return_value=fake_event)
+            self.module.on_event(event)
+
+        rows = self.__get_table_rows("data1", uuid)
+        self.assertEqual([(row[1], row[3]) for row in rows], [(102, 3)])
+
+        # pending values are stored when querying data after interval
+        time_mock.return_value = 120
+        data = self.module.get_data(uuid, 0, 200, {"output": "list"})
+        self.assertEqual(data["data"]["test"]["values"], [(102, 3), (111, 5)])
+
+    @patch("backend.charts.time.time")
+    def test_on_event_rate_limit_stored_on_stop(self, time_mock):
+        self.init()
+        self.module.set_rate_limit("test.test.test", 10)
+        time_mock.return_value = 100
+        event = {
+            "event": "test.test.test",
+            "params": {},
+            "startup": False,
+            "device_id": "uuid1",
+            "from": "test",
+        }
+        fake_event = FakeEvent([{"field": "test", "value": 1}])
+        self.module.events_broker.get_event_instance = Mock(return_value=fake_event)
+        self.module.on_event(event)
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 0)
+
+        self.module._on_stop()
+
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 1)
+
+    @patch("backend.charts.time.time")
+    def test_on_event_rate_limit_stored_by_flush_task(self, time_mock):
+        self.init()
+        self.module.set_rate_limit("test.test.test", 10)
+        time_mock.return_value = 100
+        event = {
+            "event": "test.test.test",
+            "params": {},
+            "startup": False,
+            "device_id": "uuid1",
+            "from": "test",
+        }
+        fake_event = FakeEvent([{"field": "test", "value": 1}])
+        self.module.events_broker.get_event_instance = Mock(return_value=fake_event)
+        self.module.on_event(event)
+        self.assertTrue(self.module._flush_task.is_running())
+
+        # device is quiet: values are stored once interval is elapsed
+        time_mock.return_value = 105
+        self.module._flush_aggregated_values_task()
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 0)
+        time_mock.return_value = 110
+        self.module._flush_aggregated_values_task()
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 1)
+
+    @patch.object(Charts, "FLUSH_DATABASE_TIMEOUT", 0.1)
+    def test_flush_task_keeps_values_if_database_locked(self):
+        self.init()
+        self.module._aggregate_values(
+            "uuid1",
+            "test.test.test",
+            [{"field": "test", "value": 3}],
+            100,
+            {"min_interval": 10, "aggregation": "last"},
+        )
+
+        # module transaction is not committed by flush task
+        self.module._cur.execute("BEGIN")
+        self.module._cur.execute(
+            "INSERT INTO data1(timestamp, uuid, value1) VALUES(?,?,?)", (50, "uuid2", 1)
+        )
+        self.module._flush_aggregated_values_task()
+        self.module._cnx.rollback()
+
+        self.assertEqual(self.__get_table_count("data1"), 0)
+        self.module._flush_aggregated_values_task()
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 1)
+        self.assertEqual(self.__get_table_count("data1", "uuid2"), 0)
+
+    @patch("backend.charts.time.time")
+    def test_get_stats_stores_rate_limited_values(self, time_mock):
+        self.init()
+        self.module.set_rate_limit("uuid1", 10)
+        self.module._aggregate_values(
+            "uuid1",
+            "test.test.test",
+            [{"field": "test", "value": 3}],
+            100,
+            {"min_interval": 10, "aggregation": "last"},
+        )
+        self.module._save_data(
+            "uuid1", "test.test.test", [{"field": "test", "value": 1}], 90
+        )
+        time_mock.return_value = 120
+
+        stats = self.module.get_stats("uuid1", 0, 200)
+
+        self.assertEqual(stats["stats"]["test"]["count"], 2)
+
+    def test_on_event_does_not_read_config(self):
+        self.init()
+        self.module.set_rate_limit("other.event.name", 10)
+        self.module.set_ingestion_policy("other.event.name", 1)
+        event = {
+            "event": "test.test.test",
+            "params": {},
+            "startup": False,
+            "device_id": "uuid1",
+            "from": "test",
+        }
+        fake_event = FakeEvent([{"field": "test", "value": 1}])
+        self.module.events_broker.get_event_instance = Mock(return_value=fake_event)
+        self.module._get_config_field = Mock()
+
+        self.module.on_event(event)
+
+        self.module._get_config_field.assert_not_called()
+        self.assertEqual(self.__get_table_count("data1", "uuid1"), 1)
+
     def test_on_event(self):
         self.init()
         uuid = "123-456-789"
@@ -0,0 +1,82 @@
+import unittest
+import logging
+import sys
+
+sys.path.append("../")
+from backend.chartsmetrics import ChartsMetrics
+from cleep.libs.tests.common import get_log_level
+
+LOG_LEVEL = get_log_level()
+
+
+class TestChartsMetrics(unittest.TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            level=LOG_LEVEL,
+            format="%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s",
+        )
+        self.metrics = ChartsMetrics()
+
+    def test_record(self):
+        self.metrics.record("test", 2.0)
+        self.metrics.record("test", 20.0)
+        self.metrics.record("test", 8000.0)
+
+        timing = self.metrics.get_metrics()["timings"]["test"]
+        self.assertEqual(timing["count"], 3)
+        self.assertEqual(timing["total_ms"], 8022.0)
+        self.assertEqual(timing["mean_ms"], 2674.0)
+        self.assertEqual(timing["min_ms"], 2.0)
+        self.assertEqual(timing["max_ms"], 8000.0)
+        self.assertEqual(
+            timing["histogram"],
+            {
+                "<=1": 0,
+                "<=5": 1,
+                "<=10": 0,
+                "<=50": 1,
+                "<=100": 0,
+                "<=500": 0,
+                "<=1000": 0,
+                "<=5000": 0,
+                ">5000": 1,
+            },
+        )
+
+    def test_timer(self):
+        with self.metrics.timer("test"):
+            pass
+
+        timing = self.metrics.get_metrics()["timings"]["test"]
+        self.assertEqual(timing["count"], 1)
+        self.assertEqual(timing["histogram"]["<=1"], 1)
+
+    def test_timer_exception(self):
+        with self.assertRaises(Exception):
+            with self.metrics.timer("test"):
+                raise Exception("Test")
+
+        self.assertEqual(self.metrics.get_metrics()["timings"]["test"]["count"], 1)
+
+    def test_increment(self):
+        self.metrics.increment("test")
+        self.metrics.increment("test", 10)
+
+        self.assertEqual(self.metrics.get_metrics()["counters"], {"test": 11})
+
+    def test_get_metrics_reset(self):
+        self.metrics.record("test", 2.0)
+        self.metrics.increment("test")
+
+        metrics = self.metrics.get_metrics(reset=True)
+        self.assertEqual(metrics["timings"]["test"]["count"], 1)
+        self.assertEqual(metrics["counters"]["test"], 1)
+
+        metrics = self.metrics.get_metrics()
+        self.assertEqual(metrics["timings"], {})
+        self.assertEqual(metrics["counters"], {})
+
+
+if __name__ == "__main__":
+    # coverage run --omit="*lib/python*/*","test_*" --concurrency=thread test_chartsmetrics.py; coverage report -m -i
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import logging
+import sys
+
+sys.path.append("../")
+from backend.chartsprocessing import average_data
+from cleep.libs.tests.common import get_log_level
+import numpy
+
+LOG_LEVEL = get_log_level()
+
+
+class TestChartsProcessing(unittest.TestCase):
+    def setUp(self):
+        logging.basicConfig(
+            level=LOG_LEVEL,
+            format="%(asctime)s %(name)s:%(lineno)d %(levelname)s : %(message)s",
+        )
+
+    def test_average_data_partial_group_and_none_values(self):
+        data = [
+            (0, 10, None),
+            (10, 20, 1),
+            (20, 30, None),
+            (30, None, None),
+            (40, 50, 5),
+        ]
+        result = average_data(data, 2, 2)
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0], [5.0, 15.0, 1.0])
+        self.assertEqual(result[1][:2], [25.0, 30.0])
+        self.assertTrue(numpy.isnan(result[1][2]))
+        self.assertEqual(result[2], [40.0, 50.0, 5.0])
+
+    def test_average_data_time_weighted(self):
+        data = [(0, 10), (10, 20), (40, 30), (50, 40)]
+        self.assertEqual(
+            average_data(data, 1, 2, True, 60), [[5.0, 17.5], [45.0, 35.0]]
+        )
+        self.assertEqual(average_data(data, 1, 2), [[5.0, 15.0], [45.0, 35.0]])
+
+
+if __name__ == "__main__":
+    # coverage run --omit="*lib/python*/*","test_*" --concurrency=thread test_chartsprocessing.py; coverage report -m -i
+    unittest.main()